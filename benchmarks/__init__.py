@@ -0,0 +1,12 @@
+"""
+Benchmarks
+=====================================
+
+Those scripts measure the performance of the dashboard and of the deploying scripts.
+They are not run by the tests, use the make command to run them ::
+
+    make benchmarks
+
+Each benchmark uses the real dataset (``data/``) if it is present, and otherwise a synthetic
+dataset of the same shape (see :mod:`benchmarks.common`).
+"""
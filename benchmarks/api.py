@@ -0,0 +1,75 @@
+"""
+Scoring endpoint benchmark: throughput (queries per second) of a batch of queries answered
+by sequential calls of :meth:`~carsreco.prediction.IntervalPricePrediction.get_CI`, by
+:func:`carsreco.api.score` (the queries scored together), and by ``POST /api/score``
+(the same, with the json of the request and of the streamed response).
+
+A third of the queries have a range of years, and two thirds have 1 or 2 manufacturers.
+
+Usage: ::
+
+    python -m benchmarks.api [--queries N [N ...]] [--models N]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+
+import flask
+import numpy as np
+import pandas as pd
+
+from carsreco import api
+from carsreco.prediction import IntervalPricePrediction
+from .common import FULL_SIZE, synthetic_raw, timer, report
+from .prediction import queries
+
+
+def batch(n: int) -> dict:
+    """the body of a request of ``n`` queries"""
+    p1, p2, brands = queries(n)
+    rng = np.random.default_rng(1)
+    first = rng.integers(1990, 2021, n)
+    years = [[int(year), int(year) + int(length)] if i % 3 == 1 else None
+             for i, (year, length) in enumerate(zip(first, rng.integers(0, 10, n)))]
+    return {"queries": [{"price": [query_p1, query_p2], "brands": [str(brand) for brand in query_brands],
+                         **({"years": query_years} if query_years else {})}
+                        for query_p1, query_p2, query_brands, query_years in zip(p1, p2, brands, years)]}
+
+
+def run(model: IntervalPricePrediction, n: int) -> dict:
+    """queries per second of the three paths, for a batch of ``n`` queries"""
+    payload = batch(n)
+    queries = api.Queries.from_json(payload)
+    server = flask.Flask(__name__)
+    api.register_api(server, model)
+    client = server.test_client()
+    # the year ranges are computed once per worker (see carsreco.prediction.YearStrata)
+    list(api.score(model, queries))
+    times = {}
+    with timer(times, "sequential get_CI"):
+        for query in range(n):
+            model.get_CI(queries.p1[query], queries.p2[query], queries.brands[query],
+                         years=queries.years[query])
+    with timer(times, "api.score"):
+        list(api.score(model, queries))
+    with timer(times, "POST /api/score"):
+        assert len(client.post("/api/score", json=payload).get_data().splitlines()) == n
+    return {f"{name} (queries/s)": n / time for name, time in times.items()}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, nargs="+", default=[100, 1000, 10_000],
+                        help="numbers of queries of a batch")
+    parser.add_argument("--models", type=int, default=50_000,
+                        help=f"numbers of car models of the synthetic dataset ({FULL_SIZE * 2} rows)")
+    arguments = parser.parse_args()
+    raw = synthetic_raw(FULL_SIZE * 2, n_models=arguments.models, zipf=1.05)
+    df = raw[['model', 'manufacturer', 'price', 'year']].assign(posting_date=pd.to_datetime(raw['posting_date']))
+    model = IntervalPricePrediction(df)
+    for n in arguments.queries:
+        report(f"Scoring {n} queries ({len(model.arrays.models)} models)", run(model, n), unit="")
+
+
+if __name__ == "__main__":
+    main()
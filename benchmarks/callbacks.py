@@ -0,0 +1,63 @@
+"""
+Callback benchmark: latency of the plots of the price trend callbacks, for a growing
+number of rows, when they aggregate the ``hv.Dataset`` on each call and when they look
+up the aggregates precomputed by :class:`carsreco.aggregates.PriceAggregates`.
+
+Usage: ::
+
+    python -m benchmarks.callbacks [--rows N [N ...]]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+import tempfile
+
+from carsreco import data
+from carsreco.aggregates import PriceAggregates
+from carsreco.interactive_plots import price_trendency_plot, price_tredency_plot_given
+from scripts.preprocessing import preprocess
+from .common import FULL_SIZE, synthetic_raw, timer, report
+
+#: the (plot, arguments) timed, as the callbacks call them
+CALLS = [(price_trendency_plot, ("state",)), (price_trendency_plot, ("manufacturer",)),
+         (price_trendency_plot, ("year",)), (price_tredency_plot_given, ("state", "CA")),
+         (price_tredency_plot_given, ("manufacturer", "ford"))]
+
+
+def synthetic_data(rows: int):
+    """the preprocessed synthetic dataset"""
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_file, csv_file = Path(tmp) / "raw.csv", Path(tmp) / "preprocessed.csv"
+        synthetic_raw(rows).to_csv(raw_file)
+        preprocess(raw_file, csv_file)
+        return data.read_csv_data(csv_file)
+
+
+def run(df, repeat: int=3) -> dict:
+    """mean latency of :data:`CALLS` (best of ``repeat``), and the time to precompute the aggregates"""
+    results = {}
+    with timer(results, "precompute aggregates"):
+        aggregates = PriceAggregates(df)
+    for name, edata in [("hv.Dataset", data.interactive_plots_preprocess(df)),
+                        ("PriceAggregates", aggregates)]:
+        times = {}
+        for i in range(repeat):
+            with timer(times, i):
+                for plot, arguments in CALLS:
+                    plot(edata, *arguments)
+        results[f"callback ({name})"] = min(times.values()) / len(CALLS)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[FULL_SIZE // 16, FULL_SIZE // 4, FULL_SIZE],
+                        help="rows of the synthetic datasets")
+    arguments = parser.parse_args()
+    for rows in arguments.rows:
+        report(f"Price trend callbacks ({rows} rows)", run(synthetic_data(rows)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Helpers shared by the benchmarks
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+import time
+
+import numpy as np
+import pandas as pd
+
+#: approximate number of rows of the craigslist dataset
+FULL_SIZE = 400_000
+
+MANUFACTURERS = ['ford', 'chevrolet', 'toyota', 'honda', 'nissan', 'jeep', 'ram', 'gmc',
+                 'bmw', 'dodge', 'mercedes-benz', 'hyundai', 'subaru', 'volkswagen', 'kia',
+                 'lexus', 'audi', 'cadillac', 'chrysler', 'acura', 'buick', 'mazda', 'infiniti',
+                 'lincoln', 'volvo', 'mitsubishi', 'mini', 'pontiac', 'rover', 'jaguar']
+STATES = ['ca', 'fl', 'tx', 'ny', 'oh', 'mi', 'or', 'wa', 'pa', 'nc', 'wi', 'tn', 'co', 'il',
+          'va', 'id', 'nj', 'az', 'ia', 'ma', 'mn', 'ga', 'ok', 'sc', 'ks', 'in', 'al', 'ky',
+          'mt', 'mo', 'ar', 'ct', 'md', 'nm', 'la', 'ak', 'nv', 'nh', 'me', 'vt', 'hi', 'ri',
+          'sd', 'ut', 'ms', 'de', 'wv', 'ne', 'dc', 'nd', 'wy']
+
+
+def synthetic_raw(rows: int=FULL_SIZE, n_models: int=2000, seed: int=0, zipf: float=1.3) -> pd.DataFrame:
+    """Generates a dataframe shaped like ``data/vehicles_cleaned_imputed.csv``
+
+    Args:
+        rows: number of rows
+        n_models: number of distinct car models (their frequency follows a zipf law)
+        seed: random seed
+        zipf: the exponent of the zipf law (the closer to 1, the more rare models)
+
+    Returns:
+        pd.DataFrame: the synthetic dataset (the index is the id column)
+    """
+    rng = np.random.default_rng(seed)
+    model_rank = np.minimum(rng.zipf(zipf, rows), n_models) - 1
+    model_brand = rng.integers(0, len(MANUFACTURERS), n_models)
+    manufacturer = np.asarray(MANUFACTURERS)[model_brand[model_rank]]
+    model = np.char.add(manufacturer.astype(str), np.char.add(" m", model_rank.astype(str)))
+    state = np.asarray(STATES)[rng.integers(0, len(STATES), rows)]
+    year = rng.integers(1990, 2022, rows)
+    price = np.round(rng.lognormal(9.5, 0.8, rows) * (year - 1985) / 20)
+    price[rng.random(rows) < 0.05] = 0
+    dates = (pd.Timestamp("2021-04-04", tz="US/Pacific") 
+             + pd.to_timedelta(rng.integers(0, 60 * 24 * 60, rows), unit="m"))
+
+    def choice(values):
+        return np.asarray(values, dtype=object)[rng.integers(0, len(values), rows)]
+
+    return pd.DataFrame({
+        "url": [f"https://craigslist.org/{i}.html" for i in range(rows)],
+        "region": np.char.add(state.astype(str), " region"),
+        "region_url": np.char.add("https://", np.char.add(state.astype(str), ".craigslist.org")),
+        "price": price,
+        "year": year,
+        "manufacturer": manufacturer,
+        "model": model,
+        "condition": choice(['good', 'excellent', 'like new', 'fair']),
+        "cylinders": choice(['4 cylinders', '6 cylinders', '8 cylinders']),
+        "fuel": choice(['gas', 'diesel', 'hybrid', 'electric', 'other']),
+        "odometer": np.round(rng.exponential(90000, rows)),
+        "title_status": choice(['clean', 'rebuilt', 'salvage', 'lien']),
+        "transmission": choice(['automatic', 'manual', 'other']),
+        "drive": choice(['4wd', 'fwd', 'rwd']),
+        "size": choice(['full-size', 'mid-size', 'compact']),
+        "type": choice(['sedan', 'SUV', 'pickup', 'truck', 'coupe', 'hatchback', 'wagon']),
+        "paint_color": choice(['white', 'black', 'silver', 'blue', 'red', 'grey']),
+        "state": state,
+        "posting_date": dates.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }, index=pd.RangeIndex(7_000_000_000, 7_000_000_000 + rows, name="id"))
+
+
+@contextmanager
+def timer(results: dict, name: str):
+    """measures the wall-clock time of a block into ``results[name]`` (seconds)"""
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
+
+
+def report(title: str, results: dict, unit: str="s") -> None:
+    """prints benchmark results as a small table"""
+    print(title)
+    print("-" * len(title))
+    width = max(len(k) for k in results)
+    for name, value in results.items():
+        print(f"{name:<{width}}  {value:10.4f} {unit}")
+    print()
@@ -0,0 +1,74 @@
+"""
+Figure benchmark: time to turn the plots of the dropdown callbacks into the json sent
+to the browser, through holoviews (the ``*_plot`` functions and ``to_dash``) and through
+the plotly figures built directly (the ``*_figure`` functions).
+
+Both paths read the same precomputed aggregates (see :class:`carsreco.aggregates.PriceAggregates`),
+so the difference is the cost of the conversion.
+
+Usage: ::
+
+    python -m benchmarks.figures [--rows N]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+import json
+
+import dash
+from dash import html
+from plotly.utils import PlotlyJSONEncoder
+
+from carsreco import interactive_plots
+from carsreco.aggregates import PriceAggregates
+from carsreco.dashboard import graph
+from .callbacks import synthetic_data
+from .common import timer, report
+
+#: name -> (holoviews plot, plotly figure, arguments)
+PLOTS = {
+    "price trend (state)": (interactive_plots.price_trendency_plot,
+                            interactive_plots.price_trendency_figure, ("state",)),
+    "price trend (year)": (interactive_plots.price_trendency_plot,
+                           interactive_plots.price_trendency_figure, ("year",)),
+    "count (manufacturer)": (interactive_plots.count_plot, interactive_plots.count_figure,
+                             ("manufacturer",)),
+    "price trend given (state, CA)": (interactive_plots.price_tredency_plot_given,
+                                      interactive_plots.price_trendency_figure_given, ("state", "CA")),
+}
+
+
+def serialize(children) -> str:
+    """the json of a plot div, as dash sends it"""
+    return json.dumps(html.Div(children).to_plotly_json(), cls=PlotlyJSONEncoder)
+
+
+def run(df, repeat: int=5) -> dict:
+    """time of each plot through both paths (best of ``repeat``)"""
+    from holoviews.plotting.plotly.dash import to_dash
+    app = dash.Dash(__name__)
+    aggregates = PriceAggregates(df)
+    results = {}
+    for name, (plot, figure, arguments) in PLOTS.items():
+        source = df if plot is interactive_plots.count_plot else aggregates
+        paths = {"holoviews + to_dash": lambda: to_dash(app, [plot(source, *arguments)]).children,
+                 "plotly": lambda: graph(figure(source, *arguments))}
+        for path, build in paths.items():
+            build() # the first call imports the modules
+            times = {}
+            for i in range(repeat):
+                with timer(times, i):
+                    serialize(build())
+            results[f"{name}, {path}"] = min(times.values()) * 1000
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the synthetic dataset")
+    arguments = parser.parse_args()
+    report(f"Plot to json ({arguments.rows} rows)", run(synthetic_data(arguments.rows)), unit="ms")
+
+
+if __name__ == "__main__":
+    main()
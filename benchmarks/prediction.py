@@ -0,0 +1,109 @@
+"""
+Prediction benchmark: latency of a call of
+:meth:`carsreco.prediction.IntervalPricePrediction.get_CI` (as the prediction callback
+calls it), and time to answer many price ranges with ``get_CI`` called in a loop, and
+with :meth:`~carsreco.prediction.IntervalPricePrediction.get_CI_batch`.
+
+The model keeps every car model: the latency, and the size of the statistics per year
+(see :class:`carsreco.prediction.YearStrata`, compared with a dense models x years
+layout) are also measured for growing catalogs of models (``--catalog``).
+
+Usage: ::
+
+    python -m benchmarks.prediction [--rows N] [--queries N] [--catalog N [N ...]]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from carsreco.prediction import IntervalPricePrediction
+from .callbacks import synthetic_data
+from .common import MANUFACTURERS, FULL_SIZE, synthetic_raw, timer, report
+
+
+def queries(n: int, seed: int=0):
+    """``n`` random price ranges, and their brands (a third of them without brands)"""
+    rng = np.random.default_rng(seed)
+    p1 = rng.uniform(0, 40000, n)
+    p2 = p1 + rng.uniform(500, 20000, n)
+    brands = [[] if i % 3 == 0 else list(rng.choice(MANUFACTURERS, i % 3)) for i in range(n)]
+    return p1, p2, brands
+
+
+def latency(model: IntervalPricePrediction, n_queries: int) -> dict:
+    """percentiles of the latency of a get_CI call (milliseconds), for all the cars
+    and for the cars of a range of years (as the year slider of the dashboard)"""
+    p1, p2, brands = queries(n_queries, seed=1)
+    with_brands = np.array([len(query_brands) > 0 for query_brands in brands])
+    results = {}
+    for years, suffix in [(None, ""), ((2005, 2015), ", years")]:
+        times = {}
+        for query in range(n_queries):
+            with timer(times, query):
+                model.get_CI(p1[query], p2[query], brands[query], years=years)
+        times = np.array(list(times.values())) * 1000
+        for name, selected in [("all brands", ~with_brands), ("1-2 brands", with_brands)]:
+            results.update({f"get_CI p{q} ({name}{suffix})": np.percentile(times[selected], q) 
+                            for q in [50, 90, 99]})
+    return results
+
+
+def catalog(n_models: int, rows: int, n_queries: int) -> dict:
+    """time to fit the model, and latency of get_CI, for a dataset of ``n_models`` car models
+
+    The frequencies of the models follow a zipf law with an exponent close to 1, so that
+    most of the models have a few posts.
+    """
+    raw = synthetic_raw(rows, n_models=n_models, zipf=1.05)
+    df = raw[['model', 'manufacturer', 'price', 'year']].assign(posting_date=pd.to_datetime(raw['posting_date']))
+    results = {}
+    with timer(results, "fit (s)"):
+        model = IntervalPricePrediction(df)
+    results["models"] = len(model.arrays.models)
+    strata = model.strata.to_arrays()
+    results["year strata (MB)"] = sum(array.nbytes for array in strata.values()) / 1e6
+    results["year strata, dense (MB)"] = 5 * 8 * len(model.arrays.models) * len(strata['years']) / 1e6
+    years = strata['years']
+    with timer(results, "parameters of a range of years (ms)"):
+        model.strata.arrays(years[0], years[len(years) // 2])
+    results["parameters of a range of years (ms)"] *= 1000
+    results.update({f"{name} (ms)": value for name, value in latency(model, n_queries).items()
+                    if "p50" in name or "p99" in name})
+    return results
+
+
+def run(df, n_queries: int) -> dict:
+    """time of the queries through the loop and the batch"""
+    results = {}
+    with timer(results, "model"):
+        model = IntervalPricePrediction(df)
+    p1, p2, brands = queries(n_queries)
+    with timer(results, "get_CI loop"):
+        for query in range(n_queries):
+            model.get_CI(p1[query], p2[query], brands[query])
+    with timer(results, "get_CI_batch"):
+        model.get_CI_batch(p1, p2, brands)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the synthetic dataset")
+    parser.add_argument("--queries", type=int, default=2000, help="number of price ranges")
+    parser.add_argument("--catalog", type=int, nargs="+", default=[1000, 10_000, 50_000],
+                        help=f"numbers of car models of the catalog benchmark ({FULL_SIZE * 2} rows)")
+    arguments = parser.parse_args()
+    df = synthetic_data(arguments.rows)
+    report(f"Prediction latency ({arguments.rows} rows)", 
+           latency(IntervalPricePrediction(df), arguments.queries), unit="ms")
+    report(f"Prediction of {arguments.queries} price ranges ({arguments.rows} rows)",
+           run(df, arguments.queries))
+    for n_models in arguments.catalog:
+        report(f"Catalog of {n_models} models", catalog(n_models, FULL_SIZE * 2, arguments.queries), unit="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Preprocessing benchmark: wall-clock time and peak memory (max rss) of 
+:func:`scripts.preprocessing.preprocess` in its different modes. The modes do not write the
+binary snapshot (``--no-snapshot``), which is needed for the memory of the chunked modes
+to stay bounded: the chunked mode is also measured with the snapshot, for comparison.
+
+Each mode runs in a fresh process, so that the peak memory of one does not hide the others.
+
+Usage: ::
+
+    python -m benchmarks.preprocessing [--rows N] [--chunksize N] [--jobs N] [--new-rows N]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pathlib import Path
+import resource
+import tempfile
+import time
+
+from scripts.preprocessing import preprocess, preprocess_incremental, snapshot
+from .common import FULL_SIZE, synthetic_raw, report, timer
+
+
+def _run(input_file, output_file, kwargs) -> tuple[float, float]:
+    """runs preprocess (and snapshot if ``kwargs["snapshot"]``), returns (time in s, max rss in MiB)"""
+    kwargs = dict(kwargs)
+    with_snapshot = kwargs.pop("snapshot", False)
+    start = time.perf_counter()
+    preprocess(input_file, output_file, **kwargs)
+    if with_snapshot:
+        snapshot(output_file, output_file.with_suffix(".npz"))
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(input_file: Path, modes: dict[str, dict], tmp: Path) -> tuple[dict, dict]:
+    """runs every mode in its own process, and checks that their outputs are identical"""
+    times, memory = {}, {}
+    outputs = []
+    for i, (name, kwargs) in enumerate(modes.items()):
+        output_file = tmp / f"output{i}.csv"
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            times[name], memory[name] = pool.submit(_run, input_file, output_file, kwargs).result()
+        outputs.append(output_file.read_bytes())
+    assert all(output == outputs[0] for output in outputs), "outputs differ"
+    return times, memory
+
+
+def run_incremental(raw, new_rows: int, tmp: Path) -> dict:
+    """times a full rebuild, and an incremental run after ``new_rows`` rows were appended"""
+    raw = raw.sort_values("posting_date", kind="stable")
+    input_file, output_file = tmp / "incremental_input.csv", tmp / "incremental_output.csv"
+    raw.iloc[:-new_rows].to_csv(input_file)
+    results = {}
+    with timer(results, "full rebuild"):
+        preprocess_incremental(input_file, output_file, snapshot_file=tmp / "incremental_output.npz")
+    with open(input_file, "a") as f:
+        raw.iloc[-new_rows:].to_csv(f, header=False)
+    with timer(results, f"incremental, {new_rows} new rows"):
+        preprocess_incremental(input_file, output_file, snapshot_file=tmp / "incremental_output.npz")
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=FULL_SIZE, help="rows of the synthetic dataset")
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--new-rows", type=int, default=5_000, 
+                        help="rows added before the incremental run")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = Path(tmp) / "input.csv"
+        raw = synthetic_raw(arguments.rows)
+        raw.to_csv(input_file)
+        modes = {"one-shot": {},
+                 f"chunksize={arguments.chunksize}": {"chunksize": arguments.chunksize},
+                 f"chunksize={arguments.chunksize}, with snapshot": 
+                    {"chunksize": arguments.chunksize, "snapshot": True},
+                 f"jobs={arguments.jobs}": {"jobs": arguments.jobs},
+                 f"jobs={arguments.jobs}, chunksize={arguments.chunksize}": 
+                    {"jobs": arguments.jobs, "chunksize": arguments.chunksize}}
+        times, memory = run(input_file, modes, Path(tmp))
+        incremental = run_incremental(raw, arguments.new_rows, Path(tmp))
+    report(f"Preprocessing time ({arguments.rows} rows)", times)
+    report(f"Preprocessing peak memory ({arguments.rows} rows)", memory, unit="MiB")
+    report(f"Incremental preprocessing, with snapshot ({arguments.rows} rows)", incremental)
+
+
+if __name__ == "__main__":
+    main()
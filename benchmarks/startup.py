@@ -0,0 +1,117 @@
+"""
+Startup benchmark:
+
+- import time of the modules of the package, each one in a fresh interpreter
+- time to load the dataframe with :func:`carsreco.data.get_data`,
+  from the csv and from the binary snapshot
+- time spent in each step of :func:`carsreco.dashboard.create_app`
+
+Usage: ::
+
+    python -m benchmarks.startup [--rows N] [--json FILE]
+
+``--json`` also writes the results to FILE, so they can be compared across releases.
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from carsreco import data
+from scripts.preprocessing import preprocess, snapshot
+from .common import FULL_SIZE, synthetic_raw, timer, report
+
+#: modules whose import time is measured, the last one is what the first plot imports
+MODULES = ["carsreco", "carsreco.data", "carsreco.interactive_plots", "carsreco.prediction",
+           "carsreco.layout", "carsreco.dashboard", "scripts.preprocessing",
+           "holoviews.plotting.plotly.dash"]
+
+
+def import_time(module: str, repeat: int=3) -> float:
+    """import time of ``module`` in a fresh interpreter (best of ``repeat``)"""
+    code = ("import time; start = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - start)")
+    root = Path(__file__).resolve().parent.parent
+    return min(float(subprocess.run([sys.executable, "-c", code], cwd=root, check=True, 
+                                    capture_output=True, text=True).stdout)
+               for _ in range(repeat))
+
+
+def create_app_time(csv_file: Path, snapshot_file: Path) -> dict:
+    """time spent in each step of :func:`carsreco.dashboard.create_app`
+
+    ``create_app`` reads ``data/``, so it is run from the directory containing it.
+    """
+    from carsreco.dashboard import create_app
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "data").mkdir()
+        os.symlink(csv_file.resolve(), Path(tmp) / data.DATA_PATH)
+        os.symlink(snapshot_file.resolve(), Path(tmp) / data.SNAPSHOT_PATH)
+        os.chdir(tmp)
+        try:
+            timings = {}
+            with timer(timings, "total"):
+                create_app(timings=timings)
+        finally:
+            os.chdir(cwd)
+    return timings
+
+
+def run(csv_file: Path, snapshot_file: Path, repeat: int=3) -> dict:
+    """times both loading paths (best of ``repeat``)"""
+    results = {}
+    for name, load in [("csv (read_csv_data)", lambda: data.read_csv_data(csv_file)),
+                       ("snapshot (get_data)", lambda: data.get_data(csv_file, snapshot_file))]:
+        times = {}
+        for i in range(repeat):
+            with timer(times, i):
+                df = load()
+        results[name] = min(times.values())
+    pd.testing.assert_frame_equal(data.read_csv_data(csv_file), data.get_data(csv_file, snapshot_file))
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=FULL_SIZE,
+                        help="rows of the synthetic dataset, if data/preprocessed.csv does not exist")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    arguments = parser.parse_args()
+
+    imports = {module: import_time(module) for module in MODULES}
+    report("Import time (fresh interpreter)", imports)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if data.DATA_PATH.exists():
+            csv_file = data.DATA_PATH
+            rows = "real dataset"
+        else:
+            raw_file = Path(tmp) / "raw.csv"
+            csv_file = Path(tmp) / "preprocessed.csv"
+            synthetic_raw(arguments.rows).to_csv(raw_file)
+            preprocess(raw_file, csv_file)
+            rows = f"{arguments.rows} synthetic rows"
+        snapshot_file = Path(tmp) / "preprocessed.npz"
+        results = {}
+        with timer(results, "write snapshot (deploy time)"):
+            snapshot(csv_file, snapshot_file)
+        results.update(run(csv_file, snapshot_file))
+        report(f"Dataframe loading ({rows})", results)
+        app = create_app_time(csv_file, snapshot_file)
+        report(f"create_app ({rows})", app)
+
+    if arguments.json is not None:
+        arguments.json.write_text(json.dumps({"rows": rows, "imports": imports, 
+                                              "loading": results, "create_app": app}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Wikipedia client benchmark: latency of the requests of a prediction callback (a search for
+each of its 10 models, and their thumbnails), with a new connection per request
+(``requests.get``, as the client used to do), with the pooled session of
+:mod:`carsreco.wikipedia_api`, and with the pooled session and the thumbnails of the 10
+pages in one request (see :meth:`carsreco.wikipedia_api.WikipediaPage.get_thumbnails`).
+
+The api is a local stand-in server: each new connection waits ``--handshake`` ms before
+it is served, as the TCP and TLS handshakes with wikipedia would, and each request waits
+``--delay`` ms.
+
+Usage: ::
+
+    python -m benchmarks.wikipedia [--handshake MS] [--delay MS] [--callbacks N]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+import requests
+
+from carsreco import wikipedia_api
+from .common import report
+
+#: the models of a callback
+MODELS_PER_CALLBACK = 10
+
+#: the answer of the stand-in api (a search with one result, and pages without thumbnails)
+ANSWER = json.dumps({"query": {"searchinfo": {"totalhits": 1}, "search": [{"title": "page"}],
+                               "pages": {}}}).encode()
+
+
+def stand_in_server(handshake: float, delay: float) -> ThreadingHTTPServer:
+    """a local http server (with keep-alive), started in a thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            time.sleep(handshake)
+            super().setup()
+            # the headers and the body are written separately: without it, the kept-alive
+            # connections would wait for the delayed acknowledgments of the client
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(ANSWER)))
+            self.end_headers()
+            self.wfile.write(ANSWER)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def unpooled_request(api_url, **parameters):
+    """the request of the client before the pooled session: a new connection per request"""
+    r = requests.get(api_url, params=dict(format="json", **parameters))
+    assert r.status_code == 200
+    return r.json()
+
+
+def run(url: str, callbacks: int, threads: int=1) -> dict:
+    """p50 and p99 latency of a callback (ms), through both paths, with ``threads`` callbacks at once"""
+    results = {}
+    for name, request, batched in [("new connection per request", unpooled_request, False),
+                                   ("pooled session", wikipedia_api.make_wikimedia_request, False),
+                                   ("pooled session, batched thumbnails", wikipedia_api.make_wikimedia_request, True)]:
+        def callback(_):
+            start = time.perf_counter()
+            for i in range(MODELS_PER_CALLBACK):
+                request(url, action="query", list="search", srsearch=f"model {i}")
+            thumbnails = [range(MODELS_PER_CALLBACK)] if batched else range(MODELS_PER_CALLBACK)
+            for pageids in thumbnails:
+                request(url, action="query", prop="pageimages", piprop="original",
+                        pageids="|".join(map(str, pageids)) if batched else pageids)
+            return (time.perf_counter() - start) * 1000
+
+        wikipedia_api.configure_session()
+        with ThreadPoolExecutor(threads) as pool:
+            times = np.array(list(pool.map(callback, range(callbacks))))
+        results.update({f"{name} p{q} ({threads} threads)": np.percentile(times, q) for q in [50, 99]})
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--handshake", type=float, default=30, help="handshake time of a connection (ms)")
+    parser.add_argument("--delay", type=float, default=2, help="time to answer a request (ms)")
+    parser.add_argument("--callbacks", type=int, default=20, help="number of callbacks")
+    arguments = parser.parse_args()
+    server = stand_in_server(arguments.handshake / 1000, arguments.delay / 1000)
+    url = f"http://127.0.0.1:{server.server_port}/w/api.php"
+    try:
+        for threads in [1, 4]:
+            report(f"Latency of the requests of a callback "
+                   f"({arguments.handshake} ms handshake, {arguments.delay} ms per request)",
+                   run(url, arguments.callbacks, threads), unit="ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
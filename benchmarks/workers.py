@@ -0,0 +1,102 @@
+"""
+Worker memory benchmark: memory used by each gunicorn worker once the dashboard is loaded,
+when every worker loads its own copy of the dataset, and when the dataset is shared 
+(see :func:`carsreco.data.share_data`).
+
+Both the rss (which counts shared pages in every process) and the pss (which splits 
+shared pages between the processes that map them) are reported.
+
+Usage: ::
+
+    python -m benchmarks.workers [--rows N] [--workers N]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+from scripts.preprocessing import preprocess, snapshot
+from .common import FULL_SIZE, synthetic_raw, report
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CONFIG = """
+wsgi_app = {app!r}
+bind = ["127.0.0.1:{port}"]
+workers = {workers}
+timeout = 600
+
+def on_starting(server):
+    if {shared!r}:
+        from carsreco.data import share_data
+        share_data()
+
+def post_worker_init(worker):
+    open("ready-%d" % worker.pid, "w").close()
+"""
+
+MODES = {"per-worker, full": "carsreco:create_server()",
+         "per-worker, compact": "carsreco:create_server(compact=True)",
+         "shared": "carsreco:create_server(shared=True)"}
+
+
+def memory(pid: int) -> tuple[float, float]:
+    """(rss, pss) of a process, in MiB"""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value, *_ = line.split()
+        values[key.rstrip(":")] = int(value) / 1024
+    return values["Rss"], values["Pss"]
+
+
+def run(directory: Path, app: str, shared: bool, workers: int, port: int=8765) -> tuple[float, float]:
+    """starts gunicorn in ``directory``, returns the mean (rss, pss) of the workers"""
+    for ready in directory.glob("ready-*"):
+        ready.unlink()
+    config = directory / "gunicorn.bench.py"
+    config.write_text(CONFIG.format(app=app, port=port, workers=workers, shared=shared))
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", str(config)], 
+                              cwd=directory, env=env, stderr=subprocess.DEVNULL)
+    try:
+        while len(list(directory.glob("ready-*"))) < workers:
+            if server.poll() is not None:
+                raise RuntimeError("gunicorn exited")
+            time.sleep(0.5)
+        time.sleep(2)
+        pids = [int(ready.name.split("-")[1]) for ready in directory.glob("ready-*")]
+        usage = [memory(pid) for pid in pids]
+    finally:
+        server.terminate()
+        server.wait()
+    return sum(u[0] for u in usage) / workers, sum(u[1] for u in usage) / workers
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=FULL_SIZE, help="rows of the synthetic dataset")
+    parser.add_argument("--workers", type=int, default=8)
+    arguments = parser.parse_args()
+
+    rss, pss = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        (directory / "data").mkdir()
+        raw_file, csv_file = directory / "raw.csv", directory / "data" / "preprocessed.csv"
+        synthetic_raw(arguments.rows).to_csv(raw_file)
+        preprocess(raw_file, csv_file)
+        snapshot(csv_file, csv_file.with_suffix(".npz"))
+        for name, app in MODES.items():
+            rss[name], pss[name] = run(directory, app, name == "shared", arguments.workers)
+    title = f"({arguments.workers} workers, {arguments.rows} rows)"
+    report(f"Mean worker rss {title}", rss, unit="MiB")
+    report(f"Mean worker pss {title}", pss, unit="MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,47 @@
 
 This package contains all the code that supports running the dashboard.
 
+The heavy dependencies (dash, holoviews, plotly, scipy) are only imported when they are 
+first used, so that importing the package (or :mod:`carsreco.data`) is cheap.
 """
 
-from .dashboard import create_app
-import flask
+from __future__ import annotations
 
-def create_server() -> flask.Flask:
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import flask
+    from .dashboard import create_app
+
+def __getattr__(name):
+    if name == "create_app":
+        from .dashboard import create_app
+        return create_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def create_server(compact: bool=False, shared: bool=False, prediction_cache_size: int=0,
+                  wikipedia_pool_size: int=10) -> flask.Flask:
     """Creates the server object
 
-    Creates the dashboard using :func:`carsreco.dashboard.create_app`
+    Creates the dashboard using :func:`carsreco.dashboard.create_app`. The server also
+    answers the batches of queries of ``POST /api/score`` (see :mod:`carsreco.api`)
+
+    Args:
+        compact: use the compact (low memory) version of the dataset, 
+            see :func:`carsreco.data.compact_frame`
+        shared: share the memory of the dataset between the workers,
+            see :func:`carsreco.dashboard.create_app`
+        prediction_cache_size: number of results of the prediction tab to cache,
+            see :func:`carsreco.dashboard.create_app`
+        wikipedia_pool_size: number of connections to wikipedia kept open by each worker,
+            see :func:`carsreco.wikipedia_api.configure_session`
 
     Returns:
         flask.Flask: Flask object used by the wsgi to run the dashboard
     """
-    app = create_app()
+    import flask
+    from .dashboard import create_app
+    app = create_app(compact=compact, shared=shared, prediction_cache_size=prediction_cache_size,
+                     wikipedia_pool_size=wikipedia_pool_size)
     assert isinstance(app.server, flask.Flask)
     return app.server
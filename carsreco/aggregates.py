@@ -0,0 +1,634 @@
+"""
+Precomputed aggregates of the dataset, used by the dashboard callbacks.
+
+The callbacks only have a few dozen possible inputs, and the data does not change
+while the application runs, so the tables they plot are computed once when the
+application starts (see :func:`carsreco.dashboard.create_app`). A callback then only
+slices one of those tables, whatever the number of rows of the dataset.
+"""
+
+from __future__ import annotations
+
+import itertools
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+#: the years shown by the price trend plots of the "given" tab
+YEARS = (2000, 2021)
+
+#: the statistics of the price in every table
+STATS = ['price', 'price_std', 'count']
+
+
+class GroupStats():
+    """Count, mean, sum of squared deviations (M2), min and max of a value, per group
+
+    These are sufficient to get the mean and the variance of each group, and two
+    GroupStats of different rows can be merged into the GroupStats of all the rows
+    (with the pairwise formulas of Chan et al., which are numerically stable, 
+    unlike the sums of squares). So they can be updated with new rows without going 
+    through the previous ones, or computed by parallel workers and merged.
+
+    Attributes:
+        keys: the groups, sorted
+        count: number of values of each group
+        mean: mean of each group
+        m2: sum of the squared deviations from the mean, of each group
+        min: minimum of each group
+        max: maximum of each group
+    """
+
+    def __init__(self, keys: pd.Index, count: np.ndarray, mean: np.ndarray, m2: np.ndarray, 
+                 min: np.ndarray, max: np.ndarray):
+        self.keys = keys
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, by: list[str], value: str='price') -> GroupStats:
+        """Computes the statistics of the rows of a dataframe
+
+        Rows where one of the ``by`` columns or the value is missing are ignored.
+
+        Args:
+            df: the dataframe
+            by: the columns defining the groups
+            value: the column of the values
+
+        Returns:
+            GroupStats: the statistics of each group
+        """
+        groups = df.groupby(by, observed=True, sort=True)[value]
+        count = groups.count()
+        # pandas computes the grouped variance with Welford's algorithm
+        m2 = groups.var(ddof=0).values.astype(np.float64) * count.values
+        return cls(count.index, count.values.astype(np.int64), groups.mean().values.astype(np.float64),
+                   np.nan_to_num(m2), groups.min().values, groups.max().values)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _align(self, keys: pd.Index) -> tuple[np.ndarray, ...]:
+        """(count, mean, m2, min, max) of the groups ``keys`` (0 count for the missing ones)"""
+        positions = self.keys.get_indexer(keys)
+        found = positions >= 0
+        def take(values, missing):
+            return np.where(found, values[positions], missing) if len(values) else np.full(len(keys), missing)
+        return (take(self.count, 0), take(self.mean, 0.), take(self.m2, 0.), 
+                take(self.min.astype(np.float64), np.inf), take(self.max.astype(np.float64), -np.inf))
+
+    def merge(self, other: GroupStats) -> GroupStats:
+        """The statistics of the union of the rows of both
+
+        Args:
+            other: the statistics of other rows, grouped by the same columns
+
+        Returns:
+            GroupStats: the merged statistics
+        """
+        keys = self.keys.append(other.keys).unique().sort_values()
+        n_a, mean_a, m2_a, min_a, max_a = self._align(keys)
+        n_b, mean_b, m2_b, min_b, max_b = other._align(keys)
+        count = n_a + n_b
+        delta = mean_b - mean_a
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n_b == 0, mean_a, mean_a + delta * n_b / count)
+            m2 = np.where((n_a == 0) | (n_b == 0), m2_a + m2_b, 
+                          m2_a + m2_b + delta ** 2 * n_a * n_b / count)
+        return GroupStats(keys, count, mean, m2, np.minimum(min_a, min_b), np.maximum(max_a, max_b))
+
+    def var(self, ddof: int=0) -> np.ndarray:
+        """the variance of each group (NaN for the groups of ``ddof`` values or less)"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof: int=0) -> np.ndarray:
+        """the standard deviation of each group (NaN for the groups of ``ddof`` values or less)"""
+        return np.sqrt(self.var(ddof))
+
+    def to_frame(self, ddof: int=1) -> pd.DataFrame:
+        """The statistics as a dataframe indexed by the groups
+
+        Args:
+            ddof: the delta degrees of freedom of the std
+
+        Returns:
+            pd.DataFrame: the columns are ``count``, ``mean``, ``std``, ``min`` and ``max``,
+                like ``groupby(by)[value].agg(['count', 'mean', 'std', 'min', 'max'])``
+        """
+        return pd.DataFrame({'count': self.count, 'mean': self.mean, 'std': self.std(ddof),
+                             'min': self.min, 'max': self.max}, index=self.keys)
+
+
+class QuantileSketch():
+    """KLL sketch of the quantiles of a stream of values
+
+    The sketch keeps at most about ``3 * k`` of the values, in levels: a value of
+    level ``h`` stands for ``2**h`` values. When a level is full, it is sorted and every
+    other value (starting at a random one) is moved to the next level (Karnin, Lang 
+    and Liberty, "Optimal Quantile Approximation in Streams", 2016).
+    
+    Error bound: the rank of the value returned for the quantile ``q`` of ``n`` values
+    differs from ``q * n`` by less than ``2.3 * n / k**0.94`` (1.5% of ``n`` for the default
+    ``k = 200``) with 99% probability, whatever the order of the values and the merges 
+    (this is the bound measured for the same algorithm by Apache DataSketches). 
+    The quantiles of at most ``k`` values are exact.
+
+    Sketches are merged with :meth:`merge`, with the same error bound.
+
+    Attributes:
+        k: the size parameter of the sketch
+        n: the number of values
+        levels: the values kept at each level
+    """
+
+    def __init__(self, k: int=200, seed: int=0):
+        """Creates an empty sketch
+
+        Args:
+            k: the size parameter (the memory and the error depend on it, see above)
+            seed: seed of the random choices of the compactions, so that the sketch
+                of the same values is always the same
+        """
+        self.k = k
+        self.n = 0
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self._seed = seed
+        # created on the first compaction: most groups are too small to be compacted
+        self._rng: Optional[np.random.Generator] = None
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, k: int=200, seed: int=0) -> QuantileSketch:
+        """the sketch of ``values``"""
+        sketch = cls(k, seed)
+        sketch.update(values)
+        return sketch
+
+    def _capacity(self, level: int) -> int:
+        """the maximal number of values of a level (lower levels have smaller capacities)"""
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def _compress(self):
+        """compacts the levels that are over their capacity"""
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(self.levels[level])
+                # with an odd number of values, one stays at this level
+                kept, values = values[:len(values) % 2], values[len(values) % 2:]
+                if self._rng is None:
+                    self._rng = np.random.default_rng(self._seed)
+                promoted = values[self._rng.integers(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # the capacities depend on the number of levels
+                level = 0
+            else:
+                level += 1
+
+    def update(self, values: np.ndarray):
+        """Adds values to the sketch
+
+        Args:
+            values: the values (the missing ones are ignored)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: QuantileSketch) -> QuantileSketch:
+        """The sketch of the values of both sketches
+
+        Args:
+            other: the other sketch (with the same ``k``)
+
+        Returns:
+            QuantileSketch: a new sketch
+        """
+        merged = QuantileSketch(self.k, self._seed)
+        # its own generator: sharing the one of this sketch would make their compactions depend
+        # on each other, and a new one seeded like this sketch would repeat its choices
+        merged._rng = np.random.default_rng([self._seed, self.n, other.n])
+        merged.n = self.n + other.n
+        merged.levels = [np.concatenate([a, b]) for a, b in 
+                         itertools.zip_longest(self.levels, other.levels, fillvalue=np.empty(0))]
+        merged._compress()
+        return merged
+
+    def __len__(self) -> int:
+        """the number of values kept"""
+        return sum(len(values) for values in self.levels)
+
+    def quantile(self, q) -> np.ndarray:
+        """The quantiles ``q`` of the values
+
+        Args:
+            q: the quantile(s), between 0 and 1
+
+        Returns:
+            np.ndarray: the smallest value whose rank is at least ``q * n`` (like 
+                ``np.quantile(..., method="inverted_cdf")``), NaN if the sketch is empty
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        if len(self.levels) == 1:
+            # never compacted: the values are exact
+            values = np.sort(self.levels[0])
+            positions = np.ceil(q * self.n).astype(np.int64) - 1
+            return values[np.clip(positions, 0, self.n - 1)]
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2. ** h) for h, v in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        ranks = np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, q * ranks[-1], side="left")
+        return values[order][np.minimum(positions, len(values) - 1)]
+
+
+#: the quantiles of the price overlays: column of the tables -> quantile
+QUANTILES = {'price_p10': 0.1, 'price_p25': 0.25, 'price_median': 0.5, 
+             'price_p75': 0.75, 'price_p90': 0.9}
+
+
+class GroupSketches():
+    """A :class:`QuantileSketch` per group
+
+    Attributes:
+        sketches: group -> sketch of its values
+    """
+
+    def __init__(self, sketches: dict):
+        self.sketches = sketches
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, by: list[str], value: str='price', 
+                   k: int=200) -> GroupSketches:
+        """Sketches the values of each group of a dataframe
+
+        Args:
+            df: the dataframe
+            by: the columns defining the groups
+            value: the column of the values
+            k: the size parameter of the sketches
+
+        Returns:
+            GroupSketches: the sketches
+        """
+        values = df[value].values.astype(np.float64)
+        groups = df.groupby(by if len(by) > 1 else by[0], observed=True, sort=True).indices
+        sketches = {}
+        for key, positions in groups.items():
+            group_values = values[positions]
+            if len(positions) <= k:
+                # the usual case (there are many small groups): no compaction, 
+                # so the sketch is built directly
+                sketch = QuantileSketch(k)
+                sketch.levels[0] = group_values[~np.isnan(group_values)]
+                sketch.n = len(sketch.levels[0])
+            else:
+                sketch = QuantileSketch.from_values(group_values, k)
+            sketches[key] = sketch
+        return cls(sketches)
+
+    def merge(self, other: GroupSketches) -> GroupSketches:
+        """the sketches of the union of the rows of both"""
+        sketches = dict(self.sketches)
+        for key, sketch in other.sketches.items():
+            sketches[key] = sketches[key].merge(sketch) if key in sketches else sketch
+        return GroupSketches(sketches)
+
+    def quantiles(self, keys: pd.Index) -> pd.DataFrame:
+        """The :data:`QUANTILES` of the groups ``keys``
+
+        Args:
+            keys: the groups
+
+        Returns:
+            pd.DataFrame: indexed by ``keys``, with a column per quantile 
+                (NaN for the groups without a sketch)
+        """
+        q = np.array(list(QUANTILES.values()))
+        result = np.full((len(keys), len(q)), np.nan)
+        exact, exact_rows = [], []
+        for row, key in enumerate(keys):
+            sketch = self.sketches.get(key)
+            if sketch is None or sketch.n == 0:
+                continue
+            if len(sketch.levels) == 1:
+                exact.append(sketch.levels[0])
+                exact_rows.append(row)
+            else:
+                result[row] = sketch.quantile(q)
+        if exact:
+            # the sketches that were never compacted hold all their values: 
+            # their quantiles are computed together, with a single sort
+            sizes = np.array([len(values) for values in exact])
+            group = np.repeat(np.arange(len(exact)), sizes)
+            values = np.concatenate(exact)
+            values = values[np.lexsort((values, group))]
+            starts = np.cumsum(sizes) - sizes
+            positions = np.ceil(np.outer(sizes, q)).astype(np.int64) - 1
+            positions = starts[:, None] + np.clip(positions, 0, sizes[:, None] - 1)
+            result[exact_rows] = values[positions]
+        return pd.DataFrame(result, index=keys, columns=list(QUANTILES))
+
+
+def price_table(stats: GroupStats) -> pd.DataFrame:
+    """The table of the price trend plots
+
+    Args:
+        stats: the statistics of the price
+
+    Returns:
+        pd.DataFrame: indexed by the groups, sorted, with the columns
+            ``price`` (mean), ``price_std`` (population standard deviation) and ``count``
+    """
+    # the std of a single price is 0, not NaN
+    return pd.DataFrame({'price': stats.mean, 'price_std': stats.std(ddof=0), 
+                         'count': stats.count}, index=stats.keys)
+
+
+def price_stats(df: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    """Mean, standard deviation and count of the price, grouped by the ``by`` columns
+
+    Rows where one of the ``by`` columns is missing are dropped, like holoviews'
+    ``Dataset.aggregate`` does.
+
+    Args:
+        df: the dataframe
+        by: the columns to group by
+
+    Returns:
+        pd.DataFrame: see :func:`price_table`
+    """
+    return price_table(GroupStats.from_frame(df, by))
+
+
+class PriceAggregates():
+    """Price statistics grouped by every column, and by (column, year)
+
+    The tables behind :func:`carsreco.interactive_plots.price_trendency_plot`
+    and :func:`carsreco.interactive_plots.price_tredency_plot_given`.
+
+    Tables of columns which were not given to the constructor are computed on their
+    first use, and kept. New rows are added with :meth:`append`, which merges their 
+    statistics into the existing ones (see :class:`GroupStats`).
+
+    With ``quantiles=True``, the price of each group is also sketched 
+    (see :class:`QuantileSketch`), and the tables have the :data:`QUANTILES` columns.
+    Sketching takes most of the time: the sketches of a column are made on the first use
+    of its table (see :meth:`by` and :meth:`given`), not by the constructor.
+
+    Attributes:
+        stats: column -> :class:`GroupStats` of the price grouped by the column
+        stats_year: column -> :class:`GroupStats` of the price grouped by (column, year),
+            for the years in :data:`YEARS`
+        sketches: column -> :class:`GroupSketches` of the price grouped by the column
+            (only the columns whose table was used, empty without ``quantiles``)
+        sketches_year: column -> :class:`GroupSketches` of the price grouped by (column, year)
+        by_column: column -> :func:`price_table` of ``stats[column]`` (and the quantiles
+            of ``sketches[column]``)
+        by_column_year: column -> :func:`price_table` of ``stats_year[column]`` (and the
+            quantiles of ``sketches_year[column]``)
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[Iterable[str]]=None,
+                 given_columns: Optional[Iterable[str]]=None, quantiles: bool=False):
+        """Computes the tables
+
+        Args:
+            df: the dataframe
+            columns: the columns of :attr:`by_column` (default: all but the price)
+            given_columns: the columns of :attr:`by_column_year`
+                (default: the categorical ones, except the year)
+            quantiles: also sketch the quantiles of the price of each group
+        """
+        self._frames = [df]
+        self.quantiles = quantiles
+        if columns is None:
+            columns = df.columns.drop('price')
+        if given_columns is None:
+            given_columns = df.select_dtypes(['object', 'category']).columns
+        given_columns = [column for column in given_columns if column != 'year']
+        self.stats, self.stats_year, self.sketches, self.sketches_year = {}, {}, {}, {}
+        self.by_column, self.by_column_year = {}, {}
+        for column in columns:
+            self._add(df, column)
+        years = self._years(df, given_columns)
+        for column in given_columns:
+            self._add_year(years, column)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """the rows (the dataframe, and the appended rows)"""
+        if len(self._frames) > 1:
+            self._frames = [pd.concat(self._frames)]
+        return self._frames[0]
+
+    @staticmethod
+    def _years(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+        """the rows of the years in :data:`YEARS` (only ``columns``, the year and the price)"""
+        return df.loc[df['year'].between(*YEARS), [*columns, 'year', 'price']]
+
+    def _table(self, stats: GroupStats, sketches: Optional[GroupSketches]) -> pd.DataFrame:
+        """the table of a column"""
+        table = price_table(stats)
+        if sketches is not None:
+            table = table.join(sketches.quantiles(stats.keys))
+        return table
+
+    def _add(self, df: pd.DataFrame, column: str):
+        """computes the statistics and the table of a column (merged with the existing ones)"""
+        stats = GroupStats.from_frame(df, [column])
+        self.stats[column] = self.stats[column].merge(stats) if column in self.stats else stats
+        if column in self.sketches:
+            self.sketches[column] = self.sketches[column].merge(GroupSketches.from_frame(df, [column]))
+        self.by_column[column] = self._table(self.stats[column], self.sketches.get(column))
+
+    def _add_year(self, years: pd.DataFrame, column: str):
+        """computes the statistics and the table of (column, year) (merged with the existing ones)"""
+        stats = GroupStats.from_frame(years, [column, 'year'])
+        self.stats_year[column] = self.stats_year[column].merge(stats) if column in self.stats_year else stats
+        if column in self.sketches_year:
+            self.sketches_year[column] = self.sketches_year[column].merge(
+                GroupSketches.from_frame(years, [column, 'year']))
+        self.by_column_year[column] = self._table(self.stats_year[column], self.sketches_year.get(column))
+
+    def append(self, rows: pd.DataFrame):
+        """Adds new rows to the statistics
+
+        Only the new rows are grouped, the cost does not depend on the number of rows 
+        already aggregated.
+
+        Args:
+            rows: the new rows, with the same columns as the dataframe
+        """
+        self._frames.append(rows)
+        for column in self.stats:
+            self._add(rows, column)
+        years = self._years(rows, list(self.stats_year))
+        for column in self.stats_year:
+            self._add_year(years, column)
+
+    def by(self, column: str) -> pd.DataFrame:
+        """The price statistics grouped by ``column``
+
+        Args:
+            column: the column
+
+        Returns:
+            pd.DataFrame: the columns are ``column`` and :data:`STATS` (and :data:`QUANTILES`),
+                sorted by ``column``
+        """
+        if column not in self.by_column:
+            self._add(self.df, column)
+        if self.quantiles and column not in self.sketches:
+            self.sketches[column] = GroupSketches.from_frame(self.df, [column])
+            self.by_column[column] = self._table(self.stats[column], self.sketches[column])
+        return self.by_column[column].reset_index()
+
+    def given(self, column: str, value) -> pd.DataFrame:
+        """The price statistics per year, of the rows where ``column`` is ``value``
+
+        Args:
+            column: the column
+            value: its value
+
+        Returns:
+            pd.DataFrame: the columns are ``year`` and :data:`STATS` (and :data:`QUANTILES`),
+                sorted by year. Empty if no row has this value.
+        """
+        if column not in self.by_column_year:
+            self._add_year(self._years(self.df, [column]), column)
+        if self.quantiles and column not in self.sketches_year:
+            self.sketches_year[column] = GroupSketches.from_frame(self._years(self.df, [column]), [column, 'year'])
+            self.by_column_year[column] = self._table(self.stats_year[column], self.sketches_year[column])
+        table = self.by_column_year[column]
+        try:
+            return table.xs(value, level=column).reset_index()
+        except (KeyError, TypeError):
+            return pd.DataFrame({'year': np.array([], dtype=table.index.levels[1].dtype),
+                                 **{name: table[name].iloc[:0].values for name in table.columns}})
+
+
+class FrequencyIndex():
+    """Counts of the values of the categorical columns, sorted by decreasing count
+
+    The data behind :func:`carsreco.interactive_plots.count_plot` and
+    :func:`carsreco.interactive_plots.plot_pie`, which show the ``lim`` most
+    frequent values of a column and the total count of all the others.
+    The cumulated counts are kept, so the count of the others is found without
+    summing them for every ``lim``.
+
+    Attributes:
+        counts: column -> counts of its values (without the missing values),
+            sorted by decreasing count
+        cumulated: column -> cumulated sum of :attr:`counts`
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[Iterable[str]]=None):
+        """Counts the values
+
+        Args:
+            df: the dataframe
+            columns: the columns to index (default: the categorical ones)
+        """
+        if columns is None:
+            columns = df.select_dtypes(['object', 'category']).columns
+        self.counts: dict[str, pd.Series] = {}
+        self.cumulated: dict[str, np.ndarray] = {}
+        for column in columns:
+            self._set(column, df[column].dropna().value_counts())
+
+    def _set(self, column: str, counts: pd.Series):
+        """sorts and stores the counts of a column"""
+        counts = counts.sort_values(ascending=False)
+        self.counts[column] = counts
+        self.cumulated[column] = np.cumsum(counts.values)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.counts
+
+    def top(self, column: str, lim: int) -> pd.Series:
+        """The counts of the ``lim`` most frequent values, and of all the others as 'other'
+
+        Args:
+            column: the column
+            lim: the number of values
+
+        Returns:
+            pd.Series: the counts, indexed by the values, in decreasing order (then 'other',
+                if there are more than ``lim`` values)
+        """
+        counts, cumulated = self.counts[column], self.cumulated[column]
+        top_values = counts.iloc[:lim].copy()
+        if len(counts) > lim: 
+            top_values['other'] = cumulated[-1] - (cumulated[lim - 1] if lim > 0 else 0)
+        return top_values
+
+    def append(self, rows: pd.DataFrame):
+        """Adds the values of new rows to the counts
+
+        The cost depends on the number of distinct values, not on the number of rows
+        already counted. The values with the same count may end up in another order than
+        if the index was built from all the rows.
+
+        Args:
+            rows: the new rows (with at least the indexed columns)
+        """
+        for column, counts in list(self.counts.items()):
+            new_counts = rows[column].dropna().value_counts()
+            # categorical indexes can only be aligned if they have the same categories
+            counts = counts.set_axis(counts.index.astype(object))
+            new_counts = new_counts.set_axis(new_counts.index.astype(object))
+            self._set(column, counts.add(new_counts, fill_value=0).astype(counts.dtype))
+
+
+class DistinctValues():
+    """The distinct values of the columns, among the rows without missing values
+
+    The options of the value dropdown of the "given" tab (see
+    :func:`carsreco.interactive_plots.get_price_trendency_given_vals`), found once
+    instead of scanning the whole dataframe for every callback.
+
+    Attributes:
+        counts: column -> number of complete rows with each value, sorted by value
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[Iterable[str]]=None):
+        """Finds the values
+
+        Args:
+            df: the dataframe
+            columns: the columns to index (default: all)
+        """
+        if columns is None:
+            columns = df.columns
+        complete = df.notna().all(axis=1).values
+        self.counts: dict[str, pd.Series] = {}
+        for column in columns:
+            counts = df.loc[complete, column].value_counts(sort=False)
+            self.counts[column] = counts[counts > 0].sort_index()
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.counts
+
+    def values(self, column: str) -> list:
+        """The distinct values of ``column``, sorted
+
+        Args:
+            column: the column
+
+        Returns:
+            list: the values
+        """
+        return self.counts[column].index.tolist()
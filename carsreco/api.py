@@ -0,0 +1,185 @@
+"""
+The JSON scoring endpoint of the server: the results of the prediction tab, without the
+dashboard, for many queries at once (see :func:`register_api`).
+
+``POST /api/score`` takes a batch of queries. The range of years (two integers) and the
+manufacturers of a query are optional: ::
+
+    {"queries": [{"price": [5000, 10000], "years": [2005, 2015], "brands": ["ford"]},
+                 {"price": [20000, 30000]}],
+     "alpha": 0.95}
+
+The results are streamed as json lines (``application/x-ndjson``), one per query. The
+queries with the same range of years are scored together, and their results are sent
+together: ``query`` is the index of the query in the request. ::
+
+    {"query": 0, "results": [{"manufacturer": "ford", "model": "f-150", "probability": 0.012,
+                              "low": 1.71, "high": 249.36}, ...]}
+
+where ``low`` and ``high`` bound the time to the next post of the model in the price
+range, in minutes (see :meth:`carsreco.prediction.IntervalPricePrediction.get_CI`). They
+are null when they can not be estimated (e.g. all the posts of the model are in the
+same minute).
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Any, Iterator, Optional
+
+import flask
+import numpy as np
+
+from .prediction import IntervalPricePrediction
+
+#: number of queries scored together: their results are sent before the next queries are scored
+SCORE_CHUNK = 256
+
+#: maximal number of queries of a request
+MAX_QUERIES = 100_000
+
+
+class Queries():
+    """A batch of queries
+
+    Attributes:
+        p1: the lower bounds of the prices
+        p2: the upper bounds of the prices
+        years: the range of years of each query (None for all the years)
+        brands: the manufacturers of each query (an empty list for all of them)
+        alpha: the confidence of the intervals
+    """
+
+    def __init__(self, p1: np.ndarray, p2: np.ndarray, years: list[Optional[tuple[int, int]]],
+                 brands: list[list[str]], alpha: float=0.95):
+        self.p1 = p1
+        self.p2 = p2
+        self.years = years
+        self.brands = brands
+        self.alpha = alpha
+
+    def __len__(self) -> int:
+        return len(self.p1)
+
+    @classmethod
+    def from_json(cls, payload: Any) -> Queries:
+        """Reads the body of a request
+
+        Args:
+            payload: the decoded json
+
+        Raises:
+            ValueError: if the body is not a valid batch of queries
+
+        Returns:
+            Queries: the queries
+        """
+        if not isinstance(payload, dict) or not isinstance(payload.get("queries"), list):
+            raise ValueError('the body should be an object with a list of "queries"')
+        queries = payload["queries"]
+        if len(queries) > MAX_QUERIES:
+            raise ValueError(f"at most {MAX_QUERIES} queries can be scored at once")
+        alpha = payload.get("alpha", 0.95)
+        if not isinstance(alpha, (int, float)) or not 0 < alpha < 1:
+            raise ValueError('"alpha" should be a number between 0 and 1')
+        prices, years, brands = [], [], []
+        for i, query in enumerate(queries):
+            if not isinstance(query, dict):
+                raise ValueError(f"query {i} should be an object")
+            prices.append(_pair(query.get("price"), f"the price of query {i}"))
+            query_years = query.get("years")
+            years.append(None if query_years is None else _years(query_years, f"the years of query {i}"))
+            query_brands = query.get("brands", [])
+            if not isinstance(query_brands, list) or not all(isinstance(brand, str) for brand in query_brands):
+                raise ValueError(f"the brands of query {i} should be a list of strings")
+            brands.append(query_brands)
+        prices = np.array(prices, dtype=np.float64).reshape(-1, 2)
+        return cls(prices[:, 0], prices[:, 1], years, brands, float(alpha))
+
+
+def _pair(value: Any, name: str) -> tuple[float, float]:
+    """the two bounds of a range of the queries"""
+    if not isinstance(value, list) or len(value) != 2:
+        raise ValueError(f"{name} should be a list of two numbers")
+    for bound in value:
+        # json booleans are ints in python, and json ints can be too large for a float
+        if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+            raise ValueError(f"{name} should be a list of two numbers")
+        try:
+            if not math.isfinite(float(bound)):
+                raise OverflowError
+        except OverflowError:
+            raise ValueError(f"{name} should be a list of two finite numbers") from None
+    if value[0] > value[1]:
+        raise ValueError(f"the first bound of {name} should not be above the second one")
+    return value[0], value[1]
+
+
+def _years(value: Any, name: str) -> tuple[int, int]:
+    """the first and last years of a query"""
+    first, last = _pair(value, name)
+    int64 = np.iinfo(np.int64)
+    if not all(isinstance(year, int) and int64.min <= year <= int64.max for year in (first, last)):
+        raise ValueError(f"{name} should be a list of two integers")
+    return first, last
+
+
+def _finite(value) -> Optional[float]:
+    """the value, or None (null) if it is not finite: json has no NaN"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def score(model: IntervalPricePrediction, queries: Queries,
+          chunk: int=SCORE_CHUNK) -> Iterator[tuple[int, list]]:
+    """The results of the queries, by range of years
+
+    The parameters of each range of years are estimated once, and its queries are scored
+    together, by chunks (see :meth:`carsreco.prediction.IntervalPricePrediction.get_CI_batch`).
+
+    Args:
+        model: the prediction model
+        queries: the queries
+        chunk: the number of queries scored together
+
+    Yields:
+        tuple: the index of a query, and its results (see
+        :meth:`carsreco.prediction.IntervalPricePrediction.get_CI`)
+    """
+    # range of years -> its queries
+    groups: dict[Optional[tuple[int, int]], list[int]] = {}
+    for query, years in enumerate(queries.years):
+        groups.setdefault(years, []).append(query)
+    for years, indices in groups.items():
+        for start in range(0, len(indices), chunk):
+            batch = indices[start:start + chunk]
+            yield from zip(batch, model.get_CI_batch(queries.p1[batch], queries.p2[batch],
+                                                     [queries.brands[query] for query in batch],
+                                                     alpha=queries.alpha, years=years))
+
+
+def register_api(server: flask.Flask, model: IntervalPricePrediction) -> None:
+    """Adds the ``/api/score`` endpoint to the server
+
+    Args:
+        server: the server of the dashboard
+        model: the prediction model of the dashboard
+    """
+
+    @server.route("/api/score", methods=["POST"])
+    def score_queries():
+        try:
+            queries = Queries.from_json(flask.request.get_json(silent=True))
+            if model.strata is None and any(years is not None for years in queries.years):
+                raise ValueError("the model can not select the cars by year")
+        except ValueError as e:
+            return flask.jsonify(error=str(e)), 400
+
+        def lines():
+            for query, results in score(model, queries):
+                results = [{"manufacturer": str(manufacturer), "model": str(name),
+                            "probability": float(probability), "low": _finite(low), "high": _finite(high)}
+                           for manufacturer, name, probability, low, high in results]
+                yield json.dumps({"query": query, "results": results}, allow_nan=False) + "\n"
+
+        return flask.Response(flask.stream_with_context(lines()), mimetype="application/x-ndjson")
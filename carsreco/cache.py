@@ -0,0 +1,150 @@
+"""
+Memoization of the dashboard callbacks.
+
+The callbacks only have a few hundred possible inputs and the data does not change
+while the application runs, so their results are kept in a bounded cache
+(see :class:`LRUCache`), keyed on their arguments and on the version of the dataset
+(see :func:`carsreco.data.dataset_version`). The continuous inputs (the sliders) are
+quantized first (see :func:`snap` and :func:`snap_range`).
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import wraps
+import logging
+import math
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache():
+    """Bounded cache, that evicts the least recently used entry when it is full
+
+    It is safe to use from several threads. Two threads missing the same key at the
+    same time both compute the value, and the last one is kept.
+
+    Attributes:
+        maxsize: the maximal number of entries
+        version: part of every key, so that the values computed from another version
+            of the data are never returned
+        hits: number of lookups that found their key
+        misses: number of lookups that did not find their key
+        evictions: number of entries removed because the cache was full
+    """
+
+    def __init__(self, maxsize: int=256, version: Optional[Hashable]=None):
+        """
+        Args:
+            maxsize: the maximal number of entries (at least 1)
+            version: the version of the data, see :attr:`version`
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, not {maxsize}")
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the value of ``key``, computing it with ``compute()`` if it is not cached
+
+        Args:
+            key: the key (the version is added to it)
+            compute: called without arguments to compute the value on a miss
+
+        Returns:
+            the value
+        """
+        key = (self.version, key)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def cached(self, function: Callable) -> Callable:
+        """Decorator memoizing ``function`` in the cache
+
+        The key is the name of the function and its arguments, which must be hashable.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (function.__qualname__, args, tuple(sorted(kwargs.items())))
+            return self.get(key, lambda: function(*args, **kwargs))
+        return wrapper
+
+    def clear(self) -> None:
+        """removes all entries (but keeps the counters)"""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        """the fraction of the lookups that found their key (0 before the first lookup)"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def stats(self) -> dict[str, int]:
+        """the counters, and the number of entries"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries), "maxsize": self.maxsize}
+
+    def log_stats(self, name: str="cache") -> None:
+        """logs :meth:`stats` (at the debug level)"""
+        logging.debug(f"{name}: " + ", ".join(f"{k}={v}" for k, v in self.stats().items())
+                      + f", hit_rate={self.hit_rate:.2f}")
+
+
+def snap(value: float, granularity: float) -> float:
+    """Rounds ``value`` to the nearest multiple of ``granularity``
+
+    Used to quantize the continuous inputs of a callback (e.g. the values of a slider
+    being dragged), so that close inputs share their cache entry.
+
+    Args:
+        value: the value
+        granularity: the step of the multiples (a non positive step leaves the value unchanged)
+
+    Returns:
+        float: the multiple
+    """
+    if granularity <= 0:
+        return value
+    return math.floor(value / granularity + 0.5) * granularity
+
+
+def snap_range(low: float, high: float, granularity: float) -> tuple[float, float]:
+    """Widens the range ``[low, high]`` to multiples of ``granularity``
+
+    Like :func:`snap`, for the two bounds of a range slider: the range is widened
+    (``low`` is rounded down and ``high`` up), so that the snapped range contains the
+    selected one, and it is never empty.
+
+    Args:
+        low: the lower bound
+        high: the upper bound
+        granularity: the step of the multiples (a non positive step leaves the range unchanged)
+
+    Returns:
+        tuple: the bounds, multiples of ``granularity`` with ``low < high``
+    """
+    if granularity <= 0:
+        return low, high
+    low, high = math.floor(low / granularity) * granularity, math.ceil(high / granularity) * granularity
+    return low, max(high, low + granularity)
@@ -2,72 +2,135 @@
 This file contains the web application logic.
 In other words, all callbacks for the dashboard components
 """
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
 import dash
-import dash_core_components as dcc
-import dash_html_components as html
+from dash import dcc, html
 from dash.dependencies import Input, Output
-from holoviews.plotting.plotly.dash import to_dash
 import pandas as pd
 
-from .data import get_data, cats_and_nums, interactive_plots_preprocess
-from .interactive_plots import price_trendency_plot, count_plot, price_tredency_plot_given,  get_price_trendency_given_vals, plot_pie
+from .api import register_api
+from .data import get_data, SHARED_PATH, StaleSnapshotError
+from .cache import LRUCache, snap_range
+from .figures import FigureData, FigureStore, Figures, FIGURES_PATH
+from .interactive_plots import get_price_trendency_given_vals
 from . import prediction
+from .timing import stage, format_timings
 from .layout import *
-from .wikipedia_api import WikipediaPage
+from .wikipedia_api import WikipediaPage, configure_session, POOL_SIZE
 
 external_stylesheets = ['assets/style.css'] #https://codepen.io/chriddyp/pen/bWLwgP.css
 
 
+def graph(figure) -> list:
+    """the children of a plot div, showing ``figure`` (as the holoviews plots used to be shown)"""
+    return [dcc.Graph(figure=figure, config={'scrollZoom': True})]
+
 
+def load_prediction_model(path, version: str) -> Optional[prediction.IntervalPricePrediction]:
+    """the model saved by :mod:`scripts.fit`, or None if it can not be used (the reason is logged)"""
+    try:
+        return prediction.IntervalPricePrediction.load(path, fingerprint=version)
+    except FileNotFoundError:
+        logging.info(f"no fitted prediction model in {path}")
+    except StaleSnapshotError as e:
+        logging.warning(f"not using the fitted prediction model: {e}")
+    return None
 
 
 ### DropDown ###
 
-def create_app() -> dash.Dash:
+def create_app(compact: bool=False, shared: bool=False, 
+               timings: Optional[dict[str, float]]=None, 
+               figure_cache_size: int=256, figures_path=FIGURES_PATH,
+               prediction_cache_size: int=0, price_granularity: float=500,
+               model_path=prediction.MODEL_PATH, wikipedia_pool_size: int=POOL_SIZE) -> dash.Dash:
     """app factory
 
     Creates the app object that contains the application logic
     if app = create_app()
     then app.server can be passed to wsgi
 
+    Args:
+        compact: use the compact (low memory) version of the dataset, 
+            see :func:`carsreco.data.compact_frame`
+        shared: map the compact dataset from the files written by :func:`carsreco.data.share_data`,
+            so that its memory is shared with the other workers (implies ``compact``)
+        timings: if not None, the time spent in each step of the startup is added to it
+            (it is also logged)
+        figure_cache_size: number of plots kept by the dropdown callbacks, see 
+            :class:`carsreco.cache.LRUCache`. The cache is available as ``app.figure_cache``
+        figures_path: the figures prerendered by :mod:`scripts.prerender` (see 
+            :class:`carsreco.figures.FigureStore`). The figures are built when they are
+            not found there
+        prediction_cache_size: number of results of the prediction tab to keep
+            (0 disables the cache). The cache is available as ``app.prediction_cache``
+        price_granularity: with the prediction cache, the price range of the slider is
+            widened to multiples of it (see :func:`carsreco.cache.snap_range`), so that the 
+            close values of a slider being dragged share their result
+        model_path: the prediction model fitted by :mod:`scripts.fit`. The model is fitted
+            when it is not found there, or was fitted on other data
+        wikipedia_pool_size: number of connections to wikipedia kept open by the worker
+            (see :func:`carsreco.wikipedia_api.configure_session`)
+
     Returns:
-        dash.Dash: the dash application.
+        dash.Dash: the dash application. Its server also has the JSON scoring endpoint
+        of :mod:`carsreco.api`
     """
-    app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-    app.config['suppress_callback_exceptions'] = True
-
-    df = get_data()
-    cats, nums = cats_and_nums(df)
-    edata = interactive_plots_preprocess(df)
-    p = prediction.IntervalPricePrediction(df)
-
-    layout = Layout(df, p)
-    app.layout = layout.full_layout
+    if timings is None:
+        timings = {}
+    configure_session(pool_size=wikipedia_pool_size)
+    with stage(timings, "dash"):
+        app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+        app.config['suppress_callback_exceptions'] = True
+
+    with stage(timings, "get_data"):
+        df = get_data(compact=compact or shared, shared_path=SHARED_PATH if shared else None)
+    with stage(timings, "preprocess"):
+        data = FigureData(df)
+        given_vals = data.given_vals
+        figure = Figures(data, FigureStore.open(figures_path, data.version, compact=compact or shared))
+    with stage(timings, "prediction"):
+        p = load_prediction_model(model_path, data.version) or prediction.IntervalPricePrediction(df)
+
+    with stage(timings, "layout"):
+        layout = Layout(df, p, statewise_figure=figure("statewise"))
+        app.layout = layout.full_layout
+    register_api(app.server, p)
+    logging.info("startup time per step:\n" + format_timings(timings))
+
+    figures = LRUCache(figure_cache_size, version=data.version)
+    app.figure_cache = figures
+    prediction_cache = LRUCache(prediction_cache_size, version=data.version) if prediction_cache_size else None
+    app.prediction_cache = prediction_cache
 
     ################################################################
     # Dropdown functions
     ################################################################
 
+    @figures.cached
     def dropdown_select(k):
-        components = to_dash(app, [price_trendency_plot(edata, k)])
-        plot = html.Div(components.children)
+        plot = html.Div(graph(figure("trend", k)))
         return plot
 
+    @figures.cached
     def dropdown_count(k):
-        components = to_dash(app, [count_plot(df, k)])
         plot = html.Div(children=[
-                html.Div(components.children),
+                html.Div(graph(figure("count", k))),
                 html.Div(
                     dcc.Graph(
                     id = "dd-pie",
-                    figure = plot_pie(df, k, cats),
+                    figure = figure("pie", k),
                     style={'justify-content': 'center', 'margin-top':'1em'})
         )])
         return plot
 
+    @figures.cached
     def dropdown_given(k1, k2):
-        components = to_dash(app, [price_tredency_plot_given(edata, k1, k2)])
-        plot = html.Div(components.children)
+        plot = html.Div(graph(figure("given", k1, k2)))
         return plot
 
     ################################################################
@@ -106,7 +169,7 @@ def create_app() -> dash.Dash:
         if not value_out:
             return dropdown_given("state", "CA")
         elif not value_in:
-            return dropdown_given(value_out, get_price_trendency_given_vals(df, value_out)[0])
+            return dropdown_given(value_out, get_price_trendency_given_vals(given_vals, value_out)[0])
         return dropdown_given(value_out, value_in)
 
     @app.callback(
@@ -116,7 +179,7 @@ def create_app() -> dash.Dash:
     def update_output(value):
         if not value:
             value = "state"
-        li_in = get_price_trendency_given_vals(df, value)
+        li_in = get_price_trendency_given_vals(given_vals, value)
         drop = dropdown_and_plot(li_in, "-in")
         return drop
 
@@ -124,21 +187,16 @@ def create_app() -> dash.Dash:
 
 
 
-    @app.callback(
-        Output('pred-output', 'children'),
-        [Input('model-dd', 'value'),
-         Input('year-range-slider', 'value'),
-         Input('price-range-slider', 'value')])
-    def show_success_probability(model,year,price):
+    def prediction_results(p1, p2, model, years):
         if not model:
-            recommended_cars = p.get_CI(price[0], price[1])
+            recommended_cars = p.get_CI(p1, p2, years=years)
         else:
-            recommended_cars = p.get_CI(price[0], price[1], [model])
+            recommended_cars = p.get_CI(p1, p2, [model], years=years)
         predictions = [list(c) for c in recommended_cars]
-        urll = []
-        for item in predictions:
-            page = WikipediaPage.from_query(item[0]+"_"+item[1])
-            urll.append(page.get_thumbnail()['source'])
+        pages = [WikipediaPage.from_query(item[0]+"_"+item[1]) for item in predictions]
+        # the thumbnails of all the pages are requested at once
+        urll = [thumbnail['source'] if thumbnail is not None else None
+                for thumbnail in WikipediaPage.get_thumbnails(pages)]
 
         ccc = html.H3(str('''Manufacturer Name, Model name, Time: 95% confidence interval of time for the next post of given model within desired price range'''), style=label_style),
 
@@ -154,6 +212,21 @@ def create_app() -> dash.Dash:
 
         return html.Div(children= [html.Ul(children=[html.Li(i) for i in childs])])
 
+    if prediction_cache is not None:
+        prediction_results = prediction_cache.cached(prediction_results)
+
+    @app.callback(
+        Output('pred-output', 'children'),
+        [Input('model-dd', 'value'),
+         Input('year-range-slider', 'value'),
+         Input('price-range-slider', 'value')])
+    def show_success_probability(model,year,price):
+        p1, p2 = price
+        if prediction_cache is not None:
+            # the close values of a slider being dragged share their result
+            p1, p2 = snap_range(p1, p2, price_granularity)
+        return prediction_results(p1, p2, model, tuple(year) if year else None)
+
             
     @app.callback(Output('tabs-content', 'children'),
                   [Input('tabs', 'value')])
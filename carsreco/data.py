@@ -4,24 +4,446 @@ It also contains functions used to do light preprocessing at startup of the appl
 
 Note that the more heaviweight preprocessing is done by the :mod:`scripts.preprocessing`
 script, which is run during deployment
+
+Loading ``data/preprocessed.csv`` is slow, so the preprocessing script also writes a
+binary snapshot of the same dataframe (see :func:`write_snapshot`) next to it.
+:func:`get_data` loads this snapshot when its fingerprint matches the csv, and only
+falls back to parsing the csv when the snapshot is missing or stale.
 """
 
 from __future__ import annotations
 
-import holoviews as hv
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import time
+from typing import Optional
+
 import numpy as np
 import pandas as pd
 
-def get_data() -> pd.DataFrame:
+DATA_PATH = Path("data/preprocessed.csv")
+SNAPSHOT_PATH = Path("data/preprocessed.npz")
+SHARED_PATH = Path("data/preprocessed.shared")
+
+SNAPSHOT_VERSION = 2
+
+#: the fingerprint of a file is kept once the file is older than this (ns), see :func:`file_fingerprint`
+FINGERPRINT_MIN_AGE = 2_000_000_000
+
+#: the range columns added by :mod:`scripts.preprocessing`: 
+#: name -> (binned column, bin edges, labels)
+RANGE_BINS = {
+    'price_range': ('price', [-np.inf, 5000, 15000, 25000, np.inf],
+                    ['<$5000', '$5000-15000', '$15000-25000', '>$25000']),
+    'year_range': ('year', [-np.inf, 2005, 2010, 2015, np.inf],
+                   ['<2005', '2005-2010', '2010-2015', '>2015']),
+    'odometer_range': ('odometer', [-np.inf, 40000, 80000, 120000, np.inf],
+                       ['<40000', '40000-80000', '80000-120000', '>120000']),
+}
+
+#: the columns plotted by the first tab: the price, and the columns of its dropdowns
+#: (see :func:`carsreco.interactive_plots.get_price_trendency_cols` and
+#: :func:`carsreco.interactive_plots.get_count_cols`, ``region`` and ``model`` are only counted)
+PLOT_COLUMNS = ['price', 'year', 'manufacturer', 'condition', 'cylinders', 'fuel', 'odometer',
+                'title_status', 'transmission', 'drive', 'size', 'type', 'paint_color', 'state',
+                'region', 'model', *RANGE_BINS]
+
+#: the columns read by the prediction model (see :attr:`carsreco.prediction.IntervalPricePrediction.columns`)
+PREDICTION_COLUMNS = ['model', 'manufacturer', 'price', 'posting_date', 'year']
+
+#: the columns read by the dashboard (the layout, the plots and the prediction model).
+#: The others (such as ``posting_year`` and ``posting_month``) are dropped by :func:`compact_frame`
+DASHBOARD_COLUMNS = list(dict.fromkeys([*PLOT_COLUMNS, *PREDICTION_COLUMNS]))
+
+def get_data(path=DATA_PATH, snapshot_path: Optional[Path]=SNAPSHOT_PATH, 
+             compact: bool=False, shared_path: Optional[Path]=None) -> pd.DataFrame:
     """Returns the dataframe from the dataset data/preprocessed.csv
 
+    If a snapshot made from the same csv exists (see :func:`write_snapshot`), it is
+    loaded instead of the csv, which is much faster. 
+
+    Args:
+        path: the preprocessed csv
+        snapshot_path: the binary snapshot of the csv. ``None`` to always read the csv
+        compact: if True, returns the compact version of the dataframe (see :func:`compact_frame`)
+            and logs the memory saved on each column
+        shared_path: if not None (and ``compact`` is True), the compact dataframe is mapped
+            from this directory, written by :func:`share_data`, so that its memory is shared 
+            between the processes. It is not checked against the csv, :func:`share_data` does that.
+
     Returns:
         pd.DataFrame: the imported dataframe
     """
-    df = pd.read_csv('data/preprocessed.csv', index_col=0, parse_dates=["posting_date"])
+    if compact and shared_path is not None:
+        try:
+            return read_shared(shared_path)
+        except (FileNotFoundError, StaleSnapshotError) as e:
+            logging.warning(f"not using shared data: {e}")
+    df = _load_data(Path(path), snapshot_path)
+    if compact:
+        compacted = compact_frame(df)
+        logging.info("compact dataframe, bytes saved per column:\n"
+                     + memory_report(df, compacted).to_string())
+        return compacted
+    return df
+
+def _load_data(path: Path, snapshot_path: Optional[Path]) -> pd.DataFrame:
+    """loads the snapshot if it is usable, the csv otherwise"""
+    fingerprint = file_fingerprint(path) if path.exists() else None
+    if snapshot_path is not None and Path(snapshot_path).exists():
+        if fingerprint is None:
+            logging.warning(f"{path} is missing: the snapshot {snapshot_path} can not be checked against it")
+        try:
+            return read_snapshot(snapshot_path, fingerprint=fingerprint)
+        except StaleSnapshotError as e:
+            logging.warning(f"not using snapshot: {e}")
+    df = read_csv_data(path)
+    df.attrs["fingerprint"] = fingerprint
+    return df
+
+def dataset_version(df: pd.DataFrame) -> str:
+    """identifies the content of a dataframe, for the caches of computations made from it
+
+    This is the fingerprint of the csv the dataframe was loaded from, which :func:`get_data`
+    stores in ``df.attrs``. Dataframes that were not loaded by :func:`get_data` are hashed.
+
+    Args:
+        df: the dataframe
+
+    Returns:
+        str: the version of the dataset
+    """
+    fingerprint = df.attrs.get("fingerprint")
+    if fingerprint is None:
+        hashes = pd.util.hash_pandas_object(df).values
+        fingerprint = hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+    return fingerprint
+
+def read_csv_data(path=DATA_PATH) -> pd.DataFrame:
+    """Parses the preprocessed csv
+
+    This is the slow path of :func:`get_data`
+
+    Args:
+        path: the preprocessed csv
+
+    Returns:
+        pd.DataFrame: the imported dataframe
+    """
+    df = pd.read_csv(path, index_col=0, parse_dates=["posting_date"])
     assert isinstance(df, pd.DataFrame)
     return df
 
+#------------------------------------------------------------------------------------
+# SNAPSHOT
+#------------------------------------------------------------------------------------
+
+class StaleSnapshotError(Exception):
+    """Raised when a snapshot can not be used in place of the csv it was made from"""
+
+def file_fingerprint(path) -> str:
+    """content fingerprint of a file
+
+    Hashing a large csv takes a while, and every process that loads the data needs its
+    fingerprint: it is kept in a ``.fingerprint`` file next to it, with the size and the 
+    modification time of the file, and only computed again when they change.
+
+    Args:
+        path: the file
+
+    Returns:
+        str: hex digest of the content of the file
+    """
+    path = Path(path)
+    cache_path = path.with_name(path.name + ".fingerprint")
+    stat = path.stat()
+    try:
+        cached = json.loads(cache_path.read_text())
+        if (cached["size"], cached["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return cached["fingerprint"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    fingerprint = h.hexdigest()
+    # a file modified within the resolution of the modification times may be modified
+    # again without changing them: its fingerprint is not kept
+    now = path.stat()
+    if (time.time_ns() - stat.st_mtime_ns > FINGERPRINT_MIN_AGE
+            and (now.st_size, now.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns)):
+        try:
+            tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                            "fingerprint": fingerprint}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logging.info(f"the fingerprint of {path} is not kept: {e}")
+    return fingerprint
+
+def _encode_column(name: str, values: pd.Series|pd.Index, arrays: dict) -> dict:
+    """stores a column into ``arrays``, and returns the metadata needed to decode it
+
+    Strings are dictionary-encoded (int32 codes + unicode array of the unique values)
+    so that the snapshot can be loaded without pickle.
+    """
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = np.asarray(dtype.categories)
+        if categories.dtype.kind not in "iufU":
+            categories = categories.astype(str)
+        arrays[f"{name}.codes"] = np.asarray(values.cat.codes if isinstance(values, pd.Series) 
+                                             else values.codes)
+        arrays[f"{name}.uniques"] = categories
+        return {"kind": "category", "ordered": bool(dtype.ordered)}
+    if isinstance(dtype, pd.DatetimeTZDtype) or dtype.kind == "M":
+        arrays[f"{name}.values"] = pd.DatetimeIndex(values).asi8
+        tz = getattr(dtype, "tz", None)
+        return {"kind": "datetime", "tz": str(tz) if tz is not None else None}
+    if dtype == object:
+        codes, uniques = pd.factorize(values)
+        if not all(isinstance(u, str) for u in uniques):
+            raise ValueError(f"column {name} contains non string objects, can not snapshot it")
+        arrays[f"{name}.codes"] = codes.astype(np.int32)
+        arrays[f"{name}.uniques"] = np.asarray(uniques, dtype=str)
+        return {"kind": "string"}
+    if dtype.kind in "biuf":
+        arrays[f"{name}.values"] = np.asarray(values)
+        return {"kind": "numeric"}
+    raise ValueError(f"column {name} has unsupported dtype {dtype}")
+
+def _decode_column(name: str, meta: dict, arrays) -> np.ndarray|pd.Categorical|pd.arrays.DatetimeArray:
+    """inverse of :func:`_encode_column`
+
+    Numeric, datetime and categorical columns are not copied, so they can be memory-mapped
+    """
+    kind = meta["kind"]
+    if kind == "numeric":
+        return arrays[f"{name}.values"]
+    if kind == "datetime":
+        values = arrays[f"{name}.values"].view("M8[ns]")
+        dtype = pd.DatetimeTZDtype(tz=meta["tz"]) if meta["tz"] is not None else values.dtype
+        return pd.arrays.DatetimeArray(values, dtype=dtype, copy=False)
+    codes = arrays[f"{name}.codes"]
+    uniques = arrays[f"{name}.uniques"]
+    if kind == "category":
+        dtype = pd.CategoricalDtype(uniques, ordered=meta["ordered"])
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+    assert kind == "string"
+    values = uniques.astype(object).take(codes) if len(uniques) else np.full(len(codes), np.nan, dtype=object)
+    values[codes == -1] = np.nan
+    return values
+
+def _encode_frame(df: pd.DataFrame, fingerprint: str) -> tuple[dict, dict[str, np.ndarray]]:
+    """encodes a dataframe as numpy arrays, returns (metadata, arrays)"""
+    arrays: dict[str, np.ndarray] = {}
+    columns = []
+    index_meta = _encode_column("index", df.index, arrays)
+    for i, (name, values) in enumerate(df.items()):
+        columns.append({"name": name, **_encode_column(f"col{i}", values, arrays)})
+    meta = {"version": SNAPSHOT_VERSION,
+            "fingerprint": fingerprint,
+            "index": {"name": df.index.name, **index_meta},
+            "columns": columns}
+    return meta, arrays
+
+def _decode_frame(meta: dict, arrays, source, fingerprint: Optional[str]=None) -> pd.DataFrame:
+    """inverse of :func:`_encode_frame`, checks the version and the fingerprint"""
+    if meta["version"] != SNAPSHOT_VERSION:
+        raise StaleSnapshotError(f"{source} version {meta['version']} is not {SNAPSHOT_VERSION}")
+    if fingerprint is not None and meta["fingerprint"] != fingerprint:
+        raise StaleSnapshotError(f"{source} was not made from the current csv")
+    index_meta = meta["index"]
+    index = pd.Index(_decode_column("index", index_meta, arrays), name=index_meta["name"], copy=False)
+    df = pd.DataFrame({column["name"]: _decode_column(f"col{i}", column, arrays)
+                       for i, column in enumerate(meta["columns"])}, 
+                      index=index, copy=False)
+    df.attrs["fingerprint"] = meta["fingerprint"]
+    return df
+
+def write_snapshot(df: pd.DataFrame, snapshot_path, fingerprint: str) -> None:
+    """Writes a binary (npz) snapshot of the dataframe
+
+    Every column is stored as a typed numpy array, so that :func:`read_snapshot` does
+    not have to parse anything.
+
+    Args:
+        df: the dataframe, as returned by :func:`read_csv_data`
+        snapshot_path: where to write the snapshot
+        fingerprint: fingerprint of the csv the dataframe was read from (see :func:`file_fingerprint`)
+    """
+    meta, arrays = _encode_frame(df, fingerprint)
+    with open(snapshot_path, "wb") as f:
+        np.savez(f, __meta__=np.array(json.dumps(meta)), **arrays)
+
+def read_snapshot(snapshot_path, fingerprint: Optional[str]=None) -> pd.DataFrame:
+    """Reads a snapshot written by :func:`write_snapshot`
+
+    Args:
+        snapshot_path: the snapshot
+        fingerprint: if not None, the expected fingerprint of the csv
+
+    Raises:
+        StaleSnapshotError: if the snapshot does not match the fingerprint, or was written
+        by an incompatible version
+
+    Returns:
+        pd.DataFrame: the dataframe, identical to the one returned by :func:`read_csv_data`
+    """
+    with np.load(snapshot_path, allow_pickle=False) as arrays:
+        meta = json.loads(str(arrays["__meta__"]))
+        return _decode_frame(meta, arrays, snapshot_path, fingerprint)
+
+#------------------------------------------------------------------------------------
+# SHARED (MEMORY-MAPPED) DATA
+#------------------------------------------------------------------------------------
+
+def write_shared(df: pd.DataFrame, shared_path, fingerprint: str) -> None:
+    """Writes the dataframe as a directory of memory-mappable arrays
+
+    String columns are converted to categoricals, so that every column (except for the
+    categories themselves) is stored in a numpy array, that :func:`read_shared` maps 
+    in memory without copying it. The directory is replaced atomically.
+
+    Args:
+        df: the dataframe, usually the compact one (see :func:`compact_frame`)
+        shared_path: the directory to write
+        fingerprint: fingerprint of the csv the dataframe was read from (see :func:`file_fingerprint`)
+    """
+    shared_path = Path(shared_path)
+    df = df.astype({name: "category" for name in df.select_dtypes(object).columns})
+    meta, arrays = _encode_frame(df, fingerprint)
+    tmp_path = shared_path.with_name(shared_path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    for key, values in arrays.items():
+        np.save(tmp_path / f"{key}.npy", values, allow_pickle=False)
+    (tmp_path / "meta.json").write_text(json.dumps(meta))
+    old_path = shared_path.with_name(shared_path.name + ".old")
+    if shared_path.exists():
+        shared_path.rename(old_path)
+    tmp_path.rename(shared_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+class _MemoryMappedArrays():
+    """maps the arrays of a directory written by :func:`write_shared` when they are accessed"""
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return np.load(self.path / f"{key}.npy", mmap_mode="r", allow_pickle=False)
+
+def read_shared(shared_path, fingerprint: Optional[str]=None) -> pd.DataFrame:
+    """Maps the dataframe written by :func:`write_shared` in memory
+
+    The columns of the returned dataframe are read-only views of the memory-mapped files, 
+    so all the processes that read the same directory share the same physical memory.
+
+    Args:
+        shared_path: the directory written by :func:`write_shared`
+        fingerprint: if not None, the expected fingerprint of the csv
+
+    Raises:
+        StaleSnapshotError: if the data does not match the fingerprint, or was written
+        by an incompatible version
+
+    Returns:
+        pd.DataFrame: the dataframe
+    """
+    shared_path = Path(shared_path)
+    meta = json.loads((shared_path / "meta.json").read_text())
+    return _decode_frame(meta, _MemoryMappedArrays(shared_path), shared_path, fingerprint)
+
+def share_data(path=DATA_PATH, snapshot_path: Optional[Path]=SNAPSHOT_PATH, 
+               shared_path=SHARED_PATH) -> None:
+    """Makes sure that the shared data is up to date with the csv
+
+    This is meant to be run once, in the master process of the server, before the workers
+    load the data with ``get_data(compact=True, shared_path=shared_path)``.
+
+    Args:
+        path: the preprocessed csv
+        snapshot_path: the binary snapshot of the csv
+        shared_path: the directory of the shared data (see :func:`write_shared`)
+    """
+    fingerprint = file_fingerprint(path)
+    try:
+        meta = json.loads((Path(shared_path) / "meta.json").read_text())
+        if meta["version"] == SNAPSHOT_VERSION and meta["fingerprint"] == fingerprint:
+            return
+    except FileNotFoundError:
+        pass
+    logging.info(f"writing the shared data to {shared_path}")
+    write_shared(get_data(path, snapshot_path, compact=True), shared_path, fingerprint)
+
+#------------------------------------------------------------------------------------
+# COMPACT REPRESENTATION
+#------------------------------------------------------------------------------------
+
+def compact_frame(df: pd.DataFrame, columns=DASHBOARD_COLUMNS, 
+                  max_cardinality: float=0.5) -> pd.DataFrame:
+    """Returns a copy of the dataframe that uses less memory
+
+    - only the ``columns`` (that exist in the dataframe) are kept, and the index is dropped
+    - string columns with fewer than ``max_cardinality * len(df)`` distinct values become
+      categorical (with sorted categories, so that sorting by them does not change)
+    - the range columns (see :data:`RANGE_BINS`) become ordered categoricals
+    - integer columns become int32 and float columns float32 when no value changes
+
+    Args:
+        df: the dataframe, as returned by :func:`get_data`
+        columns: the columns to keep
+        max_cardinality: maximal ratio of distinct values to rows for a string column
+            to become categorical
+
+    Returns:
+        pd.DataFrame: the compact dataframe
+    """
+    compacted = {}
+    for name in [c for c in df.columns if c in columns]:
+        values = df[name]
+        if name in RANGE_BINS and values.dtype == object:
+            _, _, labels = RANGE_BINS[name]
+            values = values.astype(pd.CategoricalDtype(labels, ordered=True))
+        elif values.dtype == object:
+            if values.nunique() <= max_cardinality * len(values):
+                values = values.astype("category")
+        elif values.dtype.kind in "iu":
+            if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min 
+                                    and values.max() <= np.iinfo(np.int32).max):
+                values = values.astype(np.int32)
+        elif values.dtype.kind == "f":
+            downcast = values.astype(np.float32)
+            if ((downcast == values) | values.isna()).all():
+                values = downcast
+        compacted[name] = values.reset_index(drop=True)
+    compacted = pd.DataFrame(compacted)
+    compacted.attrs.update(df.attrs)
+    return compacted
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """memory used by each column of two versions of a dataframe
+
+    Args:
+        before: the original dataframe
+        after: the compact dataframe (see :func:`compact_frame`)
+
+    Returns:
+        pd.DataFrame: with one row per column of ``before`` (and one for the total) and the
+        columns ``before``, ``after`` and ``saved`` (in bytes). Dropped columns use 0 bytes after.
+    """
+    used_before = before.memory_usage(index=True, deep=True)
+    used_after = after.memory_usage(index=True, deep=True).reindex(used_before.index, fill_value=0)
+    report = pd.DataFrame({"before": used_before, "after": used_after})
+    report.loc["total"] = report.sum()
+    report["saved"] = report["before"] - report["after"]
+    return report
+
 #------------------------------------------------------------------------------------
 # PREPROCESSING
 #------------------------------------------------------------------------------------
@@ -39,6 +461,7 @@ def interactive_plots_preprocess(df):
         hv.Dataset: The hv.Dataset of the dataset after preprocessing
 
     """
+    import holoviews as hv
     assert isinstance(df, pd.DataFrame), "input should be a pandas DataFrame"
 
     vdims = ['price']
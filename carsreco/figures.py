@@ -0,0 +1,221 @@
+"""
+The figures of the first tab of the dashboard, and their prerendered store.
+
+The first tab only has a finite number of figures: one per column of each dropdown,
+one per (column, value) of the "given" dropdowns, and the map of the prices per state.
+Each figure has a key (see :func:`figure_keys`), and :func:`build_figure` builds it
+from the precomputed aggregates of the dataset (see :class:`FigureData`).
+
+The :mod:`scripts.prerender` script builds all of them at deploy time and writes their
+json to a directory (see :func:`write_store`). The dashboard then reads them from this
+store (see :class:`FigureStore`), and only builds the figures that are missing from it.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+import shutil
+from typing import Any, Optional
+
+import pandas as pd
+
+from .data import cats_and_nums, dataset_version
+from .aggregates import PriceAggregates, FrequencyIndex, DistinctValues
+from .interactive_plots import price_trendency_figure, count_figure, price_trendency_figure_given, \
+    plot_pie, statewise_prices, get_price_trendency_cols, get_count_cols, get_price_trendency_given_cols
+
+FIGURES_PATH = Path("data/figures")
+
+STORE_VERSION = 2
+
+#: a figure key: its kind ("trend", "count", "pie", "given" or "statewise") and its arguments
+Key = tuple
+
+
+class FigureData():
+    """The dataframe and the aggregates the figures are built from
+
+    Attributes:
+        df: the dataframe
+        cats: its categorical columns
+        aggregates: the price statistics and quantiles (see :class:`carsreco.aggregates.PriceAggregates`)
+        counts: the value counts (see :class:`carsreco.aggregates.FrequencyIndex`)
+        given_vals: the values of the "given" dropdown (see :class:`carsreco.aggregates.DistinctValues`)
+        version: the version of the dataset (see :func:`carsreco.data.dataset_version`)
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """Computes the aggregates (the quantiles of the prices are sketched when a figure
+        first needs them)
+
+        Args:
+            df: the dataframe
+        """
+        self.df = df
+        self.cats, _ = cats_and_nums(df)
+        given_cols = [col for col in get_price_trendency_given_cols(df) if col in self.cats]
+        self.aggregates = PriceAggregates(df, get_price_trendency_cols(df), given_cols, quantiles=True)
+        self.counts = FrequencyIndex(df, self.cats)
+        self.given_vals = DistinctValues(df, get_price_trendency_given_cols(df))
+        self.version = dataset_version(df)
+
+
+def build_figure(data: FigureData, key: Key):
+    """Builds the figure of a key
+
+    Args:
+        data: the data
+        key: the key of the figure (see :func:`figure_keys`)
+
+    Returns:
+        go.Figure: the figure
+    """
+    kind, *args = key
+    if kind == "trend":
+        return price_trendency_figure(data.aggregates, *args)
+    if kind == "count":
+        return count_figure(data.counts, *args)
+    if kind == "pie":
+        return plot_pie(data.counts, *args, data.cats)
+    if kind == "given":
+        return price_trendency_figure_given(data.aggregates, *args)
+    if kind == "statewise":
+        return statewise_prices(data.aggregates)
+    raise ValueError(f"unknown figure kind {kind!r}")
+
+
+def figure_keys(data: FigureData) -> list[Key]:
+    """The keys of all the figures that the first tab can show
+
+    Args:
+        data: the data
+
+    Returns:
+        list: the keys
+    """
+    df = data.df
+    keys: list[Key] = [("statewise",)]
+    keys += [("trend", col) for col in get_price_trendency_cols(df)]
+    for col in get_count_cols(df):
+        keys += [("count", col), ("pie", col)]
+    for col in get_price_trendency_given_cols(df):
+        # the given plot only takes string values
+        keys += [("given", col, value) for value in data.given_vals.values(col)
+                 if isinstance(value, str)]
+    return keys
+
+
+def _key_string(key: Key) -> str:
+    """the key, as a string (the keys of the manifest)"""
+    return json.dumps(list(key))
+
+
+def write_store(path, version: str, figures: dict[Key, str], compact: bool=True) -> None:
+    """Writes the figures to a directory, with a manifest
+
+    Each figure is in its own json file, and ``manifest.json`` maps the keys to the files.
+    The directory is replaced atomically.
+
+    Args:
+        path: the directory
+        version: the version of the dataset the figures were built from
+        figures: key -> path of a file containing the json of the figure. The files are moved
+            to the directory
+        compact: whether the figures were built from the compact dataframe
+            (see :func:`carsreco.data.compact_frame`)
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    files = {}
+    for i, (key, figure_file) in enumerate(figures.items()):
+        name = f"{i:05d}.json"
+        shutil.move(figure_file, tmp_path / name)
+        files[_key_string(key)] = name
+    manifest = {"version": STORE_VERSION, "dataset_version": version, "compact": compact, "figures": files}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest, indent=1))
+    old_path = path.with_name(path.name + ".old")
+    if path.exists():
+        path.rename(old_path)
+    tmp_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class FigureStore():
+    """The figures written by :func:`write_store`, read when they are requested
+
+    Attributes:
+        path: the directory
+        files: key (see :func:`_key_string`) -> json file, relative to the directory
+    """
+
+    def __init__(self, path, files: dict[str, str]):
+        self.path = Path(path)
+        self.files = files
+
+    @classmethod
+    def open(cls, path, version: str, compact: bool=True) -> Optional[FigureStore]:
+        """Opens a store, if it exists and was made from the same data
+
+        Args:
+            path: the directory
+            version: the version of the dataset
+            compact: whether the dashboard uses the compact dataframe: the figures must
+                have been built from the same one
+
+        Returns:
+            FigureStore: the store, or None if it can not be used (the reason is logged)
+        """
+        try:
+            manifest = json.loads((Path(path) / "manifest.json").read_text())
+        except FileNotFoundError:
+            logging.info(f"no prerendered figures in {path}")
+            return None
+        if manifest["version"] != STORE_VERSION or manifest["dataset_version"] != version:
+            logging.warning(f"not using the prerendered figures of {path}: they were made from other data")
+            return None
+        if manifest["compact"] != compact:
+            logging.warning(f"not using the prerendered figures of {path}: they were made from the "
+                            f"{'compact' if manifest['compact'] else 'full'} dataframe")
+            return None
+        return cls(path, manifest["figures"])
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def get(self, key: Key) -> Optional[dict[str, Any]]:
+        """The figure of a key (as a dict), or None if it is not in the store"""
+        name = self.files.get(_key_string(key))
+        if name is None:
+            return None
+        return json.loads((self.path / name).read_text())
+
+
+class Figures():
+    """The figures of the dashboard: read from the store, or built if they are not in it
+
+    Attributes:
+        data: the data the figures are built from
+        store: the prerendered figures (None if there are none)
+        hits: number of figures read from the store
+        misses: number of figures built
+    """
+
+    def __init__(self, data: FigureData, store: Optional[FigureStore]=None):
+        self.data = data
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *key):
+        """The figure of a key (a dict if it was read from the store, a go.Figure otherwise)"""
+        if self.store is not None:
+            figure = self.store.get(key)
+            if figure is not None:
+                self.hits += 1
+                return figure
+        self.misses += 1
+        return build_figure(self.data, key)
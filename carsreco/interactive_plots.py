@@ -1,29 +1,61 @@
 """
 Script to display interactive plots on the dashboard.
+
+The holoviews plots (``*_plot``) have a plotly version (``*_figure``) which builds the
+same figure directly, and is what the dashboard shows.
+
+holoviews and plotly are imported by the functions that use them, 
+so that importing this module is cheap.
 """
 import numpy as np
 import pandas as pd
 
-import holoviews as hv
-import plotly.express as px
+from .aggregates import PriceAggregates, FrequencyIndex, DistinctValues, YEARS, QUANTILES
 
+#: the style of the holoviews plots, reproduced by the plotly figures
+CURVE_COLOR = '#30a2da'
+BAND_COLOR = 'rgba(48, 162, 218, %s)'
+MARGIN = dict(b=50, l=50, pad=4, r=50, t=50)
 
-def price_trendency_plot(edata, kdim="state"):
-    """Holoview curve plot combined with errorbar plot of average price trendency.
+#: the columns that are not in the dropdowns of the price trend plots (the compact
+#: dataframe does not have the posting year and month, see :data:`carsreco.data.DASHBOARD_COLUMNS`)
+NOT_PLOTTED_AGAINST_PRICE = ['price', 'region', 'model', 'posting_date', 'posting_year', 'posting_month']
 
-    Aggregate the data given the k-dimension and generate the errorbar plot and curve plot.
+
+def _holoviews():
+    """imports holoviews and its plotly plotting backend (needed to set options on the plots)"""
+    import holoviews as hv
+    import holoviews.plotting.plotly
+    return hv
+
+
+def _price_table(edata, kdim):
+    """Mean and std of the price grouped by kdim, sorted by kdim.
 
     Args:
-        edata (hv.Dataset): The hv.Dataset of the dataset
+        edata (hv.Dataset or PriceAggregates): The dataset, or its precomputed aggregates
         kdim (str): The key-dimension
 
     Returns:
-        hv.core.overlay.Overlay: The holoview curve plot combined with errorbar plot
-
+        pd.DataFrame: The kdim, price and price_std columns
     """
-    assert isinstance(kdim, str), "Please input your interested key dimension as string"
+    if isinstance(edata, PriceAggregates):
+        return edata.by(kdim)
+    return edata.aggregate(kdim, function=np.mean, spreadfn=np.std).sort().dframe()
+
+
+def _price_trend_table(edata, kdim):
+    """The table and the width of the price trendency plot.
+
+    Args:
+        edata (hv.Dataset or PriceAggregates): The dataset, or its precomputed aggregates
+        kdim (str): The key-dimension
 
-    agg = edata.aggregate(kdim, function=np.mean, spreadfn=np.std).sort()
+    Returns:
+        tuple: The kdim, price and price_std columns (only the years in YEARS if kdim is 'year'),
+            and the width of the plot, which depends on the number of values of kdim
+    """
+    agg = _price_table(edata, kdim)
     if len(agg) >= 20:
         width = 800
     elif 10 <= len(agg) < 20:
@@ -32,14 +64,143 @@ def price_trendency_plot(edata, kdim="state"):
         width = 400
 
     if kdim == "year":
-        edata = edata[(edata['year']>=2000) & (edata['year']<=2021)]
-    agg = edata.aggregate(kdim, function=np.mean, spreadfn=np.std).sort()
+        agg = agg[(agg['year']>=YEARS[0]) & (agg['year']<=YEARS[1])]
+    return agg, width
+
+
+def _has_quantiles(table):
+    """Whether the aggregated table has the quantiles of the price (see PriceAggregates)."""
+    return all(name in table.columns for name in QUANTILES)
+
+
+def _quantile_elements(hv, table, kdim):
+    """Holoview overlays of the quantiles of the price: the 10-90 and 25-75 bands, and the median.
+
+    Args:
+        hv: The holoviews module
+        table (pd.DataFrame): The aggregated table
+        kdim (str): The key-dimension
+
+    Returns:
+        list: The elements, empty if the table has no quantiles
+    """
+    if not _has_quantiles(table):
+        return []
+    return [hv.Area(table, kdims=[kdim], vdims=['price_p10', 'price_p90'], label='p10-p90').opts(color=BAND_COLOR % 0.15, line_width=0),
+            hv.Area(table, kdims=[kdim], vdims=['price_p25', 'price_p75'], label='IQR').opts(color=BAND_COLOR % 0.3, line_width=0),
+            hv.Curve(table, kdims=[kdim], vdims=['price_median'], label='median').opts(color=CURVE_COLOR, dash='dash')]
+
+
+def _quantile_traces(x, table):
+    """Plotly traces of the quantiles of the price: the 10-90 and 25-75 bands, and the median.
+
+    Args:
+        x (np.ndarray): The x values
+        table (pd.DataFrame): The aggregated table
+
+    Returns:
+        list: The traces, empty if the table has no quantiles
+    """
+    import plotly.graph_objects as go
+    if not _has_quantiles(table):
+        return []
+    traces = []
+    for low, high, name, opacity in [('price_p10', 'price_p90', 'p10-p90', 0.15),
+                                     ('price_p25', 'price_p75', 'IQR', 0.3)]:
+        traces += [go.Scatter(x=x, y=table[low].values, mode='lines', line=dict(width=0), 
+                              legendgroup=name, showlegend=False, hoverinfo='skip'),
+                   go.Scatter(x=x, y=table[high].values, mode='lines', line=dict(width=0), 
+                              fill='tonexty', fillcolor=BAND_COLOR % opacity, name=name, legendgroup=name)]
+    traces.append(go.Scatter(x=x, y=table['price_median'].values, mode='lines', name='median',
+                             line=dict(color=CURVE_COLOR, width=2, dash='dash')))
+    return traces
+
+
+def price_trendency_plot(edata, kdim="state"):
+    """Holoview curve plot combined with errorbar plot of average price trendency.
+
+    Aggregate the data given the k-dimension and generate the errorbar plot and curve plot.
+    If edata is a PriceAggregates, the aggregate is not computed but looked up,
+    and if it has quantiles, the median, the interquartile range and the 10-90 percentile
+    band are overlaid.
+
+    Args:
+        edata (hv.Dataset or PriceAggregates): The hv.Dataset of the dataset, 
+            or its precomputed aggregates
+        kdim (str): The key-dimension
+
+    Returns:
+        hv.core.overlay.Overlay: The holoview curve plot combined with errorbar plot
+
+    """
+    hv = _holoviews()
+    assert isinstance(kdim, str), "Please input your interested key dimension as string"
+
+    agg, width = _price_trend_table(edata, kdim)
+    table = agg
+    agg = hv.Dataset(agg, kdims=[kdim], vdims=['price', 'price_std'])
     errorbars = hv.ErrorBars(agg,vdims=['price', 'price_std']).iloc[::1]
-    overlay =  (hv.Curve(agg) * errorbars).redim.range(price=(0, None)).opts(width=width, xrotation=45, title='Average Price Fluctuation by %s' % kdim)
+    overlay = hv.Curve(agg) * errorbars
+    for element in _quantile_elements(hv, table, kdim):
+        overlay = overlay * element
+    overlay =  overlay.redim.range(price=(0, None)).opts(width=width, xrotation=45, title='Average Price Fluctuation by %s' % kdim)
 
     return overlay
 
 
+def price_trendency_figure(edata, kdim="state"):
+    """Plotly version of price_trendency_plot.
+
+    The same curve and error bars (and quantiles), built directly as a plotly figure,
+    without the conversion of the holoviews objects by to_dash.
+
+    Args:
+        edata (hv.Dataset or PriceAggregates): The hv.Dataset of the dataset, 
+            or its precomputed aggregates
+        kdim (str): The key-dimension
+
+    Returns:
+        go.Figure: The curve of the average price with its error bars
+
+    """
+    import plotly.graph_objects as go
+    assert isinstance(kdim, str), "Please input your interested key dimension as string"
+
+    agg, width = _price_trend_table(edata, kdim)
+    x, y = agg[kdim].values, agg['price'].values
+    fig = go.Figure([
+        go.Scatter(x=x, y=y, mode='lines', line=dict(color=CURVE_COLOR, width=2), 
+                   name='', showlegend=False),
+        go.Scatter(x=x, y=y, mode='lines', line=dict(width=0), name='', showlegend=False,
+                   error_y=dict(type='data', array=agg['price_std'].values, color='black')),
+        *_quantile_traces(x, agg),
+    ])
+    fig.update_layout(title='Average Price Fluctuation by %s' % kdim, width=width, height=400, margin=MARGIN,
+                      xaxis_title=kdim, yaxis_title='price', yaxis_rangemode='tozero')
+
+    return fig
+
+
+def _top_values(df, kdim, lim):
+    """The counts of the lim most frequent values of kdim, and of all the others as 'other'.
+
+    Args:
+        df (pd.DataFrame or FrequencyIndex): The DataFrame of the dataset, or its value counts
+        kdim (str): The key-dimension
+        lim (int): The number of values
+
+    Returns:
+        pd.Series: The counts, indexed by the values, in decreasing order (then 'other')
+    """
+    if isinstance(df, FrequencyIndex):
+        return df.top(kdim, lim)
+    values = df[kdim].dropna().value_counts().sort_values(ascending=False)
+    topk = min(len(values), lim)
+    top_values = values.nlargest(topk)
+    if len(values) > lim: top_values['other'] = values.nsmallest(values.size - topk).sum()
+    return top_values
+
+
 def count_plot(df, kdim="manufacturer", lim=15):
     """Holoview count bars plot of the k-dimension.
 
@@ -47,7 +208,7 @@ def count_plot(df, kdim="manufacturer", lim=15):
     Generate the Holoviews bars plot using pandas.hvplot.
 
     Args:
-        df (pd.DataFrame): The DataFrame of the dataset
+        df (pd.DataFrame or FrequencyIndex): The DataFrame of the dataset, or its value counts
         kdim (str): The key-dimension
         lim (int): The limitation number of bars
 
@@ -55,13 +216,11 @@ def count_plot(df, kdim="manufacturer", lim=15):
         hv.element.chart.Bars: The holoview bars plot.
 
     """
+    hv = _holoviews()
     assert isinstance(kdim, str), "Please input your interested key dimension as string"
 
     # key_df = df.groupby([kdim]).size().sort_values(ascending=True).rename('count').reset_index()[:lim]
-    values = df[kdim].dropna().value_counts().sort_values(ascending=False)
-    topk = min(len(values), lim)
-    top_values = values.nlargest(topk)
-    if len(values) > lim: top_values['other'] = values.nsmallest(values.size - topk).sum()
+    top_values = _top_values(df, kdim, lim)
 
     key_df = pd.DataFrame({kdim: list(top_values.index), 'count': list(top_values.values)})[::-1]
 
@@ -69,34 +228,107 @@ def count_plot(df, kdim="manufacturer", lim=15):
     bars = hv.Bars(edata_key).relabel('%s count' % kdim).opts(invert_axes=True, width=600, height=400)
 
     return bars
-    
-from dash_table.Format import Sign
-    
+
+
+def _price_given_table(edata, kdim1, kdim2):
+    """Mean and std of the price per year, where kdim1 is kdim2.
+
+    Args:
+        edata (hv.Dataset or PriceAggregates): The dataset, or its precomputed aggregates
+        kdim1 (str): The key-dimension
+        kdim2 (str): Its value
+
+    Returns:
+        pd.DataFrame: The year, price and price_std columns, for the years in YEARS
+    """
+    if isinstance(edata, PriceAggregates):
+        return edata.given(kdim1, kdim2)
+    edata = edata[(edata['year']>=YEARS[0]) & (edata['year']<=YEARS[1])]
+    edata = edata[edata[kdim1] == kdim2]
+    return edata.aggregate('year', function=np.mean, spreadfn=np.std).sort().dframe()
+
+
 def price_tredency_plot_given(edata, kdim1="state", kdim2="CA"):
     """Holoview curve plot combined with pulldown widget of average price trendency of year given the k-dimension.
 
     Aggregate the data given the k-dimension and 'year'. Generate the curve plot with the pulldown widget.
+    If edata is a PriceAggregates, the aggregate is not computed but looked up,
+    and if it has quantiles, they are overlaid (see price_trendency_plot).
 
     Args:
-        arg1 (hv.Dataset): The hv.Dataset of the dataset
+        arg1 (hv.Dataset or PriceAggregates): The hv.Dataset of the dataset, 
+            or its precomputed aggregates
         arg2 (str): The key-dimension
 
     Returns:
-        hv.element.chart.Curve: The holoview curve plot
+        hv.element.chart.Curve: The holoview curve plot (an overlay if there are quantiles)
 
     """
+    hv = _holoviews()
     assert isinstance(kdim1, str), "Please input your interested key dimension as string"
     assert isinstance(kdim2, str), "Please input your interested key value as string"
 
-    edata = edata[(edata['year']>=2000) & (edata['year']<=2021)]
-    edata = edata[edata[kdim1] == kdim2]
-
-    agg = edata.aggregate('year', function=np.mean, spreadfn=np.std).sort()
-    plot = hv.Curve(agg).opts(width=1000, height=450)
+    table = _price_given_table(edata, kdim1, kdim2)
+    agg = hv.Dataset(table, kdims=['year'], vdims=['price', 'price_std'])
+    plot = hv.Curve(agg)
+    for element in _quantile_elements(hv, table, 'year'):
+        plot = plot * element
+    plot = plot.opts(width=1000, height=450)
 
     return plot
 
 
+def count_figure(df, kdim="manufacturer", lim=15):
+    """Plotly version of count_plot.
+
+    Args:
+        df (pd.DataFrame or FrequencyIndex): The DataFrame of the dataset, or its value counts
+        kdim (str): The key-dimension
+        lim (int): The limitation number of bars
+
+    Returns:
+        go.Figure: The horizontal count bars, the most frequent value on top
+
+    """
+    import plotly.graph_objects as go
+    assert isinstance(kdim, str), "Please input your interested key dimension as string"
+
+    top_values = _top_values(df, kdim, lim)[::-1]
+    fig = go.Figure(go.Bar(x=top_values.values, y=top_values.index.astype(str), orientation='h',
+                           name='%s count' % kdim, showlegend=False))
+    fig.update_layout(title='%s count' % kdim, width=600, height=400, margin=MARGIN,
+                      xaxis_title='count', yaxis_title=kdim)
+
+    return fig
+
+
+def price_trendency_figure_given(edata, kdim1="state", kdim2="CA"):
+    """Plotly version of price_tredency_plot_given.
+
+    Args:
+        edata (hv.Dataset or PriceAggregates): The hv.Dataset of the dataset, 
+            or its precomputed aggregates
+        kdim1 (str): The key-dimension
+        kdim2 (str): Its value
+
+    Returns:
+        go.Figure: The curve of the average price per year (and its quantiles)
+
+    """
+    import plotly.graph_objects as go
+    assert isinstance(kdim1, str), "Please input your interested key dimension as string"
+    assert isinstance(kdim2, str), "Please input your interested key value as string"
+
+    agg = _price_given_table(edata, kdim1, kdim2)
+    x = agg['year'].values
+    fig = go.Figure([go.Scatter(x=x, y=agg['price'].values, mode='lines', 
+                                line=dict(color=CURVE_COLOR, width=2), name='', showlegend=False),
+                     *_quantile_traces(x, agg)])
+    fig.update_layout(width=1000, height=450, margin=MARGIN, xaxis_title='year', yaxis_title='price')
+
+    return fig
+
+
 def get_count_cols(df):
     """Get the columns for the count plot.
 
@@ -127,13 +359,7 @@ def get_price_trendency_cols(df):
         List: The columns for the count plot
 
     """
-    cols = list(df.columns)
-    cols.remove('price')
-    cols.remove('region')
-    cols.remove('model')
-    cols.remove('posting_date')
-    cols.remove('posting_year')
-    cols.remove('posting_month')
+    cols = [col for col in df.columns if col not in NOT_PLOTTED_AGAINST_PRICE]
 
     return cols
 
@@ -149,14 +375,7 @@ def get_price_trendency_given_cols(df):
         List: The columns for the count plot
 
     """
-    cols = list(df.columns)
-    cols.remove('price')
-    cols.remove('year')
-    cols.remove('region')
-    cols.remove('model')
-    cols.remove('posting_date')
-    cols.remove('posting_year')
-    cols.remove('posting_month')
+    cols = [col for col in df.columns if col not in NOT_PLOTTED_AGAINST_PRICE and col != 'year']
 
     return cols
 
@@ -165,15 +384,19 @@ def get_price_trendency_given_vals(df, kdim):
     """Get the values of the sepcific key-dimension
 
     Given the columns, get all values in this columns and return as a list.
+    Only the rows without missing values are considered.
 
     Args:
-        df (pd.DataFrame): The pd.DataFrame of the dataset
+        df (pd.DataFrame or DistinctValues): The pd.DataFrame of the dataset, 
+            or its precomputed distinct values (which are sorted)
         kim (str): The key-dimension
 
     Returns:
         list: The values given the specific cols
 
     """
+    if isinstance(df, DistinctValues):
+        return df.values(kdim)
 
     vals = list(set(df.dropna()[kdim].tolist()))
 
@@ -186,12 +409,17 @@ def statewise_prices(df):
     Calculates the average price for each state (US only).
 
     Args:
-        df (pd.DataFrame): The pd.DataFrame of the dataset.
+        df (pd.DataFrame or PriceAggregates): The pd.DataFrame of the dataset, 
+            or its precomputed aggregates.
 
     Returns:
         px.choropleth: A plot of the statewide price averages.
     """
-    p = df.groupby(['state']).mean().price
+    import plotly.express as px
+    if isinstance(df, PriceAggregates):
+        p = df.by('state').set_index('state')['price']
+    else:
+        p = df.groupby(['state'])['price'].mean()
     statewise_prices = pd.DataFrame({'states':p.index, 'avg_price':p.values}) 
     statewise_prices['states'] = statewise_prices['states'].str.upper()
 
@@ -211,18 +439,16 @@ def plot_pie(df, col, cats, lim = 15):
     All other values will be assigned to the 'Other' group.
 
     Args:
-        df: The dataframe
+        df: The dataframe, or its FrequencyIndex
         col (str): The name of the categorical column.
         cats: The set of categorical columns (used only for checks)
         lim (int): The top number of values to group by.
     """
+    import plotly.express as px
     assert col in cats
 
-    values = df[col].dropna().value_counts().sort_values(ascending=False)
-    topk = min(len(values), lim)
-    top_values = values.nlargest(topk)
-    if len(values) > lim: top_values['other'] = values.nsmallest(values.size - topk).sum()
+    top_values = _top_values(df, col, lim)
     title = 'Number of cars by %s:' % (col.replace('_', ' '))
-    fig = px.pie(values, values=top_values.values, names=top_values.index, title=title,color_discrete_sequence=px.colors.sequential.RdBu)
+    fig = px.pie(values=top_values.values, names=top_values.index, title=title,color_discrete_sequence=px.colors.sequential.RdBu)
 
     return fig
@@ -92,6 +92,8 @@ def dropdown_and_plot(l: list, id: str, plot_height=None) -> html.Div:
 class Layout():
     """Layout of the application
 
+    The map of the prices per state is ``statewise_figure`` if it is given 
+    (for instance prerendered, see :mod:`carsreco.figures`), and is built from ``df`` otherwise.
 
     Attributes:
         full_layout: the layout of the entire page
@@ -105,7 +107,8 @@ class Layout():
     tab_1: Component
     tab_2: Component
 
-    def __init__(self, df: pd.DataFrame, model: prediction.IntervalPricePrediction): 
+    def __init__(self, df: pd.DataFrame, model: prediction.IntervalPricePrediction, 
+                 statewise_figure=None): 
         p = model
         li1 = get_price_trendency_cols(df)
         li2 = get_count_cols(df)
@@ -151,7 +154,8 @@ class Layout():
                             children =[
                                 dcc.Graph(
                                     id = "marital prob",
-                                    figure = statewise_prices(df),
+                                    figure = statewise_prices(df) if statewise_figure is None 
+                                             else statewise_figure,
                                     style={'height': 450, 'justify-content': 'center'}
                                 )
                             ],
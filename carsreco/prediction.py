@@ -1,32 +1,540 @@
 """
 Time range prediction script.
+
+The model is fitted at deploy time by :mod:`scripts.fit`, which writes its parameters to
+``data/prediction.npz`` (see :meth:`IntervalPricePrediction.save`). The dashboard loads
+them (see :meth:`IntervalPricePrediction.load`) instead of fitting the model on the
+dataset, when they were fitted on the same data.
 """
 
 from __future__ import annotations
 
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Optional, Sequence
+
 import numpy as np
 import pandas as pd
-from scipy.stats import norm
-from scipy.stats import expon
+
+from .aggregates import GroupStats
+from .cache import LRUCache
+from .data import dataset_version, StaleSnapshotError
+
+MODEL_PATH = Path("data/prediction.npz")
+
+#: version of the format of the files written by :meth:`IntervalPricePrediction.save`
+MODEL_VERSION = 2
+
+#: beyond this number of standard deviations of its mean price,
+#: P(price in [p1,p2] | model_name) < 1e-9 (see :meth:`ModelArrays.top_models`)
+NEGLIGIBLE_SIGMAS = 6
+
+#: maximal size of the (queries x models) matrices of :meth:`ModelArrays.top_models_batch`
+BLOCK_CELLS = 1 << 20
+
+@dataclass(frozen=True)
+class ModelArrays:
+    """The per-model quantities of :meth:`IntervalPricePrediction.get_CI`, computed once.
+
+    The arrays are aligned with the rows of the model parameters, and read-only, so that
+    the model can be queried from several threads.
+
+    Attributes:
+        models: the car model names
+        manufacturers: their manufacturers
+        p: P(model_name)
+        mean: the mean price
+        std: the standard deviation of the mean price (NaN if it can not be estimated)
+        lambdas: the rate of the posts of the model (per minute)
+        brand_models: manufacturer -> the (sorted) indices of its models
+        by_probability: the indices of the models, by decreasing P(model_name)
+            (see :meth:`top_models`)
+        price_low: the mean price minus :data:`NEGLIGIBLE_SIGMAS` standard deviations:
+            P(price in [p1,p2] | model_name) is negligible if p2 is below it
+        price_high: the mean price plus :data:`NEGLIGIBLE_SIGMAS` standard deviations
+        scan: (4 x models) P(model_name), price_low, price_high and the upper bound of
+            P(price in [p1,p2], model_name) / (p2 - p1) of the models, in the order of
+            :attr:`by_probability` (see :meth:`top_models`)
+    """
+    models: np.ndarray
+    manufacturers: np.ndarray
+    p: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray
+    lambdas: np.ndarray
+    brand_models: Mapping[str, np.ndarray]
+    by_probability: np.ndarray
+    price_low: np.ndarray
+    price_high: np.ndarray
+    scan: np.ndarray
+
+    @classmethod
+    def from_params(cls, model_params: pd.DataFrame) -> ModelArrays:
+        """Computes the arrays from the parameters of :meth:`IntervalPricePrediction.estimate_parameters`
+
+        Args:
+            model_params (pd.DataFrame): the model parameters
+
+        Returns:
+            ModelArrays: the arrays
+        """
+        n = model_params['model']['count'].values.astype(np.float64)
+        minutes = (model_params['posting_date']['max'] - model_params['posting_date']['min']).values\
+            .astype('timedelta64[m]').astype(np.float64)
+        # np.array: the columns of the compact dataframe are categorical
+        manufacturers = np.array(model_params['manufacturer']['first'], dtype=object)
+        brand_models = {brand: np.flatnonzero(manufacturers == brand) for brand in pd.unique(manufacturers)}
+        for models in brand_models.values():
+            models.setflags(write=False)
+        return cls.from_statistics(np.array(model_params.index, dtype=object), manufacturers, 
+                                   MappingProxyType(brand_models), n, 
+                                   model_params['price']['mean'].values,
+                                   model_params['price']['std'].values, minutes)
+
+    @classmethod
+    def from_statistics(cls, models: np.ndarray, manufacturers: np.ndarray, 
+                        brand_models: Mapping[str, np.ndarray], n: np.ndarray, mean: np.ndarray,
+                        std: np.ndarray, minutes: np.ndarray) -> ModelArrays:
+        """Computes the arrays from the statistics of each model
+
+        Args:
+            models: the car model names
+            manufacturers: their manufacturers
+            brand_models: manufacturer -> the indices of its models
+            n: the number of posts of each model
+            mean: their mean price
+            std: the standard deviation of their price (ddof=1)
+            minutes: the time between their first and last post, in minutes
+
+        Returns:
+            ModelArrays: the arrays
+        """
+        n = np.asarray(n, dtype=np.float64)
+        mean = np.ascontiguousarray(mean, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.asarray(std, dtype=np.float64) / np.sqrt(n)
+            lambdas = n / minutes
+            # without any post (e.g. no car of the years), no model has a probability
+            p = n / n.sum() if n.sum() else np.zeros_like(n)
+        # like scipy's distributions, a scale of 0 is invalid: the model has no probability
+        std[~(std > 0)] = np.nan
+        by_probability = np.argsort(-p, kind='stable')
+        price_low, price_high = mean - NEGLIGIBLE_SIGMAS * std, mean + NEGLIGIBLE_SIGMAS * std
+        # P(price in [p1,p2] | model_name) <= (p2 - p1) * (the maximum of the normal density)
+        density = p / (std * np.sqrt(2 * np.pi))
+        scan = np.stack([p, price_low, price_high, density])[:, by_probability]
+        arrays = cls(models=models, manufacturers=manufacturers, p=p,
+                     mean=mean, std=std, lambdas=lambdas, brand_models=brand_models,
+                     by_probability=by_probability, price_low=price_low, price_high=price_high,
+                     scan=scan)
+        for array in [arrays.models, arrays.manufacturers, arrays.p, arrays.mean, arrays.std,
+                      arrays.lambdas, arrays.by_probability, arrays.price_low, arrays.price_high,
+                      arrays.scan]:
+            array.setflags(write=False)
+        return arrays
+
+    def brand_indices(self, brands: Sequence[str]) -> np.ndarray:
+        """The sorted indices of the models of some manufacturers (all the models if there are none)"""
+        if not len(brands):
+            return np.arange(len(self.models))
+        indices = [self.brand_models[brand] for brand in brands if brand in self.brand_models]
+        if len(indices) == 1:
+            return indices[0]
+        return np.unique(np.concatenate(indices)) if indices else np.empty(0, dtype=np.int64)
+
+    def top_models(self, p1, p2, brands: Sequence[str], k: int):
+        """The ``k`` models with the highest P(price in [p1,p2], model_name) (above 1e-7)
+
+        The models are scanned by decreasing P(model_name), in blocks of growing size. As
+        P(price in [p1,p2], model_name) <= P(model_name), the scan stops when the next models
+        can not be in the top ``k``: with many models, only the frequent ones are evaluated.
+        The probabilities are only computed for the models whose prices are close to
+        [p1,p2] (see :attr:`price_low`), those of the others are below 1e-9.
+
+        Args:
+            p1: lower bound of desired price
+            p2: upper bound of desired price
+            brands: the manufacturers of the models (all of them if empty)
+            k: the number of models
+
+        Returns:
+            tuple: the indices of the models (largest probability first, the models
+                with the same probability in their order), P(price in [p1,p2] | model_name)
+                and P(price in [p1,p2], model_name)
+        """
+        if len(brands):
+            order, scan = self._scan_order(self.brand_indices(brands))
+        else:
+            order, scan = self.by_probability, self.scan
+        p, price_low, price_high, density = scan
+        found, cond_probs, joint_probs = [], [], []
+        # the k-th largest probability found
+        kth = 0.
+        start, size = 0, 256
+        while start < len(order):
+            if p[start] <= 1e-7 or p[start] < kth:
+                break
+            block = slice(start, start + size)
+            start, size = start + size, 2 * size
+            # the models whose probability can be above 1e-7 (and the k-th one)
+            bound = np.minimum(p[block], (p2 - p1) * density[block]) * (1 + 1e-9)
+            candidates = (price_high[block] >= p1) & (price_low[block] <= p2) & (bound > 1e-7) & (bound >= kth)
+            candidates = order[block][candidates]
+            cond_prob = self.price_probability(p1, p2, candidates)
+            joint_prob = cond_prob * self.p[candidates]
+            kept = joint_prob > 1e-7
+            found.append(candidates[kept])
+            cond_probs.append(cond_prob[kept])
+            joint_probs.append(joint_prob[kept])
+            if start < len(order) and sum(len(probs) for probs in joint_probs) >= k:
+                kth = np.partition(np.concatenate(joint_probs), -k)[-k]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        found, cond_prob, joint_prob = np.concatenate(found), np.concatenate(cond_probs), np.concatenate(joint_probs)
+        # in the order of the models, so that the stable sort of _top_k keeps them in this order
+        order = np.argsort(found, kind='stable')
+        found, cond_prob, joint_prob = found[order], cond_prob[order], joint_prob[order]
+        top = _top_k(joint_prob, k)
+        return found[top], cond_prob[top], joint_prob[top]
+
+    def top_models_batch(self, p1, p2, brands: Optional[Sequence[Sequence[str]]], k: int):
+        """:meth:`top_models` for many price ranges at once
+
+        The queries of all the manufacturers scan the models together, as in :meth:`top_models`,
+        and those of each manufacturer scan its models together: the probabilities of a
+        block of models are only computed for the (query, model) pairs that pass the bounds
+        of :meth:`top_models`. The models of a query with several manufacturers are the top
+        ``k`` of those of its manufacturers.
+
+        Args:
+            p1 (np.ndarray): lower bounds of the desired prices, one per query
+            p2 (np.ndarray): upper bounds of the desired prices, one per query
+            brands (list): the manufacturers of each query (an empty list for all of them),
+                or None for all the manufacturers in every query
+            k: the number of models per query
+
+        Returns:
+            tuple: the queries (sorted), their models (largest probability first, as in
+                :meth:`top_models`), P(price in [p1,p2] | model_name) and P(price in [p1,p2], model_name)
+        """
+        p1, p2 = np.asarray(p1, dtype=np.float64), np.asarray(p2, dtype=np.float64)
+        if brands is None:
+            brands = [[]] * len(p1)
+        # manufacturer (None for all of them) -> its queries
+        groups: dict[Optional[str], list[int]] = {}
+        for query, query_brands in enumerate(brands):
+            for brand in (set(query_brands) if len(query_brands) else [None]):
+                if brand is None or brand in self.brand_models:
+                    groups.setdefault(brand, []).append(query)
+        found = [(np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0), np.empty(0))]
+        for brand, queries in groups.items():
+            order, scan = (self.by_probability, self.scan) if brand is None else self._scan_order(self.brand_models[brand])
+            found.append(self._scan(order, scan, p1, p2, np.array(queries), k))
+        return _top_pairs(*(np.concatenate(arrays) for arrays in zip(*found)), k)
+
+    def _scan_order(self, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """the models ``indices`` by decreasing P(model_name), and their :attr:`scan` arrays"""
+        order = indices[np.argsort(-self.p[indices], kind='stable')]
+        return order, np.stack([self.p[order], self.price_low[order], self.price_high[order],
+                                self.p[order] / (self.std[order] * np.sqrt(2 * np.pi))])
+
+    def _scan(self, order: np.ndarray, scan: np.ndarray, p1: np.ndarray, p2: np.ndarray,
+              active: np.ndarray, k: int) -> tuple:
+        """the top ``k`` models of the queries ``active`` among the models ``order`` (see
+        :meth:`top_models_batch`), as the (query, model) pairs of :func:`_top_pairs`"""
+        p, price_low, price_high, density = scan
+        found = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0), np.empty(0))
+        # the k-th largest probability found for each query
+        kth = np.zeros(len(p1))
+        start, size = 0, 256
+        while start < len(order):
+            active = active[(p[start] > 1e-7) & (p[start] >= kth[active])]
+            if not len(active):
+                break
+            block = slice(start, start + size)
+            # the next blocks are larger, but the (queries x block) matrices stay small
+            start, size = start + size, max(256, min(2 * size, BLOCK_CELLS // len(active)))
+            low, high = p1[active, None], p2[active, None]
+            bound = np.minimum(p[block], (high - low) * density[block]) * (1 + 1e-9)
+            candidates = ((price_high[block] >= low) & (price_low[block] <= high)
+                          & (bound > 1e-7) & (bound >= kth[active, None]))
+            rows, columns = np.nonzero(candidates)
+            queries, models = active[rows], order[block][columns]
+            cond_prob = self.price_probability(p1[queries], p2[queries], models)
+            joint_prob = cond_prob * self.p[models]
+            kept = (joint_prob > 1e-7) & (joint_prob >= kth[queries])
+            found = _top_pairs(*(np.concatenate(arrays) for arrays in
+                                 zip(found, (queries[kept], models[kept], cond_prob[kept], joint_prob[kept]))), k)
+            queries, joint_prob = found[0], found[3]
+            starts = np.searchsorted(queries, np.arange(len(p1)))
+            enough = np.searchsorted(queries, np.arange(len(p1)), side='right') - starts >= k
+            kth[enough] = joint_prob[starts[enough] + k - 1]
+        return found
+
+    def price_probability(self, p1, p2, indices=slice(None)) -> np.ndarray:
+        """P(price in [p1,p2] | model_name), for the models ``indices`` (the last axis)"""
+        from scipy.special import ndtr # the cdf of the standard normal distribution
+        mean, std = self.mean[indices], self.std[indices]
+        return ndtr((p2 - mean) / std) - ndtr((p1 - mean) / std)
+
+
+class YearStrata:
+    """Sufficient statistics of each model, per year of the cars, to estimate the parameters
+    of the cars of any range of years (see :meth:`arrays`).
+
+    Most models only have cars of a few years: only the (model, year) cells with cars are
+    kept, by model (the compressed sparse rows of the models x years statistics). The count,
+    sum and sum of squares of the prices are kept as prefix sums over the years of each model,
+    so that those of a range of years are the difference of two cells. The prices are
+    shifted by the mean price of their model, which keeps the sum of squares accurate.
+
+    Attributes:
+        years: the sorted years of the cars
+        indptr: (models + 1) the cells of the model ``i`` are ``indptr[i]:indptr[i + 1]``
+        year: (cells) the index in :attr:`years` of the year of each cell, increasing within a model
+        count: (cells) prefix sums of the number of posts
+        sum: (cells) prefix sums of the shifted prices
+        sum_squares: (cells) prefix sums of the squares of the shifted prices
+        shift: the price subtracted from the prices of each model
+        first: (cells) first post of the cell (ns since the epoch)
+        last: (cells) last post of the cell (ns since the epoch)
+    """
+
+    def __init__(self, df: pd.DataFrame, arrays: ModelArrays):
+        """Computes the statistics
+
+        Args:
+            df (pd.DataFrame): the posts, with the model, price, posting_date and year columns
+                (the posts without a year are ignored)
+            arrays (ModelArrays): the parameters of the models, estimated from all the posts
+        """
+        df = df[df['year'].notna()]
+        self.years = np.unique(df['year'].values.astype(np.int64))
+        model = pd.Index(arrays.models).get_indexer(df['model'])
+        year = np.searchsorted(self.years, df['year'].values.astype(np.int64))
+        cells, cell = np.unique(model * len(self.years) + year, return_inverse=True)
+        cell_model = cells // max(len(self.years), 1)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(cell_model, minlength=len(arrays.models)))])
+        self.year = cells - cell_model * len(self.years)
+        self.shift = arrays.mean
+        price = df['price'].values.astype(np.float64) - self.shift[model]
+
+        def prefix_sum(weights):
+            sums = np.bincount(cell, weights, minlength=len(cells))
+            return pd.Series(sums, dtype=np.float64).groupby(cell_model).cumsum().values
+
+        self.count = prefix_sum(None).astype(np.int64)
+        self.sum = prefix_sum(price)
+        self.sum_squares = prefix_sum(price ** 2)
+        dates = pd.Series(_nanoseconds(df['posting_date'])).groupby(cell).agg(['min', 'max'])
+        self.first, self.last = dates['min'].values, dates['max'].values
+        self._init(arrays)
+
+    def _init(self, arrays: ModelArrays):
+        # the model of each cell
+        self._model = np.repeat(np.arange(len(arrays.models)), np.diff(self.indptr))
+        self._arrays = arrays
+        # there are few ranges of years (the slider has about 250), but the arrays of each
+        # range take about 128 bytes per model: they are kept within about 128MB
+        self._cache = LRUCache(int(np.clip((128 << 20) // (128 * max(len(arrays.models), 1)), 8, 512)))
+
+    #: the attributes saved by :meth:`to_arrays`
+    saved = ['years', 'indptr', 'year', 'count', 'sum', 'sum_squares', 'shift', 'first', 'last']
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """the statistics, to be saved (see :meth:`from_arrays`)"""
+        return {name: getattr(self, name) for name in self.saved}
+
+    @classmethod
+    def from_arrays(cls, saved: dict[str, np.ndarray], arrays: ModelArrays) -> YearStrata:
+        """The statistics saved by :meth:`to_arrays`
+
+        Args:
+            saved: the arrays of the statistics
+            arrays: the parameters of the models, estimated from all the posts
+
+        Returns:
+            YearStrata: the statistics
+        """
+        strata = cls.__new__(cls)
+        for name in cls.saved:
+            setattr(strata, name, saved[name])
+        strata._init(arrays)
+        return strata
+
+    def arrays(self, first_year: float, last_year: float) -> ModelArrays:
+        """The parameters of the models, estimated from the cars of the years [first_year, last_year]
+
+        Args:
+            first_year: the first year
+            last_year: the last year (included)
+
+        Returns:
+            ModelArrays: the parameters
+        """
+        low = int(np.searchsorted(self.years, first_year, side='left'))
+        high = max(low, int(np.searchsorted(self.years, last_year, side='right')))
+        return self._cache.get((low, high), lambda: self._estimate(low, high))
+
+    def _estimate(self, low: int, high: int) -> ModelArrays:
+        """the parameters of the cars of the years ``self.years[low:high]``"""
+        # the years of a model are increasing: its cells in the years are consecutive
+        cells = np.flatnonzero((self.year >= low) & (self.year < high))
+        cell_model = self._model[cells]
+        first, last = np.flatnonzero(np.diff(cell_model, prepend=-1)), np.flatnonzero(np.diff(cell_model, append=-1))
+        models = cell_model[first]
+        # the cells of the model models[i] are start_cell[i]:end_cell[i]
+        start_cell, end_cell = cells[first], cells[last] + 1
+
+        def range_sum(prefix):
+            sums = np.zeros(len(self.indptr) - 1, dtype=prefix.dtype)
+            sums[models] = prefix[end_cell - 1] - np.where(start_cell > self.indptr[models], prefix[start_cell - 1], 0)
+            return sums
+
+        n = range_sum(self.count).astype(np.float64)
+        shifted_sum = range_sum(self.sum)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shifted_mean = shifted_sum / n
+            variance = (range_sum(self.sum_squares) - shifted_sum * shifted_mean) / (n - 1)
+        std = np.sqrt(np.maximum(variance, 0))
+        std[n < 2] = np.nan
+        minutes = np.full(len(n), np.nan)
+        if len(models):
+            minutes[models] = (np.maximum.reduceat(self.last[cells], first)
+                               - np.minimum.reduceat(self.first[cells], first)) // 60_000_000_000
+        arrays = self._arrays
+        return ModelArrays.from_statistics(arrays.models, arrays.manufacturers, arrays.brand_models,
+                                           n, self.shift + shifted_mean, std, minutes)
+
+
+def _nanoseconds(dates: pd.Series) -> np.ndarray:
+    """the dates, as nanoseconds since the epoch (UTC)"""
+    return dates.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _datetimes(nanoseconds: np.ndarray, timezone: Optional[str]) -> pd.DatetimeIndex:
+    """inverse of :func:`_nanoseconds`"""
+    dates = pd.DatetimeIndex(nanoseconds.view('datetime64[ns]'))
+    return dates if timezone is None else dates.tz_localize('UTC').tz_convert(timezone)
+
+
+def _top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """The indices of the ``k`` largest values, largest first (equal values stay in their order)
+
+    The candidates are selected with a partial sort, and only them are sorted.
+    """
+    if len(values) > k:
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        # the values equal to the kth one are all kept, the stable sort takes the first ones
+        candidates = np.flatnonzero(values >= kth)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind='stable')[:k]]
+
+
+def _top_pairs(queries: np.ndarray, models: np.ndarray, cond_prob: np.ndarray, joint_prob: np.ndarray,
+               k: int) -> tuple:
+    """The ``k`` (query, model) pairs with the largest joint probability of each query, sorted
+    by query, then by decreasing probability (the models with the same probability in their order)"""
+    order = np.lexsort((models, -joint_prob, queries))
+    queries, models, cond_prob, joint_prob = queries[order], models[order], cond_prob[order], joint_prob[order]
+    # the rank of each pair among those of its query
+    top = np.arange(len(queries)) - np.searchsorted(queries, queries) < k
+    return queries[top], models[top], cond_prob[top], joint_prob[top]
+
+
+def _expon_interval(alpha: float, lambdas: np.ndarray):
+    """``scipy.stats.expon.interval(alpha, scale=1/lambdas)``, rounded to 2 decimals"""
+    scale = 1 / lambdas
+    scale[~(scale > 0)] = np.nan
+    low, high = -np.log1p(-np.array([(1 - alpha) / 2, (1 + alpha) / 2]))
+    return np.around(low * scale, 2), np.around(high * scale, 2)
+
 
 class IntervalPricePrediction:
     """The class representing predictions for time ranges along with confidence intervals.
 
+    The parameters of each model are estimated once (see :meth:`estimate_parameters`)
+    and frozen into arrays (see :class:`ModelArrays`). The predictions only read them: the
+    model can be shared by the threads of a server.
+
+    If the dataframe has the year of the cars, the predictions can be restricted to a
+    range of years (see :class:`YearStrata`).
+
+    The fitted model can be saved (see :meth:`save`), and loaded without the dataframe
+    (see :meth:`load`).
+
     Args:
         df (pd.DataFrame): The dataframe to run the prediction on.
 
     Attributes:
-        df (pd.DataFrame): The dataframe to run the prediction on.
+        df (pd.DataFrame): The dataframe to run the prediction on (None if the model was loaded).
         model_params (pd.DataFrame): The parameters to be used during time range prediction.
+            Setting them recomputes :attr:`arrays` and :attr:`strata`.
+        arrays (ModelArrays): The per-model quantities used by the predictions.
+        strata (YearStrata): The statistics of the models per year (None without the years)
+        manufacturer_names (np.ndarray): The manufacturers of the models
+        fingerprint (str): The version of the dataframe (see :func:`carsreco.data.dataset_version`)
     """
-    df: pd.DataFrame
-    model_params: pd.DataFrame
+    df: Optional[pd.DataFrame]
+    arrays: ModelArrays
+    strata: Optional[YearStrata]
+    manufacturer_names: np.ndarray
+    fingerprint: str
+
+    #: the columns of the dataframe used by the model
+    columns = ['model', 'manufacturer', 'price', 'posting_date']
 
-    def __init__(self, df: pd.DataFrame):
-        df = df[df['model'].isin(df.groupby('model')['model'].count().sort_values(ascending=False)[:250].index)]
+    def __init__(self, df: pd.DataFrame, min_count: int=1, max_models: Optional[int]=None):
+        """Fits the model, on every model of the dataframe by default
+
+        Args:
+            df (pd.DataFrame): The dataframe to run the prediction on.
+            min_count (int): The minimal number of posts of a model. The models with a single
+                post never have a probability (their price has no variance), but they count
+                in P(model_name)
+            max_models (int): If not None, only keep this number of models (the most frequent ones)
+        """
+        self.fingerprint = dataset_version(df)
+        df = df[[*self.columns, 'year']] if 'year' in df.columns else df[self.columns]
+        counts = df.groupby('model', observed=True)['model'].count()
+        counts = counts[counts >= min_count]
+        if max_models is not None:
+            counts = counts.sort_values(ascending=False)[:max_models]
+        if len(counts) < df['model'].nunique():
+            df = df[df['model'].isin(counts.index)]
         self.df = df
+        self.manufacturer_names = np.asarray(df['manufacturer'].unique())
         self.model_params = self.estimate_parameters()
 
+    @property
+    def model_params(self) -> pd.DataFrame:
+        return self._model_params
+
+    @model_params.setter
+    def model_params(self, model_params: pd.DataFrame):
+        self._model_params = model_params
+        self.arrays = ModelArrays.from_params(model_params)
+        self.strata = YearStrata(self.df, self.arrays) \
+            if self.df is not None and 'year' in self.df.columns else None
+
+    def year_arrays(self, years: Optional[Sequence[float]]) -> ModelArrays:
+        """The per-model quantities of the cars of a range of years
+
+        Args:
+            years: the first and last years (included), or None for all the cars
+
+        Returns:
+            ModelArrays: the quantities
+        """
+        if years is None:
+            return self.arrays
+        if self.strata is None:
+            raise ValueError("the model was built without the years of the cars")
+        return self.strata.arrays(*years)
 
     def estimate_parameters(self) -> pd.DataFrame:
         """Estimate the parameters of the distributions
@@ -36,12 +544,15 @@ class IntervalPricePrediction:
         Returns:
             pd.DataFrame: Dataframe containing model parameters for each car model_name
         """    
-        model_params: pd.DataFrame = self.df\
-            .groupby('model')\
-            .aggregate({"price": ['mean','std'],
-                        "model": 'count',
-                        "posting_date":['max','min'],
+        price = GroupStats.from_frame(self.df, ['model'])
+        dates: pd.DataFrame = self.df\
+            .groupby('model', observed=True)\
+            .aggregate({"posting_date":['max','min'],
                         "manufacturer": "first"}) #type:ignore
+        model_params = pd.concat([
+            pd.DataFrame({('price', 'mean'): price.mean, ('price', 'std'): price.std(ddof=1),
+                          ('model', 'count'): price.count}, index=price.keys),
+            dates], axis=1)
         return model_params
     
     def get_manufacturer_names(self):
@@ -50,47 +561,128 @@ class IntervalPricePrediction:
         Returns:
             list: list of manufacturer names
         """        
-        return self.df['manufacturer'].unique()
+        return self.manufacturer_names
+
+    def save(self, path=MODEL_PATH) -> None:
+        """Writes the fitted model to a npz file (the parameters, not the dataframe)
+
+        The file holds :data:`MODEL_VERSION` and the fingerprint of the data the model was
+        fitted on. It is replaced atomically.
+
+        Args:
+            path: the file
+        """
+        params = self.model_params
+        dates = params['posting_date']
+        timezone = getattr(dates['min'].dtype, 'tz', None)
+        arrays = {'models': np.asarray(params.index.values, dtype=str),
+                  'manufacturers': np.asarray(params['manufacturer']['first'].values, dtype=str),
+                  'count': params['model']['count'].values,
+                  'mean': params['price']['mean'].values,
+                  'std': params['price']['std'].values,
+                  'date_min': _nanoseconds(dates['min']),
+                  'date_max': _nanoseconds(dates['max']),
+                  'manufacturer_names': np.asarray(self.manufacturer_names, dtype=str)}
+        if self.strata is not None:
+            arrays.update({f'strata_{name}': values for name, values in self.strata.to_arrays().items()})
+        meta = {'version': MODEL_VERSION, 'fingerprint': self.fingerprint,
+                'timezone': None if timezone is None else str(timezone),
+                'index_name': params.index.name}
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
 
-    def get_CI(self, p1:float, p2:float, brands=[], alpha=0.95):
+    @classmethod
+    def load(cls, path=MODEL_PATH, fingerprint: Optional[str]=None) -> IntervalPricePrediction:
+        """Reads a model written by :meth:`save`, without the dataframe
+
+        Args:
+            path: the file
+            fingerprint: if not None, the version of the data the model must have been fitted on
+
+        Raises:
+            StaleSnapshotError: if the model was fitted on other data, or written by an 
+                incompatible version
+
+        Returns:
+            IntervalPricePrediction: the model
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['__meta__']))
+            if meta['version'] != MODEL_VERSION:
+                raise StaleSnapshotError(f"{path} version {meta['version']} is not {MODEL_VERSION}")
+            if fingerprint is not None and meta['fingerprint'] != fingerprint:
+                raise StaleSnapshotError(f"{path} was not fitted on the current data")
+            arrays = dict(arrays)
+        model = cls.__new__(cls)
+        model.df = None
+        model.fingerprint = meta['fingerprint']
+        model.manufacturer_names = arrays['manufacturer_names'].astype(object)
+        index = pd.Index(arrays['models'].astype(object), name=meta['index_name'])
+        model.model_params = pd.DataFrame({
+            ('price', 'mean'): arrays['mean'], ('price', 'std'): arrays['std'],
+            ('model', 'count'): arrays['count'],
+            ('posting_date', 'max'): _datetimes(arrays['date_max'], meta['timezone']),
+            ('posting_date', 'min'): _datetimes(arrays['date_min'], meta['timezone']),
+            ('manufacturer', 'first'): arrays['manufacturers'].astype(object)}, index=index)
+        if 'strata_years' in arrays:
+            model.strata = YearStrata.from_arrays(
+                {name: arrays[f'strata_{name}'] for name in YearStrata.saved}, model.arrays)
+        return model
+
+    def get_CI(self, p1:float, p2:float, brands=[], alpha=0.95, years=None):
         """Calculates the probability of a model being in the desired price range and the 95% interval for the next post.
 
         Args:
             p1 (float): lower bound of desired price
             p2 (float): upper bound of desired price
+            brands (list): the manufacturers to consider (all of them if empty)
             alpha (float): Confidence interval value
+            years (tuple): only consider the cars of these years (first, last), see :meth:`year_arrays`
 
         Returns:
             list (tuple): [(manufacturer, model_name, probability of price in [p1,p2] for model, lower bound of time in mins, upper bound of time in mins)]
         """
-        if not brands: brands = list(self.model_params['manufacturer']['first'].unique())
-
-        # P(model_name)
-        n = self.model_params['model']['count']
-        p = n/self.model_params['model']['count'].sum()
-        # Mean and std of the Gaussian model      
-        mean = self.model_params['price']['mean']
-        std = self.model_params['price']['std']/np.sqrt(n)
-        # lambdas of the exponential distribution
-        lambdas = n / (self.model_params['posting_date']['max']\
-                     - self.model_params['posting_date']['min']).astype('timedelta64[m]')
-        # P(price in [p1,p2] | model_name)
-        self.model_params['cond_prob'] = norm.cdf(p2, loc=mean, scale=std)\
-            - norm.cdf(p1, loc=mean, scale=std)
-        # P(price in [p1,p2], model_name)
-        joint_prob = self.model_params['cond_prob']*p
+        arrays = self.year_arrays(years)
         # consider only models with high probability of being in desired price range
-        top10 = min(len(joint_prob), 10)
-        high_prob_models_probs = joint_prob\
-                               .sort_values(ascending=False)\
-                               .loc[self.model_params['manufacturer']['first'].isin(brands)][:top10]
-        high_prob_models_probs = high_prob_models_probs[high_prob_models_probs > 1e-7]
-        high_prob_models = high_prob_models_probs.index
+        # (P(price in [p1,p2], model_name)), among the models of the brands
+        high_prob_models, cond_prob, joint_prob = arrays.top_models(p1, p2, brands, 10)
 
         # T(price_range, model_name) is exponential with lambda defined below
-        lambda_joint = lambdas.loc[high_prob_models]/self.model_params.loc[high_prob_models]['cond_prob']
-        return list(zip(self.model_params.loc[high_prob_models]['manufacturer']['first'],
-                        high_prob_models,
-                        high_prob_models_probs,
-                        np.around(expon.interval(alpha, scale=1/lambda_joint)[0], 2),
-                        np.around(expon.interval(alpha, scale=1/lambda_joint)[1], 2)))
+        lambda_joint = arrays.lambdas[high_prob_models] / cond_prob
+        low, high = _expon_interval(alpha, lambda_joint)
+        return list(zip(arrays.manufacturers[high_prob_models],
+                        arrays.models[high_prob_models],
+                        joint_prob,
+                        low,
+                        high))
+
+    def get_CI_batch(self, p1, p2, brands: Optional[Sequence[Sequence[str]]]=None, alpha=0.95, k=10,
+                     years=None):
+        """Calculates the results of :meth:`get_CI` for many price ranges at once.
+
+        The top ``k`` models of all the queries are found in one scan of the models
+        (see :meth:`ModelArrays.top_models_batch`).
+
+        Args:
+            p1 (array-like): lower bounds of the desired prices, one per query
+            p2 (array-like): upper bounds of the desired prices, one per query
+            brands (list): the manufacturers of each query (an empty list for all of them),
+                or None for all the manufacturers in every query
+            alpha (float): Confidence interval value
+            k (int): the maximal number of results per query
+            years (tuple): only consider the cars of these years (first, last), for every query
+
+        Returns:
+            list: for each query, the list of results of :meth:`get_CI`
+        """
+        arrays = self.year_arrays(years)
+        queries, models, cond_prob, joint_prob = arrays.top_models_batch(p1, p2, brands, k)
+        low, high = _expon_interval(alpha, arrays.lambdas[models] / cond_prob)
+        manufacturers, names = arrays.manufacturers[models], arrays.models[models]
+        bounds = np.searchsorted(queries, np.arange(len(p1) + 1))
+        return [list(zip(manufacturers[start:end], names[start:end], joint_prob[start:end],
+                         low[start:end], high[start:end]))
+                for start, end in zip(bounds[:-1], bounds[1:])]
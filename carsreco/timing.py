@@ -0,0 +1,31 @@
+"""
+Helpers to measure the time spent in the different stages of a computation.
+
+They are used to log the startup time of the application (see :func:`carsreco.dashboard.create_app`)
+and the time taken by the preprocessing (see :mod:`scripts.preprocessing`).
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from logging import debug
+import time
+
+@contextmanager
+def stage(timings: dict[str, float], name: str):
+    """Context manager adding the time spent in its block to ``timings[name]``
+
+    Args:
+        timings: the timings of the stages, in seconds
+        name: the name of the stage
+    """
+    debug(f"{name}...")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.) + time.perf_counter() - start
+
+def format_timings(timings: dict[str, float]) -> str:
+    """formats timings as one indented ``name: seconds`` line per stage"""
+    return "\n".join(f"    {name}: {seconds:.2f}s" for name, seconds in timings.items())
@@ -3,30 +3,119 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import Optional, Sequence
 
 from dataclasses import dataclass, field
 from datetime import datetime
+import os
+import threading
 import dateutil
 
 import requests
+from requests.adapters import HTTPAdapter
+
+#: number of connections kept open to each host, per worker
+POOL_SIZE = 10
+
+#: (connect, read) timeouts of the requests, in seconds
+TIMEOUT = (3.05, 10)
+
+#: maximal number of page ids of a request to the api
+MAX_PAGES = 50
+
+#: maximal number of introductions of pages in the answer of a request (see ``exlimit``)
+MAX_EXTRACTS = 20
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_pool_size = POOL_SIZE
+_timeout = TIMEOUT
+_lock = threading.Lock()
+
+def configure_session(pool_size: int=POOL_SIZE, timeout: tuple[float, float]=TIMEOUT) -> None:
+    """configure the session of the requests to the wikimedia api
+
+    The connections of the session are kept open and reused by the next requests (keep-alive),
+    instead of opening a new connection (and TLS handshake) per request. The session is
+    created at the first request of each process.
+
+    Args:
+        pool_size: the number of connections kept open to each host. The requests made
+            by more threads at once wait for a connection
+        timeout: the (connect, read) timeouts of the requests, in seconds
+    """
+    global _session, _pool_size, _timeout
+    with _lock:
+        _pool_size, _timeout = pool_size, timeout
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def get_session() -> requests.Session:
+    """the pooled session of the requests to the wikimedia api (see :func:`configure_session`)
+
+    Returns:
+        the session of this process (the connections of a forked parent are not shared)
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_pool_size, pool_block=True)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pid = os.getpid()
+        return _session
 
 def make_wikimedia_request(api_url="https://en.wikipedia.org/w/api.php", **parameters):
     """make a request to wikimedia api
 
-    Uses the requests library to make a post request to the wikimedia api with sensible defaults
+    Uses the pooled session of :func:`get_session` to make a get request to the wikimedia
+    api with sensible defaults, and the timeouts of :func:`configure_session`
 
     Args:
         api_url: the url of the api. The default is to use wikipedia
         parameters: keword args passed to the wikimedia api
 
+    Raises:
+        requests.Timeout: if the api does not answer in time
+
     Returns:
         the deserialized json response to the request
     """
-    r =  requests.get(api_url, params = dict(format="json", **parameters))
+    r = get_session().get(api_url, params=dict(format="json", **parameters), timeout=_timeout)
     assert r.status_code == 200, "Bad request made to wikipedia"
     return r.json()
 
+def wikipedia_query_pages(pageids: Sequence[int], batch_size: int=MAX_PAGES, **parameters) -> dict[str, dict]:
+    """queries the properties of many pages
+
+    uses the query api call, with the ids of ``batch_size`` pages per request (joined
+    with ``|``). When the api does not give all the properties of a batch at once, the
+    rest is requested with its ``continue`` parameters
+
+    Args:
+        pageids: the ids of the pages
+        batch_size: the number of pages per request
+        parameters: additional parameters to pass to the api (the properties)
+
+    Returns:
+        page id (as a string) -> the page in the answers of the api
+    """
+    pages: dict[str, dict] = {}
+    pageids = list(dict.fromkeys(pageids))
+    for start in range(0, len(pageids), batch_size):
+        batch = "|".join(str(pageid) for pageid in pageids[start:start + batch_size])
+        continued: dict = {}
+        while True:
+            r = make_wikimedia_request(action="query", pageids=batch, **parameters, **continued)
+            for pageid, page in r["query"]["pages"].items():
+                pages.setdefault(pageid, {}).update(page)
+            if "continue" not in r:
+                break
+            continued = r["continue"]
+    return pages
+
 def wikipedia_query_search(query, **parameters):
     """searches on wikipedia
 
@@ -125,15 +214,28 @@ class WikipediaPage():
                   "width": the width of the image
                   "height": the height of the image}
         """
-        r = make_wikimedia_request(action="query", 
-                                   prop="pageimages", 
-                                   piprop="original", 
-                                   pageids=self.pageid,
-                                  pilicense="free")
-        pages = r["query"]["pages"]
-        _, onlypage = pages.popitem()
-        file = onlypage.get("original", None)
-        return file
+        return self.get_thumbnails([self])[0]
+
+    @classmethod
+    def get_thumbnails(cls, pages: Sequence[Optional[WikipediaPage]]) -> list[Optional[dict]]:
+        """get the thumbnails of many pages
+
+        get the main images of the pages (see :func:`get_thumbnail`), with a request per
+        :data:`MAX_PAGES` pages
+
+        Args:
+            pages: the pages (None for no page)
+
+        Returns:
+            the thumbnail of each page (None if there is no page or no image)
+        """
+        found = wikipedia_query_pages([page.pageid for page in pages if page is not None],
+                                      prop="pageimages",
+                                      piprop="original",
+                                      pilicense="free",
+                                      pilimit=MAX_PAGES)
+        return [None if page is None else found.get(str(page.pageid), {}).get("original", None)
+                for page in pages]
     
     def display_thumbnail(self):
         """Displays the thumbnail in a jupyter notebook
@@ -155,13 +257,25 @@ class WikipediaPage():
         Returns:
             the first paragraphs of the page, in HTML format
         """
-        r = make_wikimedia_request(action="query", 
-                           prop="extracts",
-                            exintro="true", 
-                           pageids=self.pageid,
-                          pilicense="free")
-        pages = r["query"]["pages"]
-        _, onlypage = pages.popitem()
-        extract = onlypage.get("extract", None)
-
-        return extract
+        return self.get_quicktexts([self])[0]
+
+    @classmethod
+    def get_quicktexts(cls, pages: Sequence[Optional[WikipediaPage]]) -> list[Optional[str]]:
+        """get the quicktexts of many pages
+
+        get the first paragraphs of the pages (see :func:`get_quicktext`), with a request
+        per :data:`MAX_EXTRACTS` pages (the api does not give more introductions at once)
+
+        Args:
+            pages: the pages (None for no page)
+
+        Returns:
+            the first paragraphs of each page, in HTML format (None if there is no page)
+        """
+        found = wikipedia_query_pages([page.pageid for page in pages if page is not None],
+                                      MAX_EXTRACTS,
+                                      prop="extracts",
+                                      exintro="true",
+                                      exlimit=MAX_EXTRACTS)
+        return [None if page is None else found.get(str(page.pageid), {}).get("extract", None)
+                for page in pages]
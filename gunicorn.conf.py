@@ -1,2 +1,7 @@
-wsgi_app = "carsreco:create_server()"
+wsgi_app = "carsreco:create_server(shared=True)"
 bind = ["0.0.0.0:8000"]
+
+def on_starting(server):
+    """loads the dataset once, in the master process, into files that the workers map in memory"""
+    from carsreco.data import share_data
+    share_data()
@@ -12,7 +12,25 @@ Data preprocessing
 .. argparse::
     :module: scripts.preprocessing
     :func: get_argparser
-    :prog: scripts/preprocessing.py
+    :prog: python -m scripts.preprocessing
+
+
+Figures prerendering
+--------------------
+
+.. argparse::
+    :module: scripts.prerender
+    :func: get_argparser
+    :prog: python -m scripts.prerender
+
+
+Prediction model fitting
+------------------------
+
+.. argparse::
+    :module: scripts.fit
+    :func: get_argparser
+    :prog: python -m scripts.fit
 
 
 Deploying script
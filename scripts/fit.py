@@ -0,0 +1,67 @@
+#!/bin/env python3
+"""
+Fitting script.
+Fits the prediction model of the dashboard on the preprocessed dataset, and writes its
+parameters (see :meth:`carsreco.prediction.IntervalPricePrediction.save`), so that the
+workers load them instead of fitting the model. It should be run at each deployment,
+after the preprocessing.
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+import logging
+from logging import info
+
+from carsreco.data import get_data, DATA_PATH, SNAPSHOT_PATH
+from carsreco.prediction import IntervalPricePrediction, MODEL_PATH
+from carsreco.timing import stage, format_timings
+
+def fit(output=MODEL_PATH, path=DATA_PATH, snapshot_path=SNAPSHOT_PATH, compact=True) -> IntervalPricePrediction:
+    '''
+    Fits the model and writes it to ``output``
+
+    Args:
+        output: the model file
+        path: the preprocessed csv
+        snapshot_path: its binary snapshot
+        compact: fit the model on the compact dataframe
+            (see :func:`carsreco.data.compact_frame`), as the server does (see ``gunicorn.conf.py``)
+
+    Returns:
+        IntervalPricePrediction: the model
+    '''
+    timings: dict[str, float] = {}
+    with stage(timings, "read"):
+        df = get_data(path, snapshot_path, compact=compact)
+    with stage(timings, "fit"):
+        model = IntervalPricePrediction(df)
+    with stage(timings, "write"):
+        model.save(output)
+    info(f"fitted the model of {len(model.arrays.models)} car models to {output}, time per stage:\n"
+         + format_timings(timings))
+    return model
+
+def get_argparser() -> ArgumentParser:
+    """Returns the argument parser of the module
+    """
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument("output", type=Path, nargs="?", default=MODEL_PATH,
+                        help=f"Output file (default {MODEL_PATH})")
+
+    parser.add_argument("--data", type=Path, default=DATA_PATH,
+                        help=f"Preprocessed csv (default {DATA_PATH})")
+
+    parser.add_argument( '-log',
+                     '--loglevel',
+                     default='info',
+                     help='Provide logging level. Example --loglevel debug, default=info' )
+
+    return parser
+
+if __name__ == "__main__":
+    parser = get_argparser()
+    arguments = parser.parse_args()
+    logging.basicConfig( level=arguments.loglevel.upper() )
+    fit(arguments.output, arguments.data, arguments.data.with_suffix(".npz"))
@@ -3,61 +3,404 @@
 Preprocessing script.
 This script should be run once at each deployment on the server
 """
+from __future__ import annotations
+
 from argparse import ArgumentParser
+import hashlib
+import io
+import json
 from pathlib import Path
 import logging
 from logging import info
+import shutil
+import tempfile
+from typing import Iterable, Iterator, Optional, TextIO
 
-
+from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 
-def preprocess(input_file, output_file, drops=['condition', 'size']) -> None:
+from carsreco.timing import stage, format_timings
+from carsreco.data import RANGE_BINS, read_csv_data, write_snapshot, read_snapshot, \
+    file_fingerprint, StaleSnapshotError
+
+def preprocess(input_file, output_file, drops=['condition', 'size'], chunksize=None, 
+               jobs=1) -> None:
     '''
     Preprocesses the dataset by converting posting date to datetime
     and adding ranges to price/year.
 
+    If ``chunksize`` is given, the dataset is streamed: it is read, transformed and
+    appended to the output ``chunksize`` rows at a time, so that the memory used does not
+    depend on the size of the dataset. The output is the same as without ``chunksize``.
+    The binary snapshot of the output (see :func:`snapshot`) holds the whole dataframe:
+    writing it takes memory proportional to the dataset, so the memory is only bounded
+    without it (``--no-snapshot``).
+
+    If ``jobs`` is more than 1, the transformations (see :func:`transform`) and the
+    formatting of the output run in a pool of ``jobs`` processes, on ``jobs`` row ranges
+    of the dataset (or on the chunks when streaming). Each process writes its part to a
+    temporary file, and the parts are then concatenated in the original order, so the output
+    is the same as with ``jobs=1``.
+
+    The time spent in each stage is logged at the end.
+
     Args:
         input_file: the original (input) dataset csv
         output_file: the processed dataset csv
         drops: list of columns to drop
+        chunksize: number of rows to process at a time (None to process everything at once)
+        jobs: number of processes used to transform the dataset
+    '''
+    output_file = Path(output_file)
+    timings: dict[str, float] = {}
+    manufacturers: set[str] = set()
+
+    def counted(parts):
+        for part in parts:
+            manufacturers.update(part['manufacturer'].astype(str))
+            yield part
+
+    with stage(timings, "total"):
+        parts = counted(read_parts(input_file, chunksize, jobs, timings))
+        with open(output_file, "w", newline="", encoding="utf-8") as output:
+            if jobs > 1:
+                _transform_parallel(parts, output, drops, jobs, timings)
+            else:
+                for i, part in enumerate(parts):
+                    part = transform(part, drops, timings)
+                    with stage(timings, "write"):
+                        part.to_csv(output, header=(i == 0))
+
+    info(f"there are { len(manufacturers) } unique manufacturers")
+    info("time spent per stage (summed over all processes):\n" + format_timings(timings))
+
+def read_parts(input_file, chunksize=None, jobs=1, timings: Optional[dict]=None) -> Iterator[pd.DataFrame]:
     '''
-    df: pd.DataFrame = pd.read_csv(input_file, header=0, index_col=0)#type: ignore
+    Reads the original dataset as consecutive row ranges.
+
+    The parts have consistent dtypes, so that writing them one after the other gives the
+    same csv as writing the whole dataset at once.
+
+    Args:
+        input_file: the original (input) dataset csv
+        chunksize: number of rows per part, if None the dataset is read at once and split
+            in ``jobs`` parts
+        jobs: number of parts when ``chunksize`` is None
+        timings: if not None, the time spent reading is added to it
+
+    Yields:
+        pd.DataFrame: the parts of the dataset, in order
+    '''
+    if timings is None:
+        timings = {}
+    if chunksize is None:
+        with stage(timings, "read"):
+            df: pd.DataFrame = pd.read_csv(input_file, header=0, index_col=0)#type: ignore
+        # the price becomes float when it contains a 0 (see transform)
+        if jobs > 1 and (df['price'] == 0).any():
+            df['price'] = df['price'].astype(np.float64)
+        bounds = np.linspace(0, len(df), max(jobs, 1) + 1).astype(int)
+        parts = [df.iloc[start:stop].copy() for start, stop in zip(bounds[:-1], bounds[1:])]\
+                if jobs > 1 else [df]
+        del df
+        while parts:
+            yield parts.pop(0)
+        return
+
+    # a column that is read as int in some chunks must be written as float 
+    # if it is read as float in others, like when the file is read at once.
+    # The same goes for the price, which becomes float when it contains a 0 (see transform)
+    kinds: dict[str, set] = {}
+    with stage(timings, "dtypes"):
+        for chunk in pd.read_csv(input_file, header=0, index_col=0, chunksize=chunksize):
+            for column, dtype in chunk.dtypes.items():
+                kinds.setdefault(column, set()).add(dtype.kind)
+            if (chunk['price'] == 0).any():
+                kinds['price'].add("f")
+    floats = {column: np.float64 for column, k in kinds.items() if "f" in k and k <= set("iuf")}
 
-    all_drops = ['url', 'region_url'] + drops
-    df.drop(all_drops, inplace=True, axis=1)
-    info(f"there are { len(df['manufacturer'].unique()) } unique manufacturers")
+    reader = iter(pd.read_csv(input_file, header=0, index_col=0, chunksize=chunksize, dtype=floats))
+    while True:
+        with stage(timings, "read"):
+            chunk = next(reader, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _transform_parallel(parts: Iterable[pd.DataFrame], output: TextIO, drops, jobs: int, 
+                        timings: dict[str, float]) -> None:
+    '''
+    Transforms the parts in a pool of processes, and writes them to output in order
+
+    Args:
+        parts: the parts of the dataset, see :func:`read_parts`
+        output: the output file
+        drops: list of columns to drop
+        jobs: number of processes
+        timings: the time spent in each stage (in each process) is added to it
+    '''
+    with tempfile.TemporaryDirectory(dir=Path(output.name).parent) as tmp:
+        results = Parallel(n_jobs=jobs, return_as="generator")(
+            delayed(_transform_part)(part, drops, Path(tmp) / f"part{i}.csv", i == 0) 
+            for i, part in enumerate(parts))
+        for part_file, part_timings in results:
+            for name, seconds in part_timings.items():
+                timings[name] = timings.get(name, 0.) + seconds
+            with stage(timings, "merge"):
+                with open(part_file, newline="", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, output)
+                part_file.unlink()
+
+def _transform_part(df: pd.DataFrame, drops, part_file: Path, header: bool) -> tuple[Path, dict[str, float]]:
+    """transforms and writes one part of the dataset, in a worker process of :func:`_transform_parallel`"""
+    timings: dict[str, float] = {}
+    df = transform(df, drops, timings)
+    with stage(timings, "write"):
+        df.to_csv(part_file, header=header)
+    return part_file, timings
+
+def transform(df: pd.DataFrame, drops=['condition', 'size'], timings: Optional[dict]=None) -> pd.DataFrame:
+    '''
+    The row-wise transformations done by :func:`preprocess`
+
+    Args:
+        df: the original dataset (or a chunk of it). It is modified in place
+        drops: list of columns to drop
+        timings: if not None, the time spent in each stage is added to it
+
+    Returns:
+        pd.DataFrame: the processed dataset
+    '''
+    if timings is None:
+        timings = {}
+    with stage(timings, "drop"):
+        all_drops = ['url', 'region_url'] + drops
+        df.drop(all_drops, inplace=True, axis=1)
 
     # Correction of previous columns
-    df['state'] = df['state'].str.upper()
-    info('correcting state')
+    with stage(timings, "state"):
+        df['state'] = df['state'].str.upper()
     # df['posting_date'] = pd.to_datetime(df['posting_date'], format='%Y-%m-%dT%H:%M:%S', cache=True)
-    info('processing date')
-    df['posting_date'] = pd.to_datetime(df['posting_date'], utc=True, infer_datetime_format=True, cache=True)
-    df['posting_year'] = pd.DatetimeIndex(df['posting_date']).year
-    df['posting_month'] = pd.DatetimeIndex(df['posting_date']).month
-
-    info('processing price')
-    df['price'] = df['price'].replace(0, np.nan)
-    df = df.dropna(subset=['price'])#type: ignore
-    df = df[df['price'] < 300000]
-
-    info('adding ranges')
-    df['price_range'] = pd.cut(df['price'],
-                               [-np.inf, 5000, 15000, 25000, np.inf],
-                               labels=['<$5000', '$5000-15000', '$15000-25000', '>$25000']
-                               )
-    df['year_range'] = pd.cut(df['year'],
-                               [-np.inf, 2005, 2010, 2015, np.inf],
-                               labels=['<2005', '2005-2010', '2010-2015', '>2015']
-                               )
-    df['odometer_range'] = pd.cut(df['odometer'],
-                              [-np.inf, 40000, 80000, 120000, np.inf],
-                              labels=['<40000', '40000-80000', '80000-120000', '>120000']
-                              )
-    df.to_csv(output_file)
+    with stage(timings, "date"):
+        df['posting_date'] = pd.to_datetime(df['posting_date'], utc=True, infer_datetime_format=True, cache=True)
+        df['posting_year'] = pd.DatetimeIndex(df['posting_date']).year
+        df['posting_month'] = pd.DatetimeIndex(df['posting_date']).month
+
+    with stage(timings, "price"):
+        df['price'] = df['price'].replace(0, np.nan)
+        df = df.dropna(subset=['price'])#type: ignore
+        df = df[df['price'] < 300000]
+
+    with stage(timings, "ranges"):
+        for name, (column, bins, labels) in RANGE_BINS.items():
+            df[name] = pd.cut(df[column], bins, labels=labels)
+    return df
+
+def snapshot(csv_file, snapshot_file) -> None:
+    '''
+    Writes the binary snapshot of the preprocessed csv, which
+    :func:`carsreco.data.get_data` loads at startup instead of parsing the csv.
+
+    The csv is read back the same way :func:`carsreco.data.get_data` would,
+    so that the snapshot holds exactly the same dataframe. The whole dataframe is
+    in memory, even when the csv was written by chunks (see :func:`preprocess`).
+
+    Args:
+        csv_file: the processed dataset csv
+        snapshot_file: the snapshot (npz) output file
+    '''
+    info('writing snapshot')
+    write_snapshot(read_csv_data(csv_file), snapshot_file, file_fingerprint(csv_file))
+
+
+#------------------------------------------------------------------------------------
+# INCREMENTAL PREPROCESSING
+#------------------------------------------------------------------------------------
+
+#: version of the incremental state, to increase whenever :func:`transform` changes
+STATE_VERSION = 1
+
+def preprocess_incremental(input_file, output_file, drops=['condition', 'size'], chunksize=None,
+                           jobs=1, snapshot_file=None, state_file=None) -> bool:
+    '''
+    Incremental version of :func:`preprocess` (followed by :func:`snapshot`).
+
+    The rows of the input are identified by their ``(posting_date, id)``. The state file
+    remembers the largest one that was processed (the watermark), as well as the size of
+    the input that was processed. When the input only grew since the last run, only the
+    new bytes of the input are read, and their rows are appended to the existing output,
+    so that the time taken depends on the number of new rows and not on the size of the dataset.
+
+    A full rebuild is done instead when there is no state, when the drop list or the range
+    bins changed (see :data:`carsreco.data.RANGE_BINS`), when the output was modified, when
+    the input was rewritten (rows before the end of the last run may have been edited or
+    deleted), when some appended rows are not after the watermark, or when the new rows
+    would be written with different types than the existing ones.
 
+    Args:
+        input_file: the original (input) dataset csv
+        output_file: the processed dataset csv
+        drops: list of columns to drop
+        chunksize: see :func:`preprocess`. Without a snapshot, the output of a full rebuild
+            is also read back by chunks, so that the memory does not depend on the size of
+            the dataset
+        jobs: see :func:`preprocess`
+        snapshot_file: the snapshot output file, None to not write the snapshot
+        state_file: where to store the state (default: output_file with a .state.json suffix)
+
+    Returns:
+        bool: True if a full rebuild was done
+    '''
+    input_file, output_file = Path(input_file), Path(output_file)
+    state_file = Path(state_file) if state_file is not None else output_file.with_suffix(".state.json")
+    config = _incremental_config(drops)
+    state = json.loads(state_file.read_text()) if state_file.exists() else None
 
+    reason = None
+    if state is None:
+        reason = "there is no previous state"
+    elif state["config"] != config:
+        reason = "the drop list or the range bins changed"
+    elif not output_file.exists() or output_file.stat().st_size != state["output_size"]:
+        reason = "the output was modified"
+    elif not _input_grew(input_file, state):
+        reason = "the input was rewritten"
+    else:
+        new_rows = _new_rows(input_file, state, drops)
+        late = len(new_rows) - _after_watermark(new_rows, state["watermark"]).sum()
+        if late:
+            logging.warning(f"{late} appended rows are not after the watermark")
+            reason = f"{late} appended rows are not after the watermark"
+        elif len(new_rows) == 0:
+            info("no new rows")
+            _write_state(state_file, config, new_rows['posting_date'], [], input_file, output_file, 
+                         state["output_fingerprint"], previous=state)
+            return False
+        elif not set(new_rows.select_dtypes(np.floating).columns) <= set(state["floats"]):
+            reason = "the new rows have float columns that were int"
+    if reason is not None:
+        info(f"full rebuild: {reason}")
+        preprocess(input_file, output_file, drops, chunksize, jobs)
+        fingerprint = None
+        if snapshot_file is not None:
+            df = read_csv_data(output_file)
+            fingerprint = file_fingerprint(output_file)
+            write_snapshot(df, snapshot_file, fingerprint)
+            dates, floats = df['posting_date'], list(df.select_dtypes(np.floating).columns)
+        else:
+            dates, floats = _read_back(output_file, chunksize)
+        _write_state(state_file, config, dates, floats, input_file, output_file, fingerprint)
+        return True
+
+    info(f"appending {len(new_rows)} new rows")
+    for column in state["floats"]:
+        new_rows[column] = new_rows[column].astype(np.float64)
+    text = new_rows.to_csv(header=False)
+    with open(output_file, "a", newline="", encoding="utf-8") as output:
+        output.write(text)
+    new_df = read_csv_data(io.StringIO(state["header"] + text))
+    fingerprint = None
+    if snapshot_file is not None:
+        fingerprint = _append_snapshot(snapshot_file, output_file, state, new_df)
+    _write_state(state_file, config, new_df['posting_date'], [], input_file, output_file, fingerprint,
+                 previous=state)
+    return False
+
+def _incremental_config(drops) -> dict:
+    """what the output depends on, besides the input"""
+    return {"version": STATE_VERSION,
+            "drops": sorted(drops),
+            "range_bins": {name: [column, [str(edge) for edge in bins], labels]
+                           for name, (column, bins, labels) in RANGE_BINS.items()}}
+
+def _tail_digest(file: Path, size: int, window: int=1 << 16) -> str:
+    """digest of the ``window`` bytes before ``size`` in the file"""
+    with open(file, "rb") as f:
+        f.seek(max(size - window, 0))
+        return hashlib.blake2b(f.read(min(size, window)), digest_size=16).hexdigest()
+
+def _input_grew(input_file: Path, state: dict) -> bool:
+    """whether the input only grew since the run of the state (its processed bytes did not change)"""
+    return (input_file.stat().st_size >= state["input_size"]
+            and _tail_digest(input_file, state["input_size"]) == state["input_tail"])
+
+def _new_rows(input_file: Path, state: dict, drops) -> pd.DataFrame:
+    """the transformed rows of the bytes appended to the input since the run of the state"""
+    with open(input_file, "rb") as f:
+        header = f.readline()
+        f.seek(state["input_size"])
+        part = pd.read_csv(io.BytesIO(header + f.read()), header=0, index_col=0)
+    return transform(part, drops)
+
+def _after_watermark(df: pd.DataFrame, watermark: dict) -> pd.Series:
+    """whether the rows are after the watermark (by their ``(posting_date, id)``)"""
+    date, index = pd.Timestamp(watermark["posting_date"]), watermark["id"]
+    return (df['posting_date'] > date) | ((df['posting_date'] == date) & (df.index > index))
+
+def _read_back(output_file: Path, chunksize=None) -> tuple[pd.Series, list[str]]:
+    """the posting dates of the output that may be the watermark (the latest ones), and its
+    float columns, as :func:`carsreco.data.read_csv_data` reads them (by chunks if ``chunksize``)"""
+    if chunksize is None:
+        df = read_csv_data(output_file)
+        return df['posting_date'], list(df.select_dtypes(np.floating).columns)
+    kinds: dict[str, set] = {}
+    latest = []
+    for chunk in pd.read_csv(output_file, index_col=0, parse_dates=["posting_date"], chunksize=chunksize):
+        for column, dtype in chunk.dtypes.items():
+            kinds.setdefault(column, set()).add(dtype.kind)
+        dates = chunk['posting_date'].dropna()
+        latest.append(dates[dates == dates.max()])
+    # a column read as int in some chunks and as float in others is float in the whole file
+    return pd.concat(latest) if latest else pd.Series([], dtype=object), [column for column, k in kinds.items() if "f" in k and k <= set("iuf")]
+
+def _write_state(state_file: Path, config: dict, dates: pd.Series, floats: list[str], input_file: Path,
+                 output_file: Path, fingerprint: Optional[str], previous: Optional[dict]=None) -> None:
+    """writes the state after the rows of posting ``dates`` were appended to the output
+
+    ``floats`` are the float columns of the output (only used without a ``previous`` state),
+    and ``fingerprint`` is the fingerprint of the output that the snapshot was made from (if any)
+    """
+    watermark = previous["watermark"] if previous is not None else None
+    dates = dates.dropna()
+    if len(dates):
+        date = dates.max()
+        candidate = {"posting_date": date.isoformat(), "id": int(dates.index[dates == date].max())}
+        if watermark is None or (date, candidate["id"]) > (pd.Timestamp(watermark["posting_date"]), watermark["id"]):
+            watermark = candidate
+    if watermark is None:
+        watermark = {"posting_date": pd.Timestamp.min.tz_localize("UTC").isoformat(), "id": -1}
+    with open(output_file, newline="", encoding="utf-8") as f:
+        header = f.readline()
+    input_size = input_file.stat().st_size
+    state = {"config": config,
+             "watermark": watermark,
+             "input_size": input_size,
+             "input_tail": _tail_digest(input_file, input_size),
+             "output_size": output_file.stat().st_size,
+             "output_fingerprint": fingerprint,
+             "header": header,
+             "floats": previous["floats"] if previous is not None else floats}
+    state_file.write_text(json.dumps(state, indent=2))
+
+def _append_snapshot(snapshot_file, output_file: Path, state: dict, new_df: pd.DataFrame) -> str:
+    """appends the new rows to the snapshot, or rewrites it if it is not usable.
+
+    Returns the fingerprint of the output
+    """
+    fingerprint = file_fingerprint(output_file)
+    try:
+        if state["output_fingerprint"] is None:
+            raise StaleSnapshotError("there was no snapshot")
+        old_df = read_snapshot(snapshot_file, fingerprint=state["output_fingerprint"])
+        df = pd.concat([old_df, new_df])
+        if not (df.dtypes == old_df.dtypes).all():
+            raise StaleSnapshotError("the new rows have different types")
+        write_snapshot(df, snapshot_file, fingerprint)
+    except (OSError, ValueError, StaleSnapshotError) as e:
+        info(f"rewriting the snapshot: {e}")
+        write_snapshot(read_csv_data(output_file), snapshot_file, fingerprint)
+    return fingerprint
 
 def get_argparser() -> ArgumentParser:
     """Returns the argument parser of the module
@@ -72,6 +415,24 @@ def get_argparser() -> ArgumentParser:
                         help=("columns to drop (default [condition, size], "
                               "use --drop with no argument to drop nothing)" ))
 
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help=("stream the dataset, processing CHUNKSIZE rows at a time "
+                              "(default: process the whole dataset at once). The memory used "
+                              "only stays bounded with --no-snapshot"))
+
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes used to transform the dataset (default 1)")
+
+    parser.add_argument("--incremental", action="store_true",
+                        help=("only process the rows that are new since the last run, and append "
+                              "them to the output (see preprocess_incremental)"))
+
+    parser.add_argument("--snapshot", type=Path, default=None,
+                        help=("binary snapshot output file (default: the output file "
+                              "with a .npz suffix)"))
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="do not write the binary snapshot")
+
     parser.add_argument( '-log',
                      '--loglevel',
                      default='info',
@@ -83,4 +444,12 @@ if __name__ == "__main__":
     parser = get_argparser()
     arguments = parser.parse_args()
     logging.basicConfig( level=arguments.loglevel.upper() )
-    preprocess(arguments.input, arguments.output, arguments.drop)
+    snapshot_file = None if arguments.no_snapshot \
+                    else arguments.snapshot or arguments.output.with_suffix(".npz")
+    if arguments.incremental:
+        preprocess_incremental(arguments.input, arguments.output, arguments.drop, 
+                               arguments.chunksize, arguments.jobs, snapshot_file)
+    else:
+        preprocess(arguments.input, arguments.output, arguments.drop, arguments.chunksize, arguments.jobs)
+        if snapshot_file is not None:
+            snapshot(arguments.output, snapshot_file)
@@ -0,0 +1,89 @@
+#!/bin/env python3
+"""
+Prerendering script.
+Builds all the figures of the first tab of the dashboard, and writes them with a manifest
+(see :mod:`carsreco.figures`). It should be run at each deployment, after the preprocessing.
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+import logging
+from logging import info
+import tempfile
+
+from joblib import Parallel, delayed
+
+from carsreco.data import get_data, DATA_PATH, SNAPSHOT_PATH
+from carsreco.figures import FigureData, build_figure, figure_keys, write_store, FIGURES_PATH, Key
+from carsreco.timing import stage, format_timings
+
+def prerender(output=FIGURES_PATH, path=DATA_PATH, snapshot_path=SNAPSHOT_PATH, jobs=1,
+              compact=True) -> int:
+    '''
+    Builds all the figures, in a pool of ``jobs`` processes, and writes them to ``output``
+    (see :func:`carsreco.figures.write_store`)
+
+    Args:
+        output: the directory of the figures
+        path: the preprocessed csv
+        snapshot_path: its binary snapshot
+        jobs: number of processes
+        compact: build the figures from the compact dataframe
+            (see :func:`carsreco.data.compact_frame`), as the server does (see ``gunicorn.conf.py``)
+
+    Returns:
+        int: the number of figures
+    '''
+    timings: dict[str, float] = {}
+    with stage(timings, "read"):
+        data = FigureData(get_data(path, snapshot_path, compact=compact))
+        keys = figure_keys(data)
+    with tempfile.TemporaryDirectory(dir=Path(output).parent) as tmp:
+        with stage(timings, "render"):
+            batches = [keys[i::jobs] for i in range(jobs)]
+            results = Parallel(n_jobs=jobs)(
+                delayed(_render_batch)(data, batch, Path(tmp) / f"batch{i}")
+                for i, batch in enumerate(batches))
+            files = dict(pair for batch in results for pair in batch)
+        with stage(timings, "write"):
+            write_store(output, data.version, {key: files[key] for key in keys}, compact=compact)
+    info(f"prerendered {len(keys)} figures to {output}, time per stage:\n" + format_timings(timings))
+    return len(keys)
+
+def _render_batch(data: FigureData, keys: list[Key], directory: Path) -> list[tuple[Key, Path]]:
+    """builds and writes the figures of some keys, in a worker process of :func:`prerender`"""
+    directory.mkdir()
+    files = []
+    for i, key in enumerate(keys):
+        figure_file = directory / f"{i}.json"
+        figure_file.write_text(build_figure(data, key).to_json())
+        files.append((key, figure_file))
+    return files
+
+def get_argparser() -> ArgumentParser:
+    """Returns the argument parser of the module
+    """
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument("output", type=Path, nargs="?", default=FIGURES_PATH,
+                        help=f"Output directory (default {FIGURES_PATH})")
+
+    parser.add_argument("--data", type=Path, default=DATA_PATH,
+                        help=f"Preprocessed csv (default {DATA_PATH})")
+
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes used to build the figures (default 1)")
+
+    parser.add_argument( '-log',
+                     '--loglevel',
+                     default='info',
+                     help='Provide logging level. Example --loglevel debug, default=info' )
+
+    return parser
+
+if __name__ == "__main__":
+    parser = get_argparser()
+    arguments = parser.parse_args()
+    logging.basicConfig( level=arguments.loglevel.upper() )
+    prerender(arguments.output, arguments.data, arguments.data.with_suffix(".npz"), arguments.jobs)
@@ -0,0 +1,104 @@
+'''
+This file tests the functions in api.py
+To generate a html coverage report, run
+pytest --cov-report html:cov_html
+        --cov=carsreco
+'''
+import json
+
+import flask
+import pytest
+import pandas as pd
+from carsreco import api, prediction
+
+
+@pytest.fixture()
+def setup():
+    """Creates the mock dataframe for setup.
+    """
+    mock_df =  pd.DataFrame(columns=['model','manufacturer','price','posting_date', 'year'],
+                            data =[['camry', 'abc',10000, '2021-05-04 17:30:00', 2000],
+                                   ['silverado', 'def',7000, '2021-04-04 09:30:00', 2005],
+                                   ['fx-150', 'ford', 12000, '2021-06-04 17:30:00', 2010],
+                                   ['camry', 'abc', 20000, '2021-06-04 16:30:00', 2015],
+                                   ['camry', 'abc', 25000, '2021-05-04 09:30:00', 2020],
+                                   ['fx-150', 'ford', 15000, '2021-05-04 16:00:00', 2021]])
+    mock_df['posting_date'] = pd.to_datetime(mock_df['posting_date'])
+    return mock_df
+
+def client(model):
+    """a test client of a server with the scoring endpoint"""
+    server = flask.Flask(__name__)
+    api.register_api(server, model)
+    return server.test_client()
+
+def test_score(setup):
+    """Tests that the endpoint streams the results of get_CI of every query.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    model = prediction.IntervalPricePrediction(mock_df)
+    queries = [{"price": [9000, 30000]}, {"price": [9000, 30000], "brands": ["ford"]},
+               {"price": [15000, 30000], "years": [2001, 2020]}, {"price": [0, 100], "years": [1990, 1999]},
+               {"price": [0, 100000], "brands": ["unknown"]}]
+    response = client(model).post("/api/score", json={"queries": queries, "alpha": 0.9})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = sorted((json.loads(line) for line in response.get_data(as_text=True).splitlines()),
+                   key=lambda line: line["query"])
+    assert [line["query"] for line in lines] == list(range(len(queries)))
+    for query, line in zip(queries, lines):
+        expected = model.get_CI(*query["price"], query.get("brands", []), alpha=0.9,
+                                years=query.get("years"))
+        assert [tuple(result.values()) for result in line["results"]] == [tuple(result) for result in expected]
+    # the queries are scored by chunks
+    assert sorted(api.score(model, api.Queries.from_json({"queries": queries}), chunk=2)) == \
+        sorted(api.score(model, api.Queries.from_json({"queries": queries})))
+
+def test_score_undefined_interval(setup):
+    """Tests that the intervals which can not be estimated are null, and the response valid json.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    # all the posts of the model in the same minute: its rate is not defined
+    mock_df.loc[len(mock_df)] = ['civic', 'honda', 9500, pd.Timestamp('2021-05-04 12:00:00'), 2010]
+    mock_df.loc[len(mock_df)] = ['civic', 'honda', 10500, pd.Timestamp('2021-05-04 12:00:30'), 2012]
+    response = client(prediction.IntervalPricePrediction(mock_df)).post(
+        "/api/score", json={"queries": [{"price": [9000, 11000], "brands": ["honda"]}]})
+    assert response.status_code == 200
+
+    def reject(constant):
+        raise ValueError(f"{constant} is not json")
+
+    line = json.loads(response.get_data(as_text=True), parse_constant=reject)
+    assert [(result["model"], result["low"], result["high"]) for result in line["results"]] == [("civic", None, None)]
+
+@pytest.mark.parametrize("payload", [None, {"queries": 1}, {"queries": [{"price": [1]}]},
+                                     {"queries": [{"price": [1, "2"]}]},
+                                     {"queries": [{"price": [1, 2], "brands": "ford"}]},
+                                     {"queries": [{"price": [1, 2]}], "alpha": 2},
+                                     {"queries": [{"price": [1, int("9" * 400)]}]},
+                                     {"queries": [{"price": [1, 2], "years": [True, 2000]}]},
+                                     {"queries": [{"price": [2, 1]}]},
+                                     {"queries": [{"price": [1, 2], "years": [2015, 2005]}]},
+                                     {"queries": [{"price": [1, 2], "years": [2000.9, 2010.2]}]},
+                                     {"queries": [{"price": [1, 2], "years": [2000, 1e300]}]},
+                                     {"queries": [{"price": [1, 2], "years": [2000, 2 ** 70]}]}])
+def test_invalid_queries(setup, payload):
+    """Tests that the invalid requests are rejected.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        payload: The body of the request.
+    """
+    mock_df = setup
+    response = client(prediction.IntervalPricePrediction(mock_df)).post("/api/score", json=payload)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    model = prediction.IntervalPricePrediction(mock_df.drop(columns='year'))
+    response = client(model).post("/api/score", json={"queries": [{"price": [1, 2], "years": [2000, 2010]}]})
+    assert response.status_code == 400
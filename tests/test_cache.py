@@ -0,0 +1,83 @@
+''' This file tests the functions in cache.py
+To generate a html coverage report, run
+pytest --cov-report html:cov_html
+        --cov=carsreco'''
+import pandas as pd
+import pytest
+
+from carsreco import prediction
+from carsreco.cache import LRUCache, snap, snap_range
+
+@pytest.fixture()
+def setup():
+    """Creates a cache of 2 entries, and a function counting its calls.
+    """
+    calls = []
+    cache = LRUCache(2, version="v1")
+
+    @cache.cached
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    return cache, square, calls
+
+def test_lru_cache(setup):
+    """Tests the hits, misses and eviction of the LRUCache.
+
+    Args:
+        setup: The cache, the cached function and its calls.
+    """
+    cache, square, calls = setup
+    assert [square(2), square(2), square(3)] == [4, 4, 9]
+    assert calls == [2, 3]
+    assert square(2) == 4 # 2 is now more recent than 3
+    assert square(4) == 16 # evicts 3
+    assert square(2) == 4 and square(3) == 9
+    assert calls == [2, 3, 4, 3]
+    assert cache.stats() == {"hits": 3, "misses": 4, "evictions": 2, "size": 2, "maxsize": 2}
+    assert cache.hit_rate == 3 / 7
+
+def test_lru_cache_version(setup):
+    """Tests that the values of another version of the data are not returned.
+
+    Args:
+        setup: The cache, the cached function and its calls.
+    """
+    cache, square, calls = setup
+    square(2)
+    cache.version = "v2"
+    square(2)
+    assert calls == [2, 2]
+    with pytest.raises(ValueError):
+        LRUCache(0)
+
+def test_snap(setup):
+    """Tests that the close values of a slider share their cache entry once snapped.
+
+    Args:
+        setup: The cache, the cached function and its calls.
+    """
+    cache, square, calls = setup
+    assert cache.hit_rate == 0
+    assert [snap(value, 500) for value in [0, 249, 250, 1234, 1250.5, 99999]] == [0, 0, 500, 1000, 1500, 100000]
+    assert snap(1234, 0) == 1234
+    for value in range(1000, 1300, 20):
+        square(snap(value, 500))
+    assert calls == [1000, 1500]
+    assert cache.hit_rate == 13 / 15
+
+def test_snap_range():
+    """Tests that a snapped price range contains the selected one, also when it is narrower than the granularity.
+    """
+    assert snap_range(1234, 5678, 500) == (1000, 6000)
+    assert snap_range(1000, 6000, 500) == (1000, 6000)
+    assert snap_range(1100, 1200, 500) == (1000, 1500)
+    assert snap_range(1000, 1000, 500) == (1000, 1500)
+    assert snap_range(1234, 1240, 0) == (1234, 1240)
+    model = prediction.IntervalPricePrediction(pd.DataFrame({
+        'model': ['camry', 'camry', 'camry'], 'manufacturer': ['abc', 'abc', 'abc'],
+        'price': [10000, 10100, 10300],
+        'posting_date': pd.to_datetime(['2021-05-04 09:30', '2021-05-05 10:30', '2021-05-06 11:30'])}))
+    # the narrow range still selects the cars of the exact range
+    assert [result[2] > 0 for result in model.get_CI(*snap_range(10050, 10150, 500))] == [True]
@@ -0,0 +1,42 @@
+'''
+This file tests the functions in scripts/fit.py
+To generate a html coverage report, run
+pytest --cov-report html:cov_html
+        --cov=carsreco
+'''
+import pytest
+import pandas as pd
+from scripts import fit
+from carsreco import data, dashboard
+
+
+@pytest.fixture()
+def setup(tmp_path):
+    """Writes a mock preprocessed dataset, and returns its path.
+    """
+    mock_df =  pd.DataFrame(columns=['year', 'state', 'region', 'model','manufacturer','price',
+                                     'posting_date', 'posting_year','posting_month'],
+                            data =[[2000, 'PA','greensboro', 'camry', 'abc',10000, '2021-05-04 17:30:00', 2021, 5],
+                                   [2005, 'CA','hudson valley', 'silverado', 'def',7000, '2021-04-04 09:30:00', 2021, 4],
+                                   [2010, 'CA','el paso', 'fx-150', 'ford', 12000, '2021-06-04 17:30:00', 2021, 5],
+                                   [2015, 'WA','bellingham', 'camry', 'abc', 20000, '2021-06-04 16:30:00', 2021, 6],
+                                   [2020, 'AL','auburn', 'camry', 'abc', 25000, '2021-05-04 09:30:00', 2021, 5],
+                                   [2021, 'AL','birmingham', 'fx-150', 'ford', 15000, '2021-05-04 16:00:00', 2021, 5]])
+    csv_file = tmp_path / "preprocessed.csv"
+    mock_df.to_csv(csv_file)
+    return csv_file
+
+def test_fit(setup, tmp_path):
+    """Tests that the fitted model is loaded by the dashboard, only for the data it was fitted on.
+
+    Args:
+        setup (Path): The test preprocessed csv.
+        tmp_path: pytest temporary directory.
+    """
+    output = tmp_path / "prediction.npz"
+    model = fit.fit(output, setup, None)
+    assert model.fingerprint == data.file_fingerprint(setup)
+    loaded = dashboard.load_prediction_model(output, data.file_fingerprint(setup))
+    assert loaded.get_CI(15000, 30000) == model.get_CI(15000, 30000)
+    assert dashboard.load_prediction_model(output, "other data") is None
+    assert dashboard.load_prediction_model(tmp_path / "nothing.npz", "other data") is None
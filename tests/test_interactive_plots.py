@@ -4,13 +4,16 @@ To generate a html coverage report, run
 pytest --cov-report html:cov_html
         --cov=carsreco
 '''
+import os
+
 import pytest
 
 import holoviews as hv
 from plotly.graph_objs import Figure
 
+import numpy as np
 import pandas as pd
-from carsreco import data, layout, prediction, interactive_plots
+from carsreco import data, layout, prediction, interactive_plots, aggregates
 
 @pytest.fixture()
 def setup():
@@ -36,6 +39,125 @@ def test_get_data(setup):
     df = data.get_data()
     assert isinstance(df, pd.DataFrame)
 
+def test_snapshot(setup, tmp_path):
+    """Tests that get_data loads the same dataframe from the snapshot and from the csv.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = setup
+    mock_df['price_range'] = pd.cut(mock_df['price'], [0, 10000, 30000], labels=['low', 'high'])
+    csv_file, snapshot_file = tmp_path / "preprocessed.csv", tmp_path / "preprocessed.npz"
+    mock_df.to_csv(csv_file)
+    from_csv = data.read_csv_data(csv_file)
+    data.write_snapshot(from_csv, snapshot_file, data.file_fingerprint(csv_file))
+    pd.testing.assert_frame_equal(data.read_snapshot(snapshot_file), from_csv)
+    pd.testing.assert_frame_equal(data.get_data(csv_file, snapshot_file), from_csv)
+
+def test_stale_snapshot(setup, tmp_path):
+    """Tests that get_data falls back to the csv when the snapshot is stale.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = setup
+    csv_file, snapshot_file = tmp_path / "preprocessed.csv", tmp_path / "preprocessed.npz"
+    mock_df.to_csv(csv_file)
+    data.write_snapshot(data.read_csv_data(csv_file), snapshot_file, data.file_fingerprint(csv_file))
+    mock_df.iloc[:3].to_csv(csv_file)
+    with pytest.raises(data.StaleSnapshotError):
+        data.read_snapshot(snapshot_file, fingerprint=data.file_fingerprint(csv_file))
+    assert len(data.get_data(csv_file, snapshot_file)) == 3
+
+def test_file_fingerprint(setup, tmp_path, caplog):
+    """Tests that the fingerprint of a file is kept until it changes, and that an unchecked snapshot is reported.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+        caplog: pytest log capture.
+    """
+    mock_df = setup
+    csv_file, snapshot_file = tmp_path / "preprocessed.csv", tmp_path / "preprocessed.npz"
+    cache_file = tmp_path / "preprocessed.csv.fingerprint"
+    mock_df.to_csv(csv_file)
+    fingerprint = data.file_fingerprint(csv_file)
+    # a file modified just now may be modified again with the same modification time
+    assert not cache_file.exists()
+    os.utime(csv_file, ns=(0, 10**18))
+    assert data.file_fingerprint(csv_file) == fingerprint and cache_file.exists()
+    cache_file.write_text(cache_file.read_text().replace(fingerprint, "kept"))
+    assert data.file_fingerprint(csv_file) == "kept"
+    mock_df.iloc[:3].to_csv(csv_file)
+    os.utime(csv_file, ns=(0, 10**18 + 1))
+    assert data.file_fingerprint(csv_file) not in {"kept", fingerprint}
+
+    data.write_snapshot(data.read_csv_data(csv_file), snapshot_file, data.file_fingerprint(csv_file))
+    csv_file.unlink()
+    assert len(data.get_data(csv_file, snapshot_file)) == 3
+    assert "can not be checked" in caplog.text
+
+def test_compact_frame(setup):
+    """Tests the compact_frame and memory_report functions.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    mock_df['url'] = 'http://test.com'
+    mock_df['year_range'] = ['<2005', '<2005', '2005-2010', '2010-2015', '>2015', '>2015']
+    compacted = data.compact_frame(mock_df, max_cardinality=1)
+    assert 'url' not in compacted.columns
+    assert 'posting_year' not in compacted.columns and 'posting_month' not in compacted.columns
+    assert interactive_plots.get_price_trendency_cols(compacted) == interactive_plots.get_price_trendency_cols(mock_df.drop(columns='url'))
+    assert list(compacted['state'].cat.categories) == ['AL', 'CA', 'PA', 'WA']
+    assert compacted['year_range'].cat.ordered 
+    assert list(compacted['year_range'].cat.categories) == ['<2005', '2005-2010', '2010-2015', '>2015']
+    assert compacted['price'].dtype == 'int32'
+    assert (compacted['price'].values == mock_df['price'].values).all()
+    report = data.memory_report(mock_df, compacted)
+    assert report.loc['url', 'after'] == 0
+    assert report.loc['total', 'saved'] == report['saved'].drop('total').sum() > 0
+
+def test_shared_data(setup, tmp_path):
+    """Tests that share_data writes memory-mapped data that get_data can read.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = setup
+    csv_file, shared_path = tmp_path / "preprocessed.csv", tmp_path / "preprocessed.shared"
+    mock_df.to_csv(csv_file)
+    data.share_data(csv_file, None, shared_path)
+    shared = data.get_data(csv_file, None, compact=True, shared_path=shared_path)
+    compacted = data.get_data(csv_file, None, compact=True)
+    strings = compacted.select_dtypes(object).columns
+    pd.testing.assert_frame_equal(shared, compacted.astype({name: 'category' for name in strings}))
+    assert not shared['price'].values.flags.writeable
+    assert not shared['state'].cat.codes.values.flags.writeable
+    with pytest.raises(data.StaleSnapshotError):
+        data.read_shared(shared_path, fingerprint="other csv")
+
+def test_dataset_version(setup, tmp_path):
+    """Tests that the dataset_version identifies the csv the dataframe was loaded from.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = setup
+    csv_file, snapshot_file = tmp_path / "preprocessed.csv", tmp_path / "preprocessed.npz"
+    mock_df.to_csv(csv_file)
+    fingerprint = data.file_fingerprint(csv_file)
+    assert data.dataset_version(data.get_data(csv_file, snapshot_file)) == fingerprint
+    data.write_snapshot(data.read_csv_data(csv_file), snapshot_file, fingerprint)
+    assert data.dataset_version(data.get_data(csv_file, snapshot_file, compact=True)) == fingerprint
+    assert data.dataset_version(mock_df) == data.dataset_version(mock_df.copy())
+    assert data.dataset_version(mock_df) != data.dataset_version(mock_df.iloc[1:])
+
 def test_interactive_plots_preprocess(setup):
     """Tests the interactive_plots_preprocess function.
 
@@ -79,6 +201,113 @@ def test_price_tredency_plot_given(setup):
     overlay = interactive_plots.price_tredency_plot_given(edata)
     assert isinstance(overlay, hv.element.chart.Curve)
 
+def test_price_aggregates(setup):
+    """Tests that PriceAggregates has the same tables as the hv.Dataset aggregates.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    edata = data.interactive_plots_preprocess(mock_df)
+    agg = aggregates.PriceAggregates(mock_df, ['state', 'year'], ['state'])
+    for kdim in ['state', 'year', 'manufacturer']:
+        expected = edata.aggregate(kdim, function=np.mean, spreadfn=np.std).sort().dframe().reset_index(drop=True)
+        pd.testing.assert_frame_equal(agg.by(kdim)[[kdim, 'price', 'price_std']], expected, 
+                                      check_dtype=False)
+    for kdim, value in [('state', 'CA'), ('manufacturer', 'abc')]:
+        given = edata[(edata['year']>=2000) & (edata['year']<=2021)]
+        expected = given[given[kdim] == value].aggregate('year', function=np.mean, spreadfn=np.std).sort().dframe().reset_index(drop=True)
+        pd.testing.assert_frame_equal(agg.given(kdim, value)[['year', 'price', 'price_std']], expected, 
+                                      check_dtype=False)
+    assert list(agg.given('state', 'CA')['count']) == [1, 1]
+    assert agg.given('state', 'NY').empty
+
+def test_group_stats(setup):
+    """Tests that merged GroupStats agree with pandas, and that PriceAggregates can be appended to.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    mock_df['price'] = mock_df['price'] + 1e9 # large values make the naive variance inaccurate
+    expected = mock_df.groupby('state')['price'].agg(['count', 'mean', 'std', 'min', 'max'])
+    stats = aggregates.GroupStats.from_frame(mock_df, ['state'])
+    pd.testing.assert_frame_equal(stats.to_frame(), expected, check_dtype=False)
+    for split in range(len(mock_df) + 1):
+        merged = aggregates.GroupStats.from_frame(mock_df.iloc[:split], ['state'])\
+            .merge(aggregates.GroupStats.from_frame(mock_df.iloc[split:], ['state']))
+        pd.testing.assert_frame_equal(merged.to_frame(), expected, check_dtype=False, check_index_type=False)
+
+    agg = aggregates.PriceAggregates(mock_df.iloc[:3], ['state', 'year'], ['state'])
+    agg.append(mock_df.iloc[3:])
+    expected = aggregates.PriceAggregates(mock_df, ['state', 'year'], ['state'])
+    for kdim in ['state', 'year']:
+        pd.testing.assert_frame_equal(agg.by(kdim), expected.by(kdim), check_dtype=False)
+    pd.testing.assert_frame_equal(agg.given('state', 'AL'), expected.given('state', 'AL'), check_dtype=False)
+    pd.testing.assert_frame_equal(agg.by('manufacturer'), expected.by('manufacturer'))
+
+def test_quantile_sketch():
+    """Tests that the QuantileSketch is exact on small inputs, and within its error bound once compressed and merged.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(9, 1, 150)
+    sketch = aggregates.QuantileSketch.from_values(values)
+    for q in [0, 0.1, 0.5, 0.9, 1]:
+        assert sketch.quantile(q) == np.quantile(values, q, method='inverted_cdf')
+    assert np.isnan(aggregates.QuantileSketch().quantile(0.5))
+
+    values = rng.lognormal(9, 1, 40000)
+    sketch = aggregates.QuantileSketch.from_values(values[:25000])\
+        .merge(aggregates.QuantileSketch.from_values(values[25000:]))
+    assert sketch.n == len(values) and len(sketch) < 3 * sketch.k
+    ordered = np.sort(values)
+    for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+        rank = np.searchsorted(ordered, sketch.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.015
+
+def test_price_quantiles(setup):
+    """Tests the quantiles of the PriceAggregates, and the bands of the price plots.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    agg = aggregates.PriceAggregates(mock_df.iloc[:3], ['state', 'year'], ['state'], quantiles=True)
+    agg.append(mock_df.iloc[3:])
+    # the sketches are made on the first use of a table
+    assert not agg.sketches and not agg.sketches_year
+    table = agg.by('state').set_index('state')
+    assert list(table.columns[-5:]) == list(aggregates.QUANTILES)
+    assert table.loc['CA', 'price_median'] == 7000 and table.loc['AL', 'price_p90'] == 25000
+    assert list(agg.given('state', 'AL')['price_median']) == [25000, 15000]
+    assert list(aggregates.PriceAggregates(mock_df).by('state').columns) == ['state', 'price', 'price_std', 'count']
+    # the sketches made before an append are merged with those of the new rows
+    sketched = aggregates.PriceAggregates(mock_df.iloc[:3], ['state', 'year'], ['state'], quantiles=True)
+    sketched.by('state'), sketched.given('state', 'AL')
+    sketched.append(mock_df.iloc[3:])
+    pd.testing.assert_frame_equal(sketched.by('state'), agg.by('state'))
+    pd.testing.assert_frame_equal(sketched.given('state', 'AL'), agg.given('state', 'AL'))
+
+    assert len(interactive_plots.price_trendency_figure(agg, 'state').data) == 2 + 5
+    assert len(interactive_plots.price_trendency_figure_given(agg, 'state', 'AL').data) == 1 + 5
+    overlay = interactive_plots.price_trendency_plot(agg, 'state')
+    assert len(overlay) == 2 + 3
+    assert isinstance(interactive_plots.price_tredency_plot_given(agg, 'state', 'AL'), hv.core.overlay.Overlay)
+
+def test_price_plots_aggregates(setup):
+    """Tests the price trend plots made from the precomputed aggregates.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    agg = aggregates.PriceAggregates(mock_df)
+    overlay = interactive_plots.price_trendency_plot(agg, 'year')
+    assert isinstance(overlay, hv.core.overlay.Overlay)
+    curve = interactive_plots.price_tredency_plot_given(agg)
+    assert isinstance(curve, hv.element.chart.Curve)
+    assert list(curve.dframe()['price']) == [7000, 12000]
+
 def test_count_plot(setup):
     """Tests the count_plot function.
 
@@ -89,6 +318,72 @@ def test_count_plot(setup):
     counts = interactive_plots.count_plot(mock_df)
     assert isinstance(counts, hv.element.chart.Bars)
 
+def test_price_trendency_figure(setup):
+    """Tests that price_trendency_figure shows the same data as price_trendency_plot.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    agg = aggregates.PriceAggregates(mock_df)
+    fig = interactive_plots.price_trendency_figure(agg, 'state')
+    rendered = hv.render(interactive_plots.price_trendency_plot(agg, 'state'), backend='plotly')
+    assert isinstance(fig, Figure)
+    for trace, expected in zip(fig.data, rendered['data']):
+        assert list(trace.x) == list(expected['x']) and list(trace.y) == list(expected['y'])
+    assert list(fig.data[1].error_y.array) == list(rendered['data'][1]['error_y']['array'])
+    assert fig.layout.title.text == rendered['layout']['title']['text']
+    assert fig.layout.width == rendered['layout']['width'] == 400
+
+def test_count_figure(setup):
+    """Tests that count_figure shows the same data as count_plot.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    fig = interactive_plots.count_figure(mock_df, 'state', lim=2)
+    rendered = hv.render(interactive_plots.count_plot(mock_df, 'state', lim=2), backend='plotly')
+    assert isinstance(fig, Figure)
+    assert list(fig.data[0].y) == list(rendered['data'][0]['y']) == ['other', 'AL', 'CA']
+    assert list(fig.data[0].x) == list(rendered['data'][0]['x'])
+    assert fig.layout.width == rendered['layout']['width'] == 600
+
+def test_price_trendency_figure_given(setup):
+    """Tests that price_trendency_figure_given shows the same data as price_tredency_plot_given.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    agg = aggregates.PriceAggregates(mock_df)
+    fig = interactive_plots.price_trendency_figure_given(agg, 'state', 'CA')
+    rendered = hv.render(interactive_plots.price_tredency_plot_given(agg, 'state', 'CA'), backend='plotly')
+    assert isinstance(fig, Figure)
+    assert list(fig.data[0].x) == list(rendered['data'][0]['x'])
+    assert list(fig.data[0].y) == list(rendered['data'][0]['y'])
+    assert fig.layout.width == rendered['layout']['width'] == 1000
+
+def test_frequency_index(setup):
+    """Tests that the FrequencyIndex has the same top values as the dataframe, also after an append.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    counts = aggregates.FrequencyIndex(mock_df.iloc[:4])
+    assert 'state' in counts and 'year' not in counts
+    counts.append(mock_df.iloc[4:])
+    for col in ['state', 'model', 'manufacturer']:
+        for lim in [0, 1, 2, 15]:
+            # the order of the values with the same count is not specified
+            top, expected = counts.top(col, lim), interactive_plots._top_values(mock_df, col, lim)
+            assert list(top.values) == list(expected.values)
+        assert top.sort_index().to_dict() == expected.sort_index().to_dict()
+    assert counts.top('model', 1).to_dict() == {'camry': 3, 'other': 3}
+    fig = interactive_plots.plot_pie(counts, 'state', ['state'])
+    assert list(fig.data[0].values) == list(interactive_plots.plot_pie(mock_df, 'state', ['state']).data[0].values)
+
 def test_get_count_cols(setup):
     """Tests the get_count_cols function.
 
@@ -133,6 +428,22 @@ def test_get_price_trendency_given_vals(setup):
     vals = interactive_plots.get_price_trendency_given_vals(mock_df, 'model')
     assert isinstance(vals, list)
 
+def test_distinct_values(setup):
+    """Tests that DistinctValues has the values of get_price_trendency_given_vals.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    mock_df.loc[0, 'region'] = None # the camry of PA is not a complete row
+    distinct = aggregates.DistinctValues(mock_df)
+    for col in mock_df.columns:
+        vals = interactive_plots.get_price_trendency_given_vals(distinct, col)
+        expected = interactive_plots.get_price_trendency_given_vals(mock_df, col)
+        assert sorted(vals) == sorted(expected) and vals == sorted(vals)
+    assert 'PA' not in interactive_plots.get_price_trendency_given_vals(distinct, 'state')
+    assert distinct.counts['model'].to_dict() == {'camry': 2, 'fx-150': 2, 'silverado': 1}
+
 def test_statewise_prices(setup):
     """Tests the statewise_prices function.
 
@@ -4,10 +4,12 @@ To generate a html coverage report, run
 pytest --cov-report html:cov_html
         --cov=carsreco
 '''
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 import numpy as np
 import pandas as pd
-from carsreco import prediction
+from carsreco import data, prediction
 
 
 @pytest.fixture()
@@ -62,3 +64,155 @@ def test_get_CI(setup):
     predict.model_params = predict.estimate_parameters()
     results = predict.get_CI(18000, 19000)
     assert len(results[0]) == 5
+
+def test_get_CI_batch():
+    """Tests that get_CI_batch returns the results of get_CI, query by query.
+    """
+    rng = np.random.default_rng(0)
+    rows = 2000
+    model = rng.integers(0, 40, rows)
+    mock_df = pd.DataFrame({'model': np.char.add('m', model.astype(str)),
+                            'manufacturer': np.array(['abc', 'def', 'ford', 'kia'])[model % 4],
+                            'price': np.round(rng.lognormal(9 + model / 40, 0.5, rows)),
+                            'posting_date': pd.Timestamp('2021-04-04')
+                                + pd.to_timedelta(rng.integers(0, 60 * 24 * 60, rows), unit='m')})
+    predict = prediction.IntervalPricePrediction(mock_df)
+    p1 = rng.uniform(0, 30000, 50)
+    p2 = p1 + rng.uniform(0, 20000, 50)
+    brands = [[], ['ford'], ['abc', 'kia'], ['none']] * 12 + [[], []]
+    for query_brands, batch in [(None, predict.get_CI_batch(p1, p2)),
+                                (brands, predict.get_CI_batch(p1, p2, brands))]:
+        assert len(batch) == len(p1)
+        for i, results in enumerate(batch):
+            expected = predict.get_CI(p1[i], p2[i], query_brands[i] if query_brands else [])
+            assert [result[:2] for result in results] == [result[:2] for result in expected]
+            np.testing.assert_allclose([result[2:] for result in results],
+                                       [result[2:] for result in expected], rtol=1e-12)
+    assert predict.get_CI_batch([18000], [19000], k=3)[0] == predict.get_CI(18000, 19000)[:3]
+
+def test_get_CI_pure(setup):
+    """Tests that get_CI does not modify the model, and gives the same results from concurrent threads.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    predict = prediction.IntervalPricePrediction(mock_df)
+    params = predict.model_params.copy()
+    with pytest.raises(ValueError):
+        predict.arrays.mean[0] = 0
+    queries = [(p1, p1 + width, brands) for p1 in range(0, 30000, 500) for width in [1000, 10000]
+               for brands in [[], ['abc']]]
+    expected = [predict.get_CI(*query) for query in queries]
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(5):
+            assert list(pool.map(lambda query: predict.get_CI(*query), queries)) == expected
+    pd.testing.assert_frame_equal(predict.model_params, params)
+    assert [result[1] for result in predict.get_CI(18000, 19000)] == ['camry', 'fx-150']
+
+def test_top_k():
+    """Tests that _top_k selects the values of a stable descending sort, including the ties.
+    """
+    rng = np.random.default_rng(0)
+    for size in [0, 3, 10, 50]:
+        values = rng.integers(0, 5, size).astype(float)
+        for k in [1, 3, 10]:
+            expected = np.argsort(-values, kind='stable')[:k]
+            np.testing.assert_array_equal(prediction._top_k(values, k), expected)
+
+def test_brand_indices(setup):
+    """Tests the index of the models of each manufacturer, and the brand filter of get_CI.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    predict = prediction.IntervalPricePrediction(mock_df)
+    arrays = predict.arrays
+    assert list(arrays.models[arrays.brand_indices(['ford', 'abc'])]) == ['camry', 'fx-150']
+    assert len(arrays.brand_indices(['unknown'])) == 0
+    assert len(arrays.brand_indices([])) == 3
+    assert [result[1] for result in predict.get_CI(9000, 30000, ['ford'])] == ['fx-150']
+    assert predict.get_CI(9000, 30000, ['unknown']) == []
+
+def test_catalog(setup):
+    """Tests that every model is kept by default, and the min_count and max_models filters.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    assert len(prediction.IntervalPricePrediction(mock_df).arrays.models) == 3
+    assert list(prediction.IntervalPricePrediction(mock_df, min_count=2).arrays.models) == ['camry', 'fx-150']
+    assert list(prediction.IntervalPricePrediction(mock_df, max_models=1).arrays.models) == ['camry']
+
+def test_top_models():
+    """Tests that the scan of top_models finds the models of the evaluation of every model.
+    """
+    rng = np.random.default_rng(0)
+    rows, n_models = 20000, 2000
+    model = np.minimum(rng.zipf(1.2, rows), n_models) - 1
+    mock_df = pd.DataFrame({'model': model.astype(str), 'manufacturer': (model % 7).astype(str),
+                            'price': np.round(rng.lognormal(9.5, 0.5, n_models)[model] * rng.lognormal(0, 0.2, rows)),
+                            'posting_date': pd.Timestamp('2021-04-04') + pd.to_timedelta(rng.integers(0, 86400, rows), unit='m')})
+    arrays = prediction.IntervalPricePrediction(mock_df).arrays
+    for p1, p2, brands in [(0, 100000, []), (9000, 9100, []), (20000, 20000, []), (5000, 7000, ['1', '3']),
+                           (200000, 300000, [])]:
+        indices = arrays.brand_indices(brands)
+        cond_prob = arrays.price_probability(p1, p2, indices)
+        joint_prob = cond_prob * arrays.p[indices]
+        high_prob = np.flatnonzero(joint_prob > 1e-7)
+        high_prob = high_prob[prediction._top_k(joint_prob[high_prob], 10)]
+        top, top_cond, top_joint = arrays.top_models(p1, p2, brands, 10)
+        np.testing.assert_array_equal(top, indices[high_prob])
+        np.testing.assert_array_equal(top_cond, cond_prob[high_prob])
+        np.testing.assert_array_equal(top_joint, joint_prob[high_prob])
+
+def test_year_strata(setup):
+    """Tests that the parameters of a range of years are those estimated from the cars of these years.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+    """
+    mock_df = setup
+    with pytest.raises(ValueError):
+        prediction.IntervalPricePrediction(mock_df).get_CI(18000, 19000, years=(2000, 2010))
+    mock_df['year'] = [2000, 2005, 2010, 2015, 2020, 2021]
+    mock_df.loc[len(mock_df)] = ['camry', 'abc', 21000, pd.Timestamp('2021-06-05 10:00:00'), 2015]
+    predict = prediction.IntervalPricePrediction(mock_df)
+    # only the (model, year) cells with cars are kept
+    assert len(predict.strata.year) == len(mock_df[['model', 'year']].drop_duplicates()) == 6
+    for years in [(2000, 2021), (2001, 2020), (2010, 2010), (2016, 2019)]:
+        arrays = predict.year_arrays(years)
+        counts = mock_df[mock_df['year'].between(*years)].groupby('model')['price'].count()
+        np.testing.assert_array_equal(arrays.p * counts.sum(), counts.reindex(arrays.models).fillna(0))
+    arrays = predict.year_arrays((2001, 2020))
+    assert arrays.mean[list(arrays.models).index('camry')] == np.mean([20000, 21000, 25000])
+    np.testing.assert_allclose(arrays.std[list(arrays.models).index('camry')],
+                               np.std([20000, 21000, 25000], ddof=1) / np.sqrt(3))
+    minutes = (pd.Timestamp('2021-06-05 10:00:00') - pd.Timestamp('2021-05-04 09:30:00')) // pd.Timedelta(minutes=1)
+    assert arrays.lambdas[list(arrays.models).index('camry')] == 3 / minutes
+    assert predict.get_CI(0, 100000, years=(1990, 2021)) == predict.get_CI(0, 100000)
+    assert [result[1] for result in predict.get_CI(15000, 30000, years=(2001, 2020))] == ['camry']
+    assert predict.get_CI(0, 100000, years=(1990, 1999)) == []
+
+def test_save_load(setup, tmp_path):
+    """Tests that a saved model gives the same predictions once loaded, and that it is not loaded for other data.
+
+    Args:
+        setup (pd.DataFrame): The test dataframe.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = setup
+    mock_df['year'] = [2000, 2005, 2010, 2015, 2020, 2021]
+    mock_df['posting_date'] = mock_df['posting_date'].dt.tz_localize('US/Pacific')
+    predict = prediction.IntervalPricePrediction(mock_df)
+    predict.save(tmp_path / "model.npz")
+    loaded = prediction.IntervalPricePrediction.load(tmp_path / "model.npz", fingerprint=predict.fingerprint)
+    assert loaded.df is None
+    pd.testing.assert_frame_equal(loaded.model_params, predict.model_params, check_index_type=False)
+    assert list(loaded.get_manufacturer_names()) == list(predict.get_manufacturer_names())
+    for p1, p2, years in [(0, 100000, None), (15000, 30000, (2001, 2020)), (5000, 13000, (2000, 2010))]:
+        assert loaded.get_CI(p1, p2, years=years) == predict.get_CI(p1, p2, years=years)
+    with pytest.raises(data.StaleSnapshotError):
+        prediction.IntervalPricePrediction.load(tmp_path / "model.npz", fingerprint="other data")
@@ -0,0 +1,159 @@
+'''
+This file tests the functions in scripts/preprocessing.py
+To generate a html coverage report, run
+pytest --cov-report html:cov_html
+        --cov=carsreco
+'''
+import json
+
+import pytest
+import numpy as np
+import pandas as pd
+from scripts import preprocessing
+from carsreco import data
+
+
+@pytest.fixture()
+def setup(tmp_path):
+    """Writes a mock input dataset, and returns its path.
+    """
+    mock_df =  pd.DataFrame(columns=['id', 'url', 'region_url', 'year', 'state', 'region', 'model', 
+                                     'manufacturer', 'condition', 'size', 'odometer', 'price', 'posting_date'],
+                            data =[[1, 'u1', 'r1', 2000, 'pa','greensboro', 'camry', 'abc', 'good', 'compact', 
+                                    100000, 10000, '2021-05-04T17:30:00-0700'],
+                                   [2, 'u2', 'r2', 2005, 'ca','hudson valley', 'silverado', 'def', 'fair', 'compact', 
+                                    50000, 0, '2021-04-04T09:30:00-0700'],
+                                   [3, 'u3', 'r3', 2010, 'ca','el paso', 'fx-150', 'ford', 'good', 'mid-size', 
+                                    20000, 12000, '2021-06-04T17:30:00-0700'],
+                                   [4, 'u4', 'r4', 2015, 'wa','bellingham', 'camry', 'abc', 'good', 'compact', 
+                                    30000, 500000, '2021-06-04T16:30:00-0700'],
+                                   [5, 'u5', 'r5', 2020, 'al','auburn', 'camry', 'abc', 'new', 'full-size', 
+                                    10, 25000, '2021-05-04T09:30:00-0500'],
+                                   [6, 'u6', 'r6', np.nan, 'al','birmingham', 'fx-150', 'ford', 'fair', 'compact', 
+                                    200000, 15000, '2021-05-04T16:00:00-0500']])
+    input_file = tmp_path / "input.csv"
+    mock_df.to_csv(input_file, index=False)
+    return input_file
+
+def test_preprocess(setup, tmp_path):
+    """Tests the preprocess function.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+    """
+    output_file = tmp_path / "output.csv"
+    preprocessing.preprocess(setup, output_file)
+    df = pd.read_csv(output_file, index_col=0)
+    assert list(df.index) == [1, 3, 5, 6]
+    assert set(df['state']) == {'PA', 'CA', 'AL'}
+    assert not {'url', 'region_url', 'condition', 'size'} & set(df.columns)
+    assert list(df['price_range']) == ['$5000-15000', '$5000-15000', '$15000-25000', '$5000-15000']
+
+@pytest.mark.parametrize("chunksize", [1, 2, 4, 100])
+def test_preprocess_chunked(setup, tmp_path, chunksize):
+    """Tests that the chunked preprocessing outputs exactly the same file.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+        chunksize (int): The number of rows per chunk.
+    """
+    output_file = tmp_path / "output.csv"
+    chunked_output_file = tmp_path / "chunked_output.csv"
+    preprocessing.preprocess(setup, output_file)
+    preprocessing.preprocess(setup, chunked_output_file, chunksize=chunksize)
+    assert output_file.read_bytes() == chunked_output_file.read_bytes()
+
+@pytest.mark.parametrize("jobs,chunksize", [(2, None), (3, None), (2, 2)])
+def test_preprocess_parallel(setup, tmp_path, jobs, chunksize):
+    """Tests that the parallel preprocessing outputs exactly the same file.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+        jobs (int): The number of processes.
+        chunksize (int): The number of rows per chunk.
+    """
+    output_file = tmp_path / "output.csv"
+    parallel_output_file = tmp_path / "parallel_output.csv"
+    preprocessing.preprocess(setup, output_file)
+    preprocessing.preprocess(setup, parallel_output_file, chunksize=chunksize, jobs=jobs)
+    assert output_file.read_bytes() == parallel_output_file.read_bytes()
+
+def test_preprocess_incremental(setup, tmp_path):
+    """Tests that appending rows incrementally gives the same output as a full rebuild.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+    """
+    mock_df = pd.read_csv(setup, index_col=0)
+    mock_df = mock_df.iloc[pd.to_datetime(mock_df['posting_date'], utc=True).argsort()]
+    input_file = tmp_path / "sorted_input.csv"
+    output_file, full_output_file = tmp_path / "output.csv", tmp_path / "full_output.csv"
+    snapshot_file = tmp_path / "output.npz"
+    mock_df.iloc[:4].to_csv(input_file)
+    assert preprocessing.preprocess_incremental(input_file, output_file, snapshot_file=snapshot_file)
+    assert not preprocessing.preprocess_incremental(input_file, output_file, snapshot_file=snapshot_file)
+    with open(input_file, "a") as f:
+        mock_df.iloc[4:].to_csv(f, header=False)
+    assert not preprocessing.preprocess_incremental(input_file, output_file, snapshot_file=snapshot_file)
+    preprocessing.preprocess(input_file, full_output_file)
+    assert output_file.read_bytes() == full_output_file.read_bytes()
+    pd.testing.assert_frame_equal(data.read_snapshot(snapshot_file), data.read_csv_data(full_output_file))
+
+def test_preprocess_incremental_rebuild(setup, tmp_path):
+    """Tests that the incremental preprocessing rebuilds everything when the drop list changes.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+    """
+    output_file = tmp_path / "output.csv"
+    assert preprocessing.preprocess_incremental(setup, output_file)
+    assert not preprocessing.preprocess_incremental(setup, output_file)
+    assert preprocessing.preprocess_incremental(setup, output_file, drops=['size'])
+    assert 'condition' in pd.read_csv(output_file).columns
+
+@pytest.mark.parametrize("chunksize", [1, 2, 100])
+def test_preprocess_incremental_chunked(setup, tmp_path, chunksize):
+    """Tests that a full rebuild without snapshot, read back by chunks, gives the same state.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+        chunksize (int): The number of rows per chunk.
+    """
+    output_file, chunked_output_file = tmp_path / "output.csv", tmp_path / "chunked_output.csv"
+    assert preprocessing.preprocess_incremental(setup, output_file, snapshot_file=tmp_path / "output.npz")
+    assert preprocessing.preprocess_incremental(setup, chunked_output_file, chunksize=chunksize)
+    state = json.loads(output_file.with_suffix(".state.json").read_text())
+    chunked_state = json.loads(chunked_output_file.with_suffix(".state.json").read_text())
+    assert chunked_state["output_fingerprint"] is None
+    assert {**chunked_state, "output_fingerprint": state["output_fingerprint"]} == state
+
+@pytest.mark.parametrize("late", [True, False])
+def test_preprocess_incremental_late_or_rewritten(setup, tmp_path, late):
+    """Tests that the incremental preprocessing rebuilds everything when an appended row is
+    before the watermark, or when the input was rewritten.
+
+    Args:
+        setup (Path): The test input csv.
+        tmp_path: pytest temporary directory.
+        late: whether a late row is appended (else the input is rewritten).
+    """
+    mock_df = pd.read_csv(setup, index_col=0)
+    mock_df = mock_df.iloc[pd.to_datetime(mock_df['posting_date'], utc=True).argsort()]
+    input_file = tmp_path / "sorted_input.csv"
+    output_file, full_output_file = tmp_path / "output.csv", tmp_path / "full_output.csv"
+    mock_df.iloc[2:].to_csv(input_file)
+    assert preprocessing.preprocess_incremental(input_file, output_file)
+    if late:
+        with open(input_file, "a") as f:
+            mock_df.iloc[1:2].to_csv(f, header=False)
+    else:
+        mock_df.iloc[3:].to_csv(input_file)
+    assert preprocessing.preprocess_incremental(input_file, output_file)
+    preprocessing.preprocess(input_file, full_output_file)
+    assert output_file.read_bytes() == full_output_file.read_bytes()
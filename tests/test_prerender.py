@@ -0,0 +1,70 @@
+'''
+This file tests the functions in scripts/prerender.py and carsreco/figures.py
+To generate a html coverage report, run
+pytest --cov-report html:cov_html
+        --cov=carsreco
+'''
+import json
+
+import pytest
+import pandas as pd
+from scripts import prerender
+from carsreco import data, figures
+
+
+@pytest.fixture()
+def setup(tmp_path):
+    """Writes a mock preprocessed dataset, and returns its path.
+    """
+    mock_df =  pd.DataFrame(columns=['year', 'state', 'region', 'model','manufacturer','price',
+                                     'posting_date', 'posting_year','posting_month'],
+                            data =[[2000, 'PA','greensboro', 'camry', 'abc',10000, '2021-05-04 17:30:00', 2021, 5],
+                                   [2005, 'CA','hudson valley', 'silverado', 'def',7000, '2021-04-04 09:30:00', 2021, 4],
+                                   [2010, 'CA','el paso', 'fx-150', 'ford', 12000, '2021-06-04 17:30:00', 2021, 5],
+                                   [2015, 'WA','bellingham', 'camry', 'abc', 20000, '2021-06-04 16:30:00', 2021, 6],
+                                   [2020, 'AL','auburn', 'camry', 'abc', 25000, '2021-05-04 09:30:00', 2021, 5],
+                                   [2021, 'AL','birmingham', 'fx-150', 'ford', 15000, '2021-05-04 16:00:00', 2021, 5]])
+    csv_file = tmp_path / "preprocessed.csv"
+    mock_df.to_csv(csv_file)
+    return csv_file
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_prerender(setup, tmp_path, jobs):
+    """Tests that prerender writes every figure, and that the dashboard figures are read from it.
+
+    Args:
+        setup (Path): The test preprocessed csv.
+        tmp_path: pytest temporary directory.
+        jobs (int): The number of processes.
+    """
+    output = tmp_path / "figures"
+    n = prerender.prerender(output, setup, None, jobs=jobs)
+    manifest = json.loads((output / "manifest.json").read_text())
+    assert n == len(manifest["figures"]) == 1 + 3 + 2 * 4 + 4 + 3
+    assert manifest["dataset_version"] == data.file_fingerprint(setup)
+
+    fig_data = figures.FigureData(data.get_data(setup, None, compact=True))
+    # the quantiles are sketched when a figure first needs them
+    assert not fig_data.aggregates.sketches
+    figure = figures.Figures(fig_data, figures.FigureStore.open(output, fig_data.version))
+    for key in [("trend", "state"), ("pie", "model"), ("given", "state", "CA"), ("statewise",)]:
+        assert figure(*key) == json.loads(figures.build_figure(fig_data, key).to_json())
+    figure("given", "state", "NY")
+    assert (figure.hits, figure.misses) == (4, 1)
+    # the figures built by the dashboard have the quantiles too
+    assert len(figures.build_figure(fig_data, ("trend", "state")).data) == 2 + 5
+
+def test_stale_figures(setup, tmp_path):
+    """Tests that the figures prerendered from other data, or from the other dataframe, are not used.
+
+    Args:
+        setup (Path): The test preprocessed csv.
+        tmp_path: pytest temporary directory.
+    """
+    output = tmp_path / "figures"
+    prerender.prerender(output, setup, None)
+    assert figures.FigureStore.open(output, "other data") is None
+    assert figures.FigureStore.open(tmp_path / "nothing", "other data") is None
+    version = data.file_fingerprint(setup)
+    assert figures.FigureStore.open(output, version) is not None
+    assert figures.FigureStore.open(output, version, compact=False) is None
@@ -34,3 +34,47 @@ def test_wikipediapage_class_methods(requests_mock):
     # when there is no image, return None and don't display thumbnail
     assert page.get_thumbnail() is None
     assert page.get_quicktext() is None
+
+def test_pooled_session(requests_mock):
+    """ test the requests share a session, with the configured pool size and timeouts
+    """
+    requests_mock.get('http://test.com', json={})
+    wiki.configure_session(pool_size=3, timeout=(1, 2))
+    try:
+        session = wiki.get_session()
+        wiki.make_wikimedia_request(api_url='http://test.com')
+        wiki.make_wikimedia_request(api_url='http://test.com')
+        assert wiki.get_session() is session
+        assert session.get_adapter('https://en.wikipedia.org')._pool_maxsize == 3
+        assert requests_mock.call_count == 2
+        assert requests_mock.last_request.timeout == (1, 2)
+    finally:
+        wiki.configure_session()
+    assert wiki.get_session() is not session
+
+def test_batched_pages(requests_mock):
+    """ test the thumbnails and extracts of many pages are requested together
+    """
+    def answer(request, context):
+        pageids = request.qs['pageids'][0].split('|')
+        if 'extracts' in request.qs['prop']:
+            # the api gives the extracts of 20 pages, then continues with the others
+            assert len(pageids) <= wiki.MAX_EXTRACTS
+            offset = int(request.qs.get('excontinue', ['0'])[0])
+            pages = {pageid: ({"extract": f"text {pageid}"} if offset <= i < offset + 15 else {})
+                     for i, pageid in enumerate(pageids)}
+            more = {"continue": {"excontinue": str(offset + 15)}} if offset + 15 < len(pageids) else {}
+            return {"query": {"pages": pages}, **more}
+        assert len(pageids) <= wiki.MAX_PAGES
+        return {"query": {"pages": {pageid: {"original": {"source": pageid}} if int(pageid) % 2 else {}
+                                    for pageid in pageids}}}
+    requests_mock.get('https://en.wikipedia.org/w/api.php', json=answer)
+    pages = [wiki.WikipediaPage(ns=0, title=str(i), pageid=i, size=1, wordcount=1, snippet='', timestamp='06/06/2021')
+             for i in range(60)]
+    thumbnails = wiki.WikipediaPage.get_thumbnails(pages + [None])
+    assert requests_mock.call_count == 2
+    assert thumbnails == [{"source": str(i)} if i % 2 else None for i in range(60)] + [None]
+    assert wiki.WikipediaPage.get_quicktexts(pages) == [f"text {i}" for i in range(60)]
+    assert requests_mock.call_count == 2 + 3 * 2
+    assert wiki.WikipediaPage.get_thumbnails([]) == []
+    assert requests_mock.call_count == 8